@@ -0,0 +1,357 @@
+"""
+Benchmarks for check_structural_metadata.py.
+
+Generates synthetic structural metadata in a temporary directory and times the Checker
+against it. The output of the Checker itself is discarded.
+"""
+import os
+import sys
+import csv
+import json
+import time
+import platform
+import tempfile
+import subprocess
+import tracemalloc
+from io import StringIO
+from contextlib import redirect_stdout
+from argparse import ArgumentParser
+
+import generate_metadata
+from generate_metadata import CLASSIFICATION_HEADER, CATEGORY_HEADER, MAPPING_HEADER, write_csv
+from check_structural_metadata import Checker, CHECKS
+
+
+def generate_large_classification(output_dir, num_codes, range_width):
+    """
+    Generate a parent classification with num_codes codes and a derived classification.
+
+    The derived classification maps the parent codes using Source_Value ranges that are
+    range_width codes wide, so that parse_range expands to num_codes source values.
+    """
+    write_csv(os.path.join(output_dir, 'Classification.csv'), CLASSIFICATION_HEADER,
+              [['Parent', ''], ['Child', 'Parent']])
+
+    num_targets = (num_codes + range_width - 1) // range_width
+    categories = [['Parent', str(code), f'Int{code}', f'Ext{code}', f'Cy{code}']
+                  for code in range(1, num_codes + 1)]
+    categories.extend([['Child', str(code), f'Int{code}', f'Ext{code}', f'Cy{code}']
+                       for code in range(1, num_targets + 1)])
+    write_csv(os.path.join(output_dir, 'Category.csv'), CATEGORY_HEADER, categories)
+
+    mappings = [['Parent', 'Parent', str(code), str(code), f'Int{code}', f'Ext{code}',
+                 f'Cy{code}'] for code in range(1, num_codes + 1)]
+    for target in range(1, num_targets + 1):
+        first = (target - 1) * range_width + 1
+        last = min(target * range_width, num_codes)
+        mappings.append(['Child', 'Child', f'{first}>{last}', str(target), f'Int{target}',
+                         f'Ext{target}', f'Cy{target}'])
+    write_csv(os.path.join(output_dir, 'Category_Mapping.csv'), MAPPING_HEADER, mappings)
+
+
+def legacy_load(input_dir):
+    """Load the CSV files as lists of csv.DictReader dicts as done by v1.0.0."""
+    rows = dict()
+    for name in ['Classification.csv', 'Category.csv', 'Category_Mapping.csv']:
+        with open(os.path.join(input_dir, name), newline='') as infile:
+            rows[name] = list(csv.DictReader(infile, delimiter=','))
+    return rows
+
+
+def code_set_bytes(checker):
+    """
+    Return the size in bytes of the CodeSets of checker, and of the same codes held as Python
+    sets of their ids. The codes themselves are held once by the CodeDictionary either way.
+    """
+    code_sets = list(checker.category_codes.values()) + [
+        summary.target_values for summary in checker.category_mappings.values()]
+    bitset_bytes = sum(sys.getsizeof(code_set.bits) for code_set in code_sets)
+    set_bytes = sum(sys.getsizeof(set(code_set.ids())) for code_set in code_sets)
+    return bitset_bytes, set_bytes
+
+
+def memory_benchmark(num_classifications, num_categories):
+    """
+    Compare the memory used to load a generated dataset with the v1.0.0 loader, and the size
+    of the CodeSets of a dataset in which each classification has its own codes.
+    """
+    with tempfile.TemporaryDirectory() as input_dir:
+        generate_metadata.generate(input_dir, num_classifications, depth=2,
+                                   num_categories=num_categories,
+                                   group_size=max(num_categories // 10, 1))
+        print(f'Synthetic dataset with {num_classifications} base classifications of '
+              f'{num_categories} categories')
+        for name, func, args in [('Checker.__init__', Checker, (input_dir, False, 10)),
+                                 ('legacy DictReader rows', legacy_load, (input_dir,))]:
+            result, elapsed, current, peak = profiled(func, *args)
+            del result
+            print(f'{name + ":":32} {elapsed:10.3f}s {current / 2**20:10.1f}MiB retained '
+                  f'{peak / 2**20:10.1f}MiB peak')
+
+    with tempfile.TemporaryDirectory() as input_dir:
+        generate_metadata.generate(input_dir, num_classifications, depth=2,
+                                   num_categories=num_categories, unique_codes=True)
+        with redirect_stdout(StringIO()):
+            checker = Checker(input_dir, False, 10)
+        bitset_bytes, set_bytes = code_set_bytes(checker)
+        print(f'Synthetic dataset with {num_classifications} base classifications of '
+              f'{num_categories} codes unique to each classification')
+        print(f'{"CodeSet bitsets:":32} {bitset_bytes / 2**20:10.1f}MiB')
+        print(f'{"sets of code ids:":32} {set_bytes / 2**20:10.1f}MiB')
+
+
+def legacy_dupes(checker):
+    """Duplicate detection as implemented by v1.0.0 using list.count."""
+    dupes = dict()
+    for classification_mnemonic, summary in checker.category_mappings.items():
+        source_values = list()
+        for source_value in summary.source_values:
+            source_values.extend(checker.parse_range(source_value))
+        dupes[classification_mnemonic] = set(
+            [sv for sv in source_values if source_values.count(sv) > 1])
+    return dupes
+
+
+def timed(func, *args):
+    """Call func with args, discarding anything printed, and return the elapsed time."""
+    start = time.perf_counter()
+    with redirect_stdout(StringIO()):
+        func(*args)
+    return time.perf_counter() - start
+
+
+def profiled(func, *args):
+    """
+    Call func with args, discarding anything printed, and return the result along with the
+    elapsed time, the memory allocated during the call that is still allocated, such as for
+    the result, and the peak memory allocated during the call.
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    with redirect_stdout(StringIO()):
+        result = func(*args)
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, current, peak
+
+
+def git_commit():
+    """Return the current git commit of the source, or None if it cannot be determined."""
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+            cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def suite_benchmark(parameters, ignore_leading_zeros, repeat):
+    """
+    Time and memory profile Checker.__init__ and each check on a generated dataset.
+
+    Times are the fastest of repeat runs, each using a newly loaded Checker. Peak memory is
+    measured with tracemalloc in a separate run, since tracing slows down the code.
+    Returns a dict of the results which can be saved as JSON.
+    """
+    phases = ['Checker.__init__'] + [f'check_{check.name}' for check in CHECKS]
+    seconds = {phase: list() for phase in phases}
+    peak_bytes = dict()
+    with tempfile.TemporaryDirectory() as input_dir:
+        dataset = generate_metadata.generate(input_dir, **parameters)
+        for _ in range(repeat):
+            start = time.perf_counter()
+            with redirect_stdout(StringIO()):
+                checker = Checker(input_dir, ignore_leading_zeros, 10)
+            seconds['Checker.__init__'].append(time.perf_counter() - start)
+            for check in CHECKS:
+                seconds[f'check_{check.name}'].append(timed(checker.run_checks, [check.name]))
+
+        checker, _, _, peak_bytes['Checker.__init__'] = profiled(
+            Checker, input_dir, ignore_leading_zeros, 10)
+        for check in CHECKS:
+            _, _, _, peak_bytes[f'check_{check.name}'] = profiled(checker.run_checks,
+                                                                  [check.name])
+
+    dataset['errors'] = len(dataset['errors'])
+    return {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'parameters': dict(parameters, ignore_leading_zeros=ignore_leading_zeros),
+        'dataset': dataset,
+        'phases': {phase: {'seconds': min(seconds[phase]), 'peak_bytes': peak_bytes[phase]}
+                   for phase in phases},
+    }
+
+
+def compare_results(baseline, results, threshold):
+    """
+    Print the results of each phase alongside those of baseline.
+
+    Returns True if any phase is slower than the baseline by more than threshold.
+    """
+    regression = False
+    print(f'{"phase":32} {"baseline":>10} {"current":>10} {"ratio":>8}')
+    for phase, result in results['phases'].items():
+        if phase not in baseline['phases']:
+            print(f'{phase:32} {"-":>10} {result["seconds"]:9.3f}s')
+            continue
+        baseline_seconds = baseline['phases'][phase]['seconds']
+        ratio = result['seconds'] / baseline_seconds if baseline_seconds else 1.0
+        flag = ''
+        # Ignore differences of less than a millisecond, which are mostly noise.
+        if ratio > 1 + threshold and result['seconds'] - baseline_seconds > 0.001:
+            flag = ' REGRESSION'
+            regression = True
+        print(f'{phase:32} {baseline_seconds:9.3f}s {result["seconds"]:9.3f}s '
+              f'{ratio:7.2f}x{flag}')
+    return regression
+
+
+def print_results(results):
+    """Print the results of suite_benchmark as a table."""
+    dataset = results['dataset']
+    print(f'Synthetic dataset with {dataset["classifications"]} classifications, '
+          f'{dataset["categories"]} categories and {dataset["category_mappings"]} category '
+          'mappings')
+    for phase, result in results['phases'].items():
+        print(f'{phase + ":":32} {result["seconds"]:10.3f}s '
+              f'{result["peak_bytes"] / 2**20:10.1f}MiB peak')
+
+
+def main():
+    """Run benchmarks."""
+    parser = ArgumentParser(description='Benchmark structural metadata checks')
+
+    parser.add_argument('-n', '--num-codes',
+                        type=int,
+                        default=100000,
+                        help='Number of codes in the synthetic parent classification')
+
+    parser.add_argument('-w', '--range-width',
+                        type=int,
+                        default=100,
+                        help='Number of codes in each Source_Value range of the derived '
+                             'classification')
+
+    parser.add_argument('--legacy',
+                        action='store_true',
+                        help='Also time the quadratic duplicate detection used by v1.0.0. '
+                             'This can take a very long time for large values of --num-codes')
+
+    parser.add_argument('--memory',
+                        action='store_true',
+                        help='Measure the memory used by Checker.__init__ with tracemalloc '
+                             'instead of timing check_source_values')
+
+    parser.add_argument('-c', '--num-classifications',
+                        type=int,
+                        default=500,
+                        help='Number of base classifications generated for --memory and '
+                             '--suite')
+
+    parser.add_argument('-k', '--num-categories',
+                        type=int,
+                        default=200,
+                        help='Number of categories in each base classification generated for '
+                             '--memory and --suite')
+
+    parser.add_argument('--suite',
+                        action='store_true',
+                        help='Time and memory profile Checker.__init__ and each check on a '
+                             'dataset created by generate_metadata.py')
+
+    parser.add_argument('-d', '--depth',
+                        type=int,
+                        default=3,
+                        help='Number of levels in the hierarchy of each classification generated '
+                             'for --suite')
+
+    parser.add_argument('--range-fraction',
+                        type=float,
+                        default=0.5,
+                        help='Proportion of range Source_Values generated for --suite')
+
+    parser.add_argument('--zero-padded-fraction',
+                        type=float,
+                        default=0.0,
+                        help='Proportion of classifications with leading zeros generated for '
+                             '--suite')
+
+    parser.add_argument('--error-fraction',
+                        type=float,
+                        default=0.1,
+                        help='Proportion of classifications with errors generated for --suite')
+
+    parser.add_argument('--zeros',
+                        action='store_true',
+                        help='Ignore leading zeros when running --suite')
+
+    parser.add_argument('-r', '--repeat',
+                        type=int,
+                        default=3,
+                        help='Number of timed runs for --suite, of which the fastest is reported')
+
+    parser.add_argument('-o', '--output',
+                        type=str,
+                        help='Save the results of --suite as JSON to this file')
+
+    parser.add_argument('--compare',
+                        type=str,
+                        help='Compare the results of --suite with JSON results saved by a '
+                             'previous run')
+
+    parser.add_argument('--threshold',
+                        type=float,
+                        default=0.2,
+                        help='Fractional slowdown of a phase reported as a regression by '
+                             '--compare')
+
+    args = parser.parse_args()
+
+    if args.suite:
+        parameters = {
+            'num_classifications': args.num_classifications,
+            'depth': args.depth,
+            'num_categories': args.num_categories,
+            'range_fraction': args.range_fraction,
+            'zero_padded_fraction': args.zero_padded_fraction,
+            'error_fraction': args.error_fraction,
+        }
+        results = suite_benchmark(parameters, args.zeros, args.repeat)
+        print_results(results)
+        if args.output:
+            with open(args.output, 'w') as outfile:
+                json.dump(results, outfile, indent=2)
+        if args.compare:
+            with open(args.compare) as infile:
+                baseline = json.load(infile)
+            if baseline['parameters'] != results['parameters']:
+                print('WARNING: baseline was run with different parameters')
+            if compare_results(baseline, results, args.threshold):
+                return 1
+        return 0
+
+    if args.memory:
+        memory_benchmark(args.num_classifications, args.num_categories)
+        return 0
+
+    with tempfile.TemporaryDirectory() as input_dir:
+        generate_large_classification(input_dir, args.num_codes, args.range_width)
+        with redirect_stdout(StringIO()):
+            checker = Checker(input_dir, False, 10)
+
+        print(f'Synthetic classification with {args.num_codes} codes, '
+              f'Source_Value ranges of width {args.range_width}')
+        elapsed = timed(checker.check_source_values)
+        print(f'check_source_values:              {elapsed:10.3f}s')
+        if args.legacy:
+            legacy_elapsed = timed(legacy_dupes, checker)
+            print(f'legacy duplicate detection:       {legacy_elapsed:10.3f}s')
+            print(f'speedup:                          {legacy_elapsed / elapsed:10.1f}x')
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
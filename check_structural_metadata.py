@@ -4,340 +4,2526 @@ Basic consistency checks on structural metadata CSV files.
 This script performs a limited set of checks. It is intended to aid in the preparation of
 consistent metadata but does not constitute a full suite of QA tests.
 """
+import io
 import os
+import re
 import sys
 import csv
+import bz2
+import copy
+import gzip
+import json
+import lzma
+import math
+import mmap
+import time
+import zlib
+import heapq
+import hmac
+import queue
+import pickle
+import zipfile
+import cProfile
+import hashlib
+import locale
+import threading
+import itertools
+from collections import Counter, deque, namedtuple
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from operator import itemgetter
 from pathlib import Path
-from argparse import ArgumentParser
+from argparse import ArgumentParser, ArgumentTypeError
 from datetime import datetime
 
+try:
+    import resource
+except ImportError:
+    # The resource module is not available on Windows.
+    resource = None
+
+try:
+    import pyarrow
+    import pyarrow.csv
+except ImportError:
+    # pyarrow is optional and only used by the pyarrow reader.
+    pyarrow = None
+
 
 VERSION = 'v1.0.0'
 
+CATEGORY_LABEL_COLUMNS = ('External_Category_Label_English', 'Internal_Category_Label_English',
+                          'External_Category_Label_Welsh')
+
+NUMERIC_CODE = re.compile('[0-9]+')
+NUMBER = re.compile(r'\s*[+-]?\d+(?:_\d+)*\s*')
+
+# Records holding the columns of each CSV file that are used by Checker. Values are interned
+# so that values repeated on many rows, such as mnemonics and labels, are stored once.
+Classification = namedtuple('Classification', ['Classification_Mnemonic',
+                                               'Parent_Classification_Mnemonic'])
+Category = namedtuple('Category', ['Classification_Mnemonic', 'Category_Code',
+                                   'Internal_Category_Label_English',
+                                   'External_Category_Label_English',
+                                   'External_Category_Label_Welsh'])
+CategoryMapping = namedtuple('CategoryMapping', ['Classification_Mnemonic', 'Codebook_Mnemonic',
+                                                 'Source_Value', 'Target_Value',
+                                                 'Internal_Mapping_Label_English',
+                                                 'External_Mapping_Label_English',
+                                                 'External_Mapping_Label_Welsh'])
+
+# The input files in the order that they are read. Each file depends on those before it.
+INPUT_FILES = ['Classification.csv', 'Category.csv', 'Category_Mapping.csv']
+
+# Name of the file in the input directory used to cache results when --cache is specified,
+# and the version of the format of the cached results.
+CACHE_FILENAME = '.check_structural_metadata.cache'
+CACHE_FORMAT = 3
+
+# Name of the file in the input directory used to save the parsed input files when
+# --snapshot is specified, and the version of its format.
+SNAPSHOT_FILENAME = '.check_structural_metadata.snapshot'
+SNAPSHOT_FORMAT = 2
+
+# File holding the key that authenticates saved state before it is unpickled, so that a
+# crafted file in an input directory cannot run code. It is created on first use.
+STATE_KEY_FILENAME = os.path.join(os.path.expanduser('~'), '.check_structural_metadata.key')
+STATE_KEY_SIZE = 32
+STATE_KEY_ATTEMPTS = 100
+
+# Functions used to open compressed input files with each suffix as binary streams.
+COMPRESSION_OPENERS = {
+    '.gz': gzip.open,
+    '.bz2': bz2.open,
+    '.xz': lzma.open,
+}
+
+# Size of the blocks decompressed ahead of the CSV parser, and the number of blocks buffered.
+PREFETCH_BLOCK_SIZE = 1 << 20
+PREFETCH_BLOCKS = 4
+
+# Start of the message of findings for classifications in a cycle of parents.
+CYCLE_MESSAGE = 'Parent_Classification_Mnemonic values form a cycle: '
+
+# Maximum number of distinct raw codes for which the normalized code is cached.
+NORMALIZE_CACHE_SIZE = 1 << 20
+
 
 def isnum(value):
-    """Check if value represents a number."""
+    """Check if value represents a number i.e. whether int(value) would succeed."""
+    return NUMBER.fullmatch(value) is not None
+
+
+def read_records(filename, record_type):
+    """
+    Read the rows of a CSV file as record_type records.
+
+    Each column of record_type is read from the column in the file with the same name. As with
+    csv.DictReader, blank rows are skipped and fields missing from short rows are None.
+    """
+    with open(filename, newline='') as infile:
+        yield from read_stream_records(infile, record_type)
+
+
+def read_stream_records(infile, record_type):
+    """Read the rows of CSV text from an open file as record_type records, as read_records."""
+    reader = csv.reader(infile, delimiter=',')
+    positions = {column: idx for idx, column in enumerate(next(reader, []))}
+    indexes = [positions[column] for column in record_type._fields]
+    min_length = max(indexes) + 1
+    fields = itemgetter(*indexes)
+    make = record_type._make
+    intern = sys.intern
+    for row in reader:
+        if not row:
+            continue
+        if len(row) >= min_length:
+            yield make(map(intern, fields(row)))
+        else:
+            yield record_type._make([intern(row[idx]) if idx < len(row) else None
+                                     for idx in indexes])
+
+
+def read_records_pyarrow(filename, record_type):
+    """
+    Read the rows of a CSV file as record_type records using pyarrow.
+
+    Blocks of rows are parsed by pyarrow and then converted to the same records as
+    read_records. Files that pyarrow cannot read exactly as read_records would, such as files
+    with rows of differing lengths or duplicate column names, are read using read_records
+    from the first row that pyarrow could not read.
+    """
+    with open(filename, newline='') as infile:
+        header = next(csv.reader(infile, delimiter=','), [])
+    if len(set(header)) != len(header) or not set(record_type._fields) <= set(header):
+        yield from read_records(filename, record_type)
+        return
+
+    num_rows = 0
     try:
-        int(value)
-    except ValueError:
+        reader = pyarrow.csv.open_csv(
+            filename,
+            parse_options=pyarrow.csv.ParseOptions(newlines_in_values=True),
+            convert_options=pyarrow.csv.ConvertOptions(
+                include_columns=list(record_type._fields),
+                column_types={column: pyarrow.string() for column in record_type._fields},
+                strings_can_be_null=False))
+        make = record_type._make
+        intern = sys.intern
+        for batch in reader:
+            columns = [map(intern, batch.column(idx).to_pylist())
+                       for idx in range(batch.num_columns)]
+            yield from map(make, zip(*columns))
+            num_rows += batch.num_rows
+    except pyarrow.ArrowInvalid:
+        yield from itertools.islice(read_records(filename, record_type), num_rows, None)
+
+
+def get_reader(name):
+    """
+    Return the function used to read CSV files for the reader name.
+
+    auto uses pyarrow if it is installed and the preferred encoding is UTF-8, which is the
+    encoding that pyarrow reads.
+    """
+    if name == 'auto':
+        utf8 = locale.getpreferredencoding(False).lower().replace('-', '') == 'utf8'
+        name = 'pyarrow' if pyarrow is not None and utf8 else 'csv'
+    if name == 'pyarrow' and pyarrow is None:
+        raise ValueError('pyarrow reader requested but pyarrow is not installed')
+    if name not in READERS:
+        raise ValueError(f'unknown reader: {name}')
+    return READERS[name]
+
+
+# Functions used to read CSV files for each value of --reader.
+READERS = {
+    'csv': read_records,
+    'pyarrow': read_records_pyarrow,
+}
+
+
+def read_row_records(rows, record_type):
+    """
+    Read rows held in memory as record_type records.
+
+    Each row is a record_type record, or a mapping from column name to value such as a row
+    from csv.DictReader. Empty rows are skipped and missing fields are None.
+    """
+    make = record_type._make
+    for row in rows:
+        if isinstance(row, record_type):
+            yield row
+        elif row:
+            yield make([row.get(column) for column in record_type._fields])
+
+
+def read_source(source, record_type, read_file=read_records):
+    """
+    Read the rows of source as record_type records.
+
+    source is one of:
+    - The filename of a CSV file, which is read by read_file, or of a CSV file compressed
+      with a suffix in COMPRESSION_OPENERS, which is decompressed as it is read.
+    - A ZipMember, which is decompressed from its archive as it is read.
+    - An open text or binary file containing CSV, which is read as UTF-8 if binary.
+    - An iterable of rows as accepted by read_row_records.
+    """
+    if isinstance(source, ZipMember):
+        return read_compressed_records(source.open, record_type)
+    if isinstance(source, (str, os.PathLike)):
+        filename = os.fspath(source)
+        opener = COMPRESSION_OPENERS.get(os.path.splitext(filename)[1].lower())
+        if opener is not None:
+            return read_compressed_records(lambda: opener(filename, 'rb'), record_type)
+        return read_file(filename, record_type)
+    if hasattr(source, 'read'):
+        if isinstance(source.read(0), bytes):
+            return _read_binary_stream_records(source, record_type)
+        return read_stream_records(source, record_type)
+    return read_row_records(source, record_type)
+
+
+def _read_binary_stream_records(infile, record_type):
+    """Read an open binary file as UTF-8 CSV, leaving the file open afterwards."""
+    text = io.TextIOWrapper(infile, encoding='utf-8', newline='')
+    try:
+        yield from read_stream_records(text, record_type)
+    finally:
+        text.detach()
+
+
+def read_compressed_records(open_stream, record_type):
+    """
+    Read the rows of a compressed CSV file as record_type records.
+
+    open_stream returns a binary stream of the decompressed file, which is read by a
+    PrefetchReader so that decompression runs alongside parsing.
+    """
+    with io.TextIOWrapper(io.BufferedReader(PrefetchReader(open_stream())),
+                          newline='') as infile:
+        yield from read_stream_records(infile, record_type)
+
+
+class PrefetchReader(io.RawIOBase):
+    """
+    Raw binary stream of the blocks read from another stream by a background thread.
+
+    The zlib, bz2 and lzma modules release the GIL while decompressing, so the next blocks
+    of a compressed file are decompressed while the current block is parsed. At most
+    PREFETCH_BLOCKS blocks are buffered. Errors decompressing the stream are raised as
+    OSError by readinto.
+    """
+    def __init__(self, stream):
+        """Initialise PrefetchReader and start reading stream, which it closes."""
+        super().__init__()
+        self.blocks = queue.Queue(PREFETCH_BLOCKS)
+        self.block = memoryview(b'')
+        self.eof = False
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.prefetch, args=(stream,), daemon=True)
+        self.thread.start()
+
+    def prefetch(self, stream):
+        """Read blocks from stream until it is exhausted or the reader is closed."""
+        try:
+            with stream:
+                while not self.stopped.is_set():
+                    block = stream.read(PREFETCH_BLOCK_SIZE)
+                    self.put(block)
+                    if not block:
+                        return
+        except (OSError, EOFError, zlib.error, lzma.LZMAError, zipfile.BadZipFile) as error:
+            self.put(error if isinstance(error, OSError) else OSError(
+                f'could not decompress file: {error}'))
+
+    def put(self, item):
+        """Queue a block or error, unless the reader is closed first."""
+        while not self.stopped.is_set():
+            try:
+                self.blocks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if not self.block:
+            if self.eof:
+                return 0
+            block = self.blocks.get()
+            if isinstance(block, OSError):
+                self.eof = True
+                raise block
+            if not block:
+                self.eof = True
+                return 0
+            self.block = memoryview(block)
+        size = min(len(buffer), len(self.block))
+        buffer[:size] = self.block[:size]
+        self.block = self.block[size:]
+        return size
+
+    def close(self):
+        """Stop the background thread and close the stream."""
+        self.stopped.set()
+        super().close()
+
+
+class ZipMember(namedtuple('ZipMember', ['archive', 'filename'])):
+    """
+    One of INPUT_FILES read from a zip archive.
+
+    The member is the first, in the order of the archive, whose name without any directory
+    is filename.
+    """
+    __slots__ = ()
+
+    def open(self):
+        """Return a binary stream of the decompressed member."""
+        try:
+            with zipfile.ZipFile(self.archive) as archive:
+                for name in archive.namelist():
+                    if name.rsplit('/', 1)[-1] == self.filename:
+                        return archive.open(name)
+        except zipfile.BadZipFile as error:
+            raise OSError(f'could not read {self.archive}: {error}') from error
+        raise FileNotFoundError(f'{self.filename} not found in {self.archive}')
+
+
+def input_source(input_dir, filename):
+    """
+    Return the source from which one of INPUT_FILES is read in input_dir.
+
+    input_dir may be a zip archive, in which case a ZipMember is returned. Otherwise, if the
+    file does not exist then the first compressed file with a suffix in COMPRESSION_OPENERS
+    is used instead, e.g. Category.csv.gz.
+    """
+    if input_dir.lower().endswith('.zip') and os.path.isfile(input_dir):
+        return ZipMember(input_dir, filename)
+    path = os.path.join(input_dir, filename)
+    if not os.path.exists(path):
+        for suffix in COMPRESSION_OPENERS:
+            if os.path.exists(path + suffix):
+                return path + suffix
+    return path
+
+
+def state_filename(input_dir, filename):
+    """Return the path of a file saved in input_dir, or beside input_dir if a zip archive."""
+    if isinstance(input_source(input_dir, INPUT_FILES[0]), ZipMember):
+        return input_dir + filename
+    return os.path.join(input_dir, filename)
+
+
+def file_digest(filename):
+    """Return a digest of the contents of a file."""
+    digest = hashlib.blake2b()
+    with open(filename, 'rb') as infile:
+        for block in iter(lambda: infile.read(1 << 20), b''):
+            digest.update(block)
+    return digest.digest()
+
+
+def state_key():
+    """
+    Return the key in STATE_KEY_FILENAME, creating it if it does not exist.
+
+    OSError is raised if the key can be neither read nor created.
+    """
+    for _ in range(STATE_KEY_ATTEMPTS):
+        try:
+            with open(STATE_KEY_FILENAME, 'rb') as infile:
+                key = infile.read()
+        except FileNotFoundError:
+            key = os.urandom(STATE_KEY_SIZE)
+            try:
+                fd = os.open(STATE_KEY_FILENAME, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            except FileExistsError:
+                # Another process created the key first, so use its key.
+                continue
+            with os.fdopen(fd, 'wb') as outfile:
+                outfile.write(key)
+            return key
+        if len(key) == STATE_KEY_SIZE:
+            return key
+        # The key may still be being written by the process that created it.
+        time.sleep(0.01)
+    raise OSError(f'{STATE_KEY_FILENAME} does not hold a valid key, so delete it to create '
+                  'a new key')
+
+
+def state_key_available(purpose):
+    """
+    Return whether state_key can be used, or print a warning that purpose is skipped if not.
+    """
+    try:
+        state_key()
+    except OSError as error:
+        print(f'WARNING: {purpose} skipped: {error}', file=sys.stderr)
         return False
     return True
 
 
+def state_mac(data):
+    """Return the message authentication code of data under the key of state_key."""
+    return hashlib.blake2b(data, key=state_key(), digest_size=STATE_KEY_SIZE).digest()
+
+
+def dump_state(obj, outfile):
+    """Write obj to outfile pickled and preceded by its MAC and length, as read by load_state."""
+    data = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+    outfile.write(state_mac(data) + len(data).to_bytes(8, 'little'))
+    outfile.write(data)
+
+
+def load_state(data, offset=0):
+    """
+    Return the object written by dump_state at offset in the bytes-like data, and the offset
+    following it.
+
+    The pickle is only loaded if its MAC is valid, and otherwise pickle.UnpicklingError is
+    raised.
+    """
+    start = offset + STATE_KEY_SIZE + 8
+    mac = bytes(data[offset:offset + STATE_KEY_SIZE])
+    length = int.from_bytes(data[offset + STATE_KEY_SIZE:start], 'little')
+    with memoryview(data) as view, view[start:start + length] as payload:
+        if len(payload) != length or not hmac.compare_digest(mac, state_mac(payload)):
+            raise pickle.UnpicklingError('saved state could not be authenticated')
+        return pickle.loads(payload), start + length
+
+
+def source_name(source, filename):
+    """Return the name of source in banners: its filename, or filename if not a file."""
+    if isinstance(source, ZipMember):
+        return os.path.join(source.archive, source.filename)
+    return os.fspath(source) if isinstance(source, (str, os.PathLike)) else filename
+
+
+def file_signature(filename):
+    """Return the size and modification time of a file, or None if it does not exist."""
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    return (stat.st_size, stat.st_mtime_ns)
+
+
+def code_key(code):
+    """
+    Return the (width, value) key of a numeric code, or None if the code is not numeric.
+
+    width is the zero filled length of a code with leading zeros and 0 otherwise, e.g.
+    '7' has key (0, 7) and '007' has key (3, 7). The code is str(value).zfill(width).
+    """
+    if not NUMERIC_CODE.fullmatch(code):
+        return None
+    return (len(code) if len(code) > 1 and code[0] == '0' else 0, int(code))
+
+
+def _merge_ranges(ranges):
+    """Merge a list of (first, last) tuples sorted by first into sorted, disjoint ranges."""
+    merged = []
+    for first, last in ranges:
+        if merged and first <= merged[-1][1] + 1:
+            if last > merged[-1][1]:
+                merged[-1] = (merged[-1][0], last)
+        else:
+            merged.append((first, last))
+    return merged
+
+
+def _subtract_ranges(ranges, other_ranges):
+    """Subtract sorted, disjoint other_ranges from sorted, disjoint ranges."""
+    result = []
+    idx = 0
+    for first, last in ranges:
+        while idx < len(other_ranges) and other_ranges[idx][1] < first:
+            idx += 1
+        other_idx = idx
+        while other_idx < len(other_ranges) and other_ranges[other_idx][0] <= last:
+            other_first, other_last = other_ranges[other_idx]
+            if other_first > first:
+                result.append((first, other_first - 1))
+            first = max(first, other_last + 1)
+            other_idx += 1
+        if first <= last:
+            result.append((first, last))
+    return result
+
+
+def _zero_filled_range(width, first, last):
+    """Yield the codes in a range of zero filled codes in sorted order."""
+    for value in range(first, last + 1):
+        yield str(value).zfill(width)
+
+
+def _subtree_max(prefix, last):
+    """Return the largest number no greater than last whose digits start with prefix."""
+    scale = 1
+    while prefix * scale * 10 <= last:
+        scale *= 10
+    return min(last, (prefix + 1) * scale - 1)
+
+
+def _lexicographic_subtree(prefix, first, last):
+    """Yield the codes in the range first to last starting with prefix in sorted order."""
+    if prefix >= first:
+        yield str(prefix)
+    for digit in range(10):
+        child = prefix * 10 + digit
+        if child > last:
+            break
+        if _subtree_max(child, last) >= first:
+            yield from _lexicographic_subtree(child, first, last)
+
+
+def _lexicographic_range(first, last):
+    """
+    Yield the codes in a range of codes without leading zeros in sorted order.
+
+    Codes are sorted as strings e.g. 1>12 yields '1', '10', '11', '12', '2', ... '9'.
+    """
+    if first > last:
+        return
+    if first == 0:
+        yield '0'
+        first = 1
+    for digit in range(1, 10):
+        if digit > last:
+            break
+        if _subtree_max(digit, last) >= first:
+            yield from _lexicographic_subtree(digit, first, last)
+
+
+class CodeRanges:
+    """
+    A set of category codes.
+
+    Numeric codes are held as sorted, disjoint (first, last) ranges of values for each zero
+    filled width (see code_key), so that a Source_Value such as 1>99999 is never expanded.
+    All other codes are held as a set of strings. Iterating over CodeRanges yields the codes
+    in sorted order, expanding ranges lazily.
+    """
+    def __init__(self, ranges=None, codes=None):
+        """Initialise CodeRanges."""
+        self.ranges = ranges if ranges is not None else dict()
+        self.codes = codes if codes is not None else set()
+
+    @classmethod
+    def from_ranges(cls, ranges, codes):
+        """
+        Return CodeRanges for the union of ranges and codes and CodeRanges for the codes
+        that occur more than once.
+
+        ranges is a list of (width, first, last) tuples and codes is a list of non-numeric
+        codes.
+        """
+        union = cls()
+        dupes = cls()
+        ranges_by_width = dict()
+        for width, first, last in ranges:
+            ranges_by_width.setdefault(width, []).append((first, last))
+        for width, width_ranges in ranges_by_width.items():
+            width_ranges.sort()
+            overlaps = []
+            reach = -1
+            for first, last in width_ranges:
+                if first <= reach:
+                    overlaps.append((first, min(last, reach)))
+                reach = max(reach, last)
+            union.ranges[width] = _merge_ranges(width_ranges)
+            if overlaps:
+                dupes.ranges[width] = _merge_ranges(overlaps)
+
+        code_counts = Counter(codes)
+        union.codes = set(code_counts)
+        dupes.codes = {code for code, count in code_counts.items() if count > 1}
+        return union, dupes
+
+    @classmethod
+    def from_codes(cls, codes):
+        """Return CodeRanges for an iterable of normalized codes."""
+        ranges = []
+        other_codes = []
+        for code in codes:
+            key = code_key(code)
+            if key is None:
+                other_codes.append(code)
+            else:
+                ranges.append((key[0], key[1], key[1]))
+        return cls.from_ranges(ranges, other_codes)[0]
+
+    def __len__(self):
+        return len(self.codes) + sum(last - first + 1 for ranges in self.ranges.values()
+                                     for first, last in ranges)
+
+    def __bool__(self):
+        return bool(self.codes) or any(self.ranges.values())
+
+    def __sub__(self, other):
+        result = CodeRanges(codes=self.codes - other.codes)
+        for width, ranges in self.ranges.items():
+            remaining = _subtract_ranges(ranges, other.ranges.get(width, []))
+            if remaining:
+                result.ranges[width] = remaining
+        return result
+
+    def __iter__(self):
+        iterables = [sorted(self.codes)]
+        for width, ranges in self.ranges.items():
+            for first, last in ranges:
+                if width:
+                    iterables.append(_zero_filled_range(width, first, last))
+                else:
+                    iterables.append(_lexicographic_range(first, last))
+        return heapq.merge(*iterables)
+
+
+# Positions of the set bits in each byte value, used to iterate over the bits of a CodeSet.
+BYTE_BITS = [tuple(bit for bit in range(8) if value >> bit & 1) for value in range(256)]
+
+
+class CodeDictionary:
+    """
+    Assigns a dense integer id to each distinct normalized code.
+
+    The same codes occur in many classifications, so ids are shared by all the CodeSets of a
+    Checker.
+    """
+    def __init__(self):
+        """Initialise CodeDictionary."""
+        self.ids = dict()
+        self.codes = list()
+
+    def encode(self, code):
+        """Return the id of code, assigning a new id if it has not been seen before."""
+        code_id = self.ids.get(code)
+        if code_id is None:
+            code_id = len(self.codes)
+            self.ids[code] = code_id
+            self.codes.append(code)
+        return code_id
+
+
+class DeltaCodeDictionary(CodeDictionary):
+    """
+    A CodeDictionary that extends a base CodeDictionary without modifying it.
+
+    Codes in base keep their ids, so that CodeSets of both can be compared, and other codes are
+    assigned ids after those of base. base must not change while the DeltaCodeDictionary is in
+    use.
+    """
+    def __init__(self, base):
+        """Initialise DeltaCodeDictionary."""
+        super().__init__()
+        self.base = base
+        self.codes = DeltaCodes(base.codes)
+
+    def encode(self, code):
+        """Return the id of code in base, or assign a new id if it is not in base."""
+        code_id = self.base.ids.get(code)
+        if code_id is None:
+            code_id = self.ids.get(code)
+            if code_id is None:
+                code_id = len(self.codes)
+                self.ids[code] = code_id
+                self.codes.new_codes.append(code)
+        return code_id
+
+
+class DeltaCodes:
+    """The codes of a DeltaCodeDictionary indexed by id: those of base followed by new_codes."""
+    __slots__ = ('base_codes', 'new_codes')
+
+    def __init__(self, base_codes):
+        """Initialise DeltaCodes."""
+        self.base_codes = base_codes
+        self.new_codes = list()
+
+    def __len__(self):
+        return len(self.base_codes) + len(self.new_codes)
+
+    def __getitem__(self, code_id):
+        num_base_codes = len(self.base_codes)
+        if code_id < num_base_codes:
+            return self.base_codes[code_id]
+        return self.new_codes[code_id - num_base_codes]
+
+
+class CodeSet:
+    """
+    A set of normalized codes held as a bitset of the ids assigned by a CodeDictionary.
+
+    Bit 0 of the bitset is the lowest id in the set, held as offset, so that the size of a set
+    depends on the range of its own ids rather than on the size of the CodeDictionary. Codes
+    are added to a set of pending ids, which are merged into the bitset when the set is next
+    compared or iterated over. Comparisons and differences are integer operations. Iterating
+    over a CodeSet yields the codes in the order of their ids.
+    """
+    __slots__ = ('dictionary', 'offset', 'bits', 'pending')
+
+    def __init__(self, dictionary, bits=0, offset=0):
+        """Initialise CodeSet with bits holding the ids from offset upwards."""
+        self.dictionary = dictionary
+        if bits:
+            lowest = (bits & -bits).bit_length() - 1
+            bits >>= lowest
+            offset += lowest
+        else:
+            offset = 0
+        self.offset = offset
+        self.bits = bits
+        self.pending = None
+
+    def add(self, code):
+        """Add a normalized code to the set."""
+        if self.pending is None:
+            self.pending = set()
+        self.pending.add(self.dictionary.encode(code))
+
+    def freeze(self):
+        """Merge the pending ids into the bitset and return the bitset."""
+        if self.pending:
+            offset = min(self.pending)
+            bits = 0
+            if self.bits:
+                offset = min(offset, self.offset)
+                bits = self.bits << (self.offset - offset)
+            buffer = bytearray((max(self.pending) - offset) // 8 + 1)
+            for code_id in self.pending:
+                code_id -= offset
+                buffer[code_id >> 3] |= 1 << (code_id & 7)
+            self.bits = bits | int.from_bytes(buffer, 'little')
+            self.offset = offset
+        self.pending = None
+        return self.bits
+
+    def ids(self):
+        """Yield the ids of the codes in the set in ascending order."""
+        bits = self.freeze()
+        offset = self.offset
+        for idx, value in enumerate(bits.to_bytes((bits.bit_length() + 7) // 8, 'little')):
+            for bit in BYTE_BITS[value]:
+                yield offset + idx * 8 + bit
+
+    def recoded(self, dictionary, ids):
+        """Return a copy of the set in dictionary, which assigns ids[code_id] to each id."""
+        code_set = CodeSet(dictionary)
+        code_set.pending = {ids[code_id] for code_id in self.ids()}
+        code_set.freeze()
+        return code_set
+
+    def __len__(self):
+        return bin(self.freeze()).count('1')
+
+    def __bool__(self):
+        return bool(self.pending) or bool(self.bits)
+
+    def __eq__(self, other):
+        if not isinstance(other, CodeSet):
+            return NotImplemented
+        if self.freeze() != other.freeze():
+            return False
+        return self.offset == other.offset or not self.bits
+
+    def __sub__(self, other):
+        bits = self.freeze()
+        other_bits = other.freeze()
+        shift = other.offset - self.offset
+        other_bits = other_bits << shift if shift >= 0 else other_bits >> -shift
+        return CodeSet(self.dictionary, bits & ~other_bits, self.offset)
+
+    def __iter__(self):
+        codes = self.dictionary.codes
+        for code_id in self.ids():
+            yield codes[code_id]
+
+
+class Finding:
+    """
+    An error found in the structural metadata.
+
+    check is the name of the check that found the error, or of the stage of reading the files.
+    codes and labels hold the codes and labels involved in the error, keyed by their role.
+    The text report shows the message on an ERROR line followed by any details lines.
+    """
+    __slots__ = ('check', 'classification_mnemonic', 'message', 'details', 'codes', 'labels')
+
+    def __init__(self, check, classification_mnemonic, message, details=(), codes=None,
+                 labels=None):
+        """Initialise Finding."""
+        self.check = check
+        self.classification_mnemonic = classification_mnemonic
+        self.message = message
+        self.details = list(details)
+        self.codes = codes if codes is not None else dict()
+        self.labels = labels if labels is not None else dict()
+
+    def lines(self):
+        """Return the lines of the finding in the text report."""
+        return [f'ERROR: {self.classification_mnemonic}: {self.message}'] + self.details
+
+    def to_dict(self):
+        """Return the finding as a dict suitable for serialization."""
+        return {
+            'check': self.check,
+            'classification_mnemonic': self.classification_mnemonic,
+            'message': self.message,
+            'codes': self.codes,
+            'labels': self.labels,
+        }
+
+
+class Report:
+    """
+    Collects the banners and findings of a run in the order that they are reported.
+
+    Banners describe each stage of the run and are only included in the text report.
+    input_dir is set when several input directories are reported together, and coverage is
+    set to the coverage statistics of the Checker when only a Sample is checked.
+    """
+    def __init__(self, input_dir=None):
+        """Initialise Report."""
+        self.input_dir = input_dir
+        self.items = list()
+        self.coverage = None
+
+    def add_banner(self, lines):
+        """Add a banner of text lines."""
+        self.items.append(('banner', lines))
+
+    def add_finding(self, finding):
+        """Add a Finding."""
+        self.items.append(('finding', finding))
+
+    def findings(self):
+        """Return the findings in the report."""
+        return [item for kind, item in self.items if kind == 'finding']
+
+    def relocated(self, input_dir):
+        """Return a copy of the report for identical input files in another input_dir."""
+        report = Report(input_dir)
+        report.coverage = self.coverage
+        old_prefix = os.path.join(self.input_dir, '')
+        new_prefix = os.path.join(input_dir, '')
+        for kind, item in self.items:
+            if kind == 'banner':
+                item = [line.replace(old_prefix, new_prefix) for line in item]
+            report.items.append((kind, item))
+        return report
+
+
+class BufferedWriter:
+    """Write text to a stream in large blocks instead of line by line."""
+    def __init__(self, stream, buffer_size=1 << 16):
+        """Initialise BufferedWriter."""
+        self.stream = stream
+        self.buffer_size = buffer_size
+        self.chunks = list()
+        self.size = 0
+
+    def write(self, text):
+        """Write text, flushing to the stream if enough text is buffered."""
+        self.chunks.append(text)
+        self.size += len(text)
+        if self.size >= self.buffer_size:
+            self.flush()
+
+    def write_lines(self, lines):
+        """Write each of lines followed by a newline."""
+        for line in lines:
+            self.write(line)
+            self.write('\n')
+
+    def flush(self):
+        """Write all buffered text to the stream."""
+        self.stream.write(''.join(self.chunks))
+        self.stream.flush()
+        self.chunks = list()
+        self.size = 0
+
+
+class TextRenderer:
+    """Render a Report as human readable text."""
+    def __init__(self, writer):
+        """Initialise TextRenderer."""
+        self.writer = writer
+
+    def render_banner(self, lines):
+        """Write a banner that is not part of a report."""
+        self.writer.write_lines(lines)
+
+    def render(self, report, classifications_with_errs):
+        """Write the banners and findings of the report followed by a PASS/FAIL summary."""
+        for kind, item in report.items:
+            self.writer.write_lines(item if kind == 'banner' else item.lines())
+
+        if classifications_with_errs:
+            self.writer.write_lines([
+                '--------------------------------------------------------------------------------',
+                f'FAIL: Errors detected in {len(classifications_with_errs)} classifications:',
+                f'{sorted(classifications_with_errs)}',
+                '--------------------------------------------------------------------------------',
+            ])
+        else:
+            self.writer.write_lines([
+                '--------------------------------------------------------------------------------',
+                'PASS: No errors detected',
+                '--------------------------------------------------------------------------------',
+            ])
+        self.writer.flush()
+
+    def render_summary(self, results):
+        """
+        Write the result of each input directory checked in a batch.
+
+        results is a list of (input_dir, classifications_with_errs, error) tuples, where
+        error describes why the input files could not be read, or is None.
+        """
+        self.writer.write_lines([
+            '',
+            '--------------------------------------------------------------------------------',
+            f'- Summary of {len(results)} input directories',
+            '--------------------------------------------------------------------------------',
+        ])
+        for input_dir, classifications_with_errs, error in results:
+            if error is not None:
+                self.writer.write_lines([f'ERROR: {input_dir}: {error}'])
+            elif classifications_with_errs:
+                self.writer.write_lines([f'FAIL: {input_dir}: Errors detected in '
+                                         f'{len(classifications_with_errs)} classifications'])
+            else:
+                self.writer.write_lines([f'PASS: {input_dir}'])
+        self.writer.write_lines([
+            '--------------------------------------------------------------------------------',
+        ])
+        self.writer.flush()
+
+
+class JsonLinesRenderer:
+    """
+    Render a Report as a JSON object per finding followed by a summary object.
+
+    If the report has an input_dir then it is included in each object. If it has coverage
+    statistics then they are included in the summary object.
+    """
+    def __init__(self, writer):
+        """Initialise JsonLinesRenderer."""
+        self.writer = writer
+
+    def render_banner(self, lines):
+        """Banners are not included in JSON Lines reports."""
+
+    def render(self, report, classifications_with_errs):
+        """Write a JSON object for each finding and then a summary object."""
+        prefix = {'input_dir': report.input_dir} if report.input_dir is not None else {}
+        for finding in report.findings():
+            self.writer.write_lines([json.dumps(dict(prefix, **finding.to_dict()))])
+        summary = dict(prefix, result='FAIL' if classifications_with_errs else 'PASS',
+                       classifications_with_errors=sorted(classifications_with_errs))
+        if report.coverage is not None:
+            summary['coverage'] = report.coverage
+        self.writer.write_lines([json.dumps(summary)])
+        self.writer.flush()
+
+    def render_summary(self, results):
+        """Write a summary object with the result of each input directory in a batch."""
+        self.writer.write_lines([json.dumps({'summary': [
+            {
+                'input_dir': input_dir,
+                'result': 'ERROR' if error is not None else
+                          'FAIL' if classifications_with_errs else 'PASS',
+                'classifications_with_errors': len(classifications_with_errs),
+                'error': error,
+            }
+            for input_dir, classifications_with_errs, error in results]})])
+        self.writer.flush()
+
+
+class CsvRenderer:
+    """
+    Render a Report as CSV with a row per finding. Codes and labels are JSON encoded.
+
+    If the report has an input_dir then it is included as the first column. The header is
+    only written before the first report. Input directories of a batch that could not be read
+    are written as rows with the check read_input_dir.
+    """
+    def __init__(self, writer):
+        """Initialise CsvRenderer."""
+        self.writer = writer
+        self.csv_writer = csv.writer(writer, lineterminator='\n')
+        self.header_written = False
+
+    def render_banner(self, lines):
+        """Banners are not included in CSV reports."""
+
+    def write_header(self, with_input_dir):
+        """Write the header, with an input_dir column if with_input_dir, if not yet written."""
+        if not self.header_written:
+            header = ['check', 'classification_mnemonic', 'message', 'codes', 'labels']
+            self.csv_writer.writerow(['input_dir'] + header if with_input_dir else header)
+            self.header_written = True
+
+    def render(self, report, classifications_with_errs):
+        """Write a header if not yet written and a row for each finding."""
+        prefix = [report.input_dir] if report.input_dir is not None else []
+        self.write_header(bool(prefix))
+        for finding in report.findings():
+            self.csv_writer.writerow(prefix + [finding.check, finding.classification_mnemonic,
+                                               finding.message, json.dumps(finding.codes),
+                                               json.dumps(finding.labels)])
+        self.writer.flush()
+
+    def render_summary(self, results):
+        """
+        Write a read_input_dir row for each input directory of a batch that could not be
+        read, since its result is otherwise not shown by the rows of findings.
+        """
+        self.write_header(True)
+        for input_dir, _, error in results:
+            if error is not None:
+                self.csv_writer.writerow([input_dir, 'read_input_dir', '', error,
+                                          json.dumps({}), json.dumps({})])
+        self.writer.flush()
+
+
+# Renderers for each value of --format.
+RENDERERS = {
+    'text': TextRenderer,
+    'jsonl': JsonLinesRenderer,
+    'csv': CsvRenderer,
+}
+
+
+def max_rss_bytes():
+    """Return the peak resident set size of the process in bytes, or None if unknown."""
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere.
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+@contextmanager
+def _unprofiled():
+    """Context manager used in place of Profiler.phase when profiling is disabled."""
+    yield
+
+
+class Profiler:
+    """
+    Records the wall time, counters and peak memory of each phase of a run.
+
+    The counters are attributes of the Checker listed in COUNTERS. The value recorded for a
+    phase is the amount the counter increased during the phase.
+    """
+    COUNTERS = ('rows_read', 'codes_expanded', 'codes_in_ranges', 'normalize_calls',
+                'normalize_misses')
+
+    def __init__(self):
+        """Initialise Profiler."""
+        self.phases = list()
+        self.check_totals = dict()
+
+    def counters(self, checker):
+        """Return the current values of the counters of checker."""
+        return [getattr(checker, counter) for counter in self.COUNTERS]
+
+    def record(self, name, seconds, counters):
+        """Record a phase given its elapsed time and the increase in each counter."""
+        rows_read, codes_expanded, codes_in_ranges, normalize_calls, normalize_misses = counters
+        self.phases.append({
+            'phase': name,
+            'seconds': seconds,
+            'rows_read': rows_read,
+            'codes_expanded': codes_expanded,
+            'codes_in_ranges': codes_in_ranges,
+            'normalize_cache_hits': normalize_calls - normalize_misses,
+            'normalize_cache_misses': normalize_misses,
+            'max_rss_bytes': max_rss_bytes(),
+        })
+
+    @contextmanager
+    def phase(self, name, checker):
+        """Context manager recording the code run within it as the phase name."""
+        start_counters = self.counters(checker)
+        start = time.perf_counter()
+        yield
+        seconds = time.perf_counter() - start
+        self.record(name, seconds, [end - start for end, start in
+                                    zip(self.counters(checker), start_counters)])
+
+    def call_check(self, check, checker, classification_mnemonic):
+        """Run check on a classification, adding its time and counters to the check totals."""
+        start_counters = self.counters(checker)
+        start = time.perf_counter()
+        findings = check.check(checker, classification_mnemonic)
+        seconds = time.perf_counter() - start
+        totals = self.check_totals.setdefault(check.name, [0.0] + [0] * len(self.COUNTERS))
+        totals[0] += seconds
+        for idx, (end, start) in enumerate(zip(self.counters(checker), start_counters)):
+            totals[idx + 1] += end - start
+        return findings
+
+    def record_checks(self):
+        """Record the totals of each check run since the last call as phases."""
+        for name, totals in self.check_totals.items():
+            self.record(f'  check_{name}', totals[0], totals[1:])
+        self.check_totals = dict()
+
+    def summary(self):
+        """Return the lines of a table summarising each phase."""
+        lines = [f'{"phase":32} {"seconds":>9} {"rows":>9} {"expanded":>9} {"in ranges":>10} '
+                 f'{"norm hits":>10} {"norm miss":>10} {"max rss MiB":>11}']
+        for phase in self.phases:
+            max_rss = phase['max_rss_bytes']
+            lines.append(f'{phase["phase"]:32} {phase["seconds"]:9.3f} {phase["rows_read"]:9} '
+                         f'{phase["codes_expanded"]:9} {phase["codes_in_ranges"]:10} '
+                         f'{phase["normalize_cache_hits"]:10} '
+                         f'{phase["normalize_cache_misses"]:10} '
+                         f'{"-" if max_rss is None else f"{max_rss / 2**20:.1f}":>11}')
+        return lines
+
+    def save(self, filename):
+        """Save the phases as JSON to filename."""
+        with open(filename, 'w') as outfile:
+            json.dump({'phases': self.phases}, outfile, indent=2)
+
+
+class Hierarchy:
+    """
+    Index of the parent and children of each classification in Classification.csv.
+
+    Classifications without a parent, or whose parent is not in Classification.csv, are roots
+    at depth 0. order lists the classifications with every parent before its children,
+    followed by any classifications that are in, or derived from, a cycle of parents. Each
+    cycle is listed once in cycles, starting from the classification found first.
+    """
+    def __init__(self, classifications):
+        """Initialise Hierarchy from a dict of Classification records by mnemonic."""
+        self.parents = dict()
+        self.children = dict()
+        for classification_mnemonic, classification in classifications.items():
+            parent_mnemonic = (classification.Parent_Classification_Mnemonic or '').strip()
+            if parent_mnemonic:
+                self.parents[classification_mnemonic] = parent_mnemonic
+                self.children.setdefault(parent_mnemonic, []).append(classification_mnemonic)
+
+        self.depths = dict()
+        self.order = list()
+        queue = deque([classification_mnemonic for classification_mnemonic in classifications
+                       if self.parents.get(classification_mnemonic) not in classifications])
+        while queue:
+            classification_mnemonic = queue.popleft()
+            parent_mnemonic = self.parents.get(classification_mnemonic)
+            self.depths[classification_mnemonic] = self.depths[parent_mnemonic] + 1 \
+                if parent_mnemonic in self.depths else 0
+            self.order.append(classification_mnemonic)
+            queue.extend(self.children.get(classification_mnemonic, []))
+
+        # Classifications that were not reached from a root have a cycle among their ancestors.
+        self.cycles = list()
+        visited = set(self.depths)
+        for classification_mnemonic in classifications:
+            path = list()
+            while classification_mnemonic not in visited:
+                visited.add(classification_mnemonic)
+                path.append(classification_mnemonic)
+                classification_mnemonic = self.parents[classification_mnemonic]
+            if classification_mnemonic in path:
+                self.cycles.append(path[path.index(classification_mnemonic):])
+            self.order.extend(path)
+
+    def parent(self, classification_mnemonic):
+        """Return the mnemonic of the parent of a classification, or '' if it has none."""
+        return self.parents.get(classification_mnemonic, '')
+
+    def ancestors(self, classification_mnemonic):
+        """Return the ancestors of a classification, starting with its parent."""
+        ancestors = list()
+        parent_mnemonic = self.parents.get(classification_mnemonic)
+        while parent_mnemonic and parent_mnemonic not in ancestors and \
+                parent_mnemonic != classification_mnemonic:
+            ancestors.append(parent_mnemonic)
+            parent_mnemonic = self.parents.get(parent_mnemonic)
+        return ancestors
+
+
+class MappingSummary:
+    """
+    The values from the Category_Mapping.csv rows of a classification that are used by checks.
+
+    Rows are added one at a time by Checker.add_mapping and are not retained, so the memory
+    used depends on the number of distinct codes rather than the number of rows. The shared
+    values are set by Checker.add_mapping and the remainder by the add_mapping hooks of the
+    checks.
+    """
+    __slots__ = ('num_rows', 'codebook_mnemonic', 'num_codebook_differences',
+                 'num_identity_differences', 'target_values', 'source_values',
+                 'source_value_targets',
+                 'different_int_labels', 'different_ext_labels', 'different_welsh_labels')
+
+    def __init__(self, codebook_mnemonic, code_dictionary):
+        """Initialise MappingSummary with a CodeDictionary used to encode Target_Values."""
+        self.num_rows = 0
+        self.codebook_mnemonic = codebook_mnemonic
+        self.num_codebook_differences = 0
+        self.num_identity_differences = 0
+        self.target_values = CodeSet(code_dictionary)
+        self.source_values = list()
+        self.source_value_targets = dict()
+        self.different_int_labels = set()
+        self.different_ext_labels = set()
+        self.different_welsh_labels = set()
+
+
+class Check:
+    """
+    A check on structural metadata.
+
+    All checks are run together by Checker.run_checks in a single traversal of the loaded
+    classifications. A check can register two hooks:
+
+    - add_mapping is called for each row of Category_Mapping.csv as it is read, along with
+      the Checker, the MappingSummary for its classification and the normalized
+      Source_Value and Target_Value of the row.
+    - check is called once for each classification returned by classifications and returns
+      a list of the Findings for that classification. Returning any findings marks the
+      classification as having errors.
+
+    The banner is reported before the findings of the check.
+    """
+    name = None
+    banner = []
+    add_mapping = None
+
+    def classifications(self, checker):
+        """Return the classification mnemonics to check in the order they are reported."""
+        return checker.category_mappings
+
+    def check(self, checker, classification_mnemonic):
+        """Return a list of the Findings for a classification."""
+        raise NotImplementedError
+
+
+class CodebookMnemonicCheck(Check):
+    """Check that the same Codebook_Mnemonic is used for all rows of a classification."""
+    name = 'codebook_mnemonic'
+    banner = [
+        '',
+        '--------------------------------------------------------------------------------',
+        '- Checking that same Codebook_Mnemonic is used for all rows in',
+        '- Category_Mapping.csv with the same Classification_Mnemonic',
+        '--------------------------------------------------------------------------------',
+        '',
+    ]
+
+    def add_mapping(self, checker, summary, mapping, source_value, target_value):
+        if mapping.Codebook_Mnemonic != summary.codebook_mnemonic:
+            summary.num_codebook_differences += 1
+
+    def check(self, checker, classification_mnemonic):
+        if classification_mnemonic not in checker.classifications or \
+                checker.hierarchy.parent(classification_mnemonic):
+            return []
+        # An error is reported for each row that differs from the first row.
+        summary = checker.category_mappings[classification_mnemonic]
+        return [Finding(self.name, classification_mnemonic,
+                        'different values of Codebook_Mnemonic specified for same '
+                        'Classification_Mnemonic')] * summary.num_codebook_differences
+
+
+class IdentityMappingsCheck(Check):
+    """Check that Source_Value equals Target_Value for classifications without a parent."""
+    name = 'identity_mappings'
+    banner = [
+        '',
+        '--------------------------------------------------------------------------------',
+        '- When Parent_Classification_Mnemonic is not specified in Classification.csv',
+        '- check that the Source_Value equals the Target_Value for every category',
+        '- in Category_Mapping.csv.',
+        '--------------------------------------------------------------------------------',
+        '',
+    ]
+
+    def add_mapping(self, checker, summary, mapping, source_value, target_value):
+        if source_value != target_value:
+            summary.num_identity_differences += 1
+
+    def check(self, checker, classification_mnemonic):
+        if classification_mnemonic not in checker.classifications or \
+                checker.hierarchy.parent(classification_mnemonic):
+            return []
+        summary = checker.category_mappings[classification_mnemonic]
+        num_differences = summary.num_identity_differences
+        if not num_differences:
+            return []
+        return [Finding(self.name, classification_mnemonic,
+                        'different Source_Value and Target_Value specified on '
+                        f'{num_differences}/{summary.num_rows} rows')]
+
+
+class CategoryConsistencyCheck(Check):
+    """Check that the Target_Value values of a classification match its Category_Code values."""
+    name = 'category_consistency'
+    banner = [
+        '',
+        '--------------------------------------------------------------------------------',
+        '- Check that for a given Classification_Mnemonic the set of Target_Value values',
+        '- in Category_Mapping.csv is the same as the set of Category_Code values',
+        '- in Classification.csv',
+        '--------------------------------------------------------------------------------',
+        '',
+    ]
+
+    def check(self, checker, classification_mnemonic):
+        if classification_mnemonic not in checker.categories:
+            return []
+        target_values = checker.category_mappings[classification_mnemonic].target_values
+        normalized_cats = checker.category_codes[classification_mnemonic]
+        if target_values == normalized_cats:
+            return []
+        category_only = normalized_cats - target_values
+        mapping_only = target_values - normalized_cats
+        return [Finding(
+            self.name, classification_mnemonic,
+            'different set of Category_Code values in Category.csv and Target_Value values in '
+            'Category_Mapping.csv',
+            details=[
+                '  - In Category.csv but not Category_Mapping.csv: '
+                f'{checker.limited_sorted_list(category_only)}',
+                '  - In Category_Mapping.csv but not Category.csv: '
+                f'{checker.limited_sorted_list(mapping_only)}',
+                '',
+            ],
+            codes={
+                'in_category_not_category_mapping': checker.code_summary(category_only),
+                'in_category_mapping_not_category': checker.code_summary(mapping_only),
+            })]
+
+
+class UniqueLabelsCheck(Check):
+    """Check that category labels are unique within each classification."""
+    name = 'unique_labels'
+    banner = [
+        '',
+        '--------------------------------------------------------------------------------',
+        '- Checking for unique category labels in Category.csv on a per classification',
+        '- basis',
+        '--------------------------------------------------------------------------------',
+        '',
+    ]
+
+    def classifications(self, checker):
+        return checker.categories
+
+    def check(self, checker, classification_mnemonic):
+        # Index the codes of all categories by label for each label column in one pass.
+        label_indexes = tuple(dict() for _ in CATEGORY_LABEL_COLUMNS)
+        for code, category in checker.categories[classification_mnemonic].items():
+            for column, label_index in zip(CATEGORY_LABEL_COLUMNS, label_indexes):
+                label_index.setdefault(getattr(category, column), []).append(code)
+
+        findings = []
+        for column, label_index in zip(CATEGORY_LABEL_COLUMNS, label_indexes):
+            collisions = {label: codes for label, codes in label_index.items()
+                          if len(codes) > 1}
+            if not collisions:
+                continue
+            details = []
+            labels = dict()
+            for label in sorted(collisions)[0:checker.max_elements]:
+                details.append(f'  - {column}: "{label}" Category_Code values: '
+                               f'{checker.limited_sorted_list(collisions[label])}')
+                labels[label] = checker.code_summary(collisions[label])
+            if len(collisions) > checker.max_elements:
+                details.append(f'  - PLUS {len(collisions) - checker.max_elements} others')
+            findings.append(Finding(
+                self.name, classification_mnemonic,
+                f'multiple categories with the same {column}: {sorted(collisions)}',
+                details=details, labels={column: labels}))
+        return findings
+
+
+class SourceValuesCheck(Check):
+    """Check the Source_Value values of derived classifications against their parent."""
+    name = 'source_values'
+    banner = [
+        '',
+        '--------------------------------------------------------------------------------',
+        '- Validate internal consistency of Source_Value entries for each',
+        '- Classification_Mnemonic within Category_Mapping.csv',
+        '- ',
+        '- Category codes for a classification are identified as the set of Target_Value',
+        '- values for a given Classification_Mnemonic. For every classification that has a',
+        '- parent then:',
+        '-   * Each Source_Value in the mapping must be a category code in the parent',
+        '-   * There must be a single mapping record for each Source_Value',
+        '-   * Every parent category code must be mapped',
+        '--------------------------------------------------------------------------------',
+        '',
+    ]
+
+    def add_mapping(self, checker, summary, mapping, source_value, target_value):
+        # Source values are only checked against the parent of derived classifications.
+        if checker.hierarchy.parent(mapping.Classification_Mnemonic):
+            summary.source_values.append(source_value)
+
+    def check(self, checker, classification_mnemonic):
+        parent_mnemonic = checker.hierarchy.parent(classification_mnemonic)
+        if not parent_mnemonic:
+            return []
+
+        if parent_mnemonic not in checker.category_mappings:
+            return [Finding(self.name, classification_mnemonic,
+                            ' Parent_Classification_Mnemonic is an unknown classification: '
+                            f'{parent_mnemonic} ', details=[''])]
+
+        parent_target_values = checker.parent_codes(parent_mnemonic)
+        source_ranges = list()
+        source_codes = list()
+        for source_value in checker.category_mappings[classification_mnemonic].source_values:
+            checker.parse_range_limits(source_value, source_ranges, source_codes)
+        source_values, dupes = CodeRanges.from_ranges(source_ranges, source_codes)
+
+        unmapped_codes = parent_target_values - source_values
+        unknown_codes = source_values - parent_target_values
+        if not (dupes or unknown_codes or unmapped_codes):
+            return []
+
+        details = []
+        codes = dict()
+        if dupes:
+            details.append('  - Multiple entry for Source_Value:             '
+                           f'{checker.limited_sorted_list(dupes)}')
+            codes['duplicate_source_values'] = checker.code_summary(dupes)
+        if unknown_codes:
+            details.append('  - Source_Value is not Target_Value of parent:  '
+                           f'{checker.limited_sorted_list(unknown_codes)}')
+            codes['unknown_source_values'] = checker.code_summary(unknown_codes)
+        if unmapped_codes:
+            details.append('  - No entry for Target_Value of parent:         '
+                           f'{checker.limited_sorted_list(unmapped_codes)}')
+            codes['unmapped_parent_target_values'] = checker.code_summary(unmapped_codes)
+        details.append('')
+        return [Finding(self.name, classification_mnemonic,
+                        'set of values for Source_Value do not match the set of values for '
+                        f'Target_Values for the Parent_Classification_Mnemonic: {parent_mnemonic}',
+                        details=details, codes=codes)]
+
+
+class ConsistentLabelsCheck(Check):
+    """Check that the labels in Category_Mapping.csv match those in Category.csv."""
+    name = 'consistent_labels'
+    banner = [
+        '--------------------------------------------------------------------------------',
+        '- Checking for consistent labels between Category.csv and Category_Mapping.csv',
+        '--------------------------------------------------------------------------------',
+        '',
+    ]
+    label_pairs = [
+        ('different_int_labels', 'Internal_Category_Label_English',
+         'Internal_Mapping_Label_English', 'category'),
+        ('different_ext_labels', 'External_Category_Label_English',
+         'External_Mapping_Label_English', 'category'),
+        ('different_welsh_labels', 'External_Category_Label_Welsh',
+         'External_Mapping_Label_Welsh', 'categories'),
+    ]
+
+    def add_mapping(self, checker, summary, mapping, source_value, target_value):
+        categories = checker.categories.get(mapping.Classification_Mnemonic)
+        if not categories:
+            return
+        category = categories.get(mapping.Target_Value)
+        if not category:
+            return
+        int_map_en = mapping.Internal_Mapping_Label_English
+        int_cat_en = category.Internal_Category_Label_English
+        ext_map_en = mapping.External_Mapping_Label_English
+        ext_cat_en = category.External_Category_Label_English
+        ext_map_cy = mapping.External_Mapping_Label_Welsh
+        ext_cat_cy = category.External_Category_Label_Welsh
+        # Labels are interned when read, so identical labels are the same object and most
+        # rows are accepted without stripping and comparing the labels.
+        if int_map_en is int_cat_en and ext_map_en is ext_cat_en and ext_map_cy is ext_cat_cy:
+            return
+
+        if int_map_en.strip() != int_cat_en.strip():
+            summary.different_int_labels.add((mapping.Target_Value, int_cat_en, int_map_en))
+        if ext_map_en.strip() != ext_cat_en.strip():
+            summary.different_ext_labels.add((mapping.Target_Value, ext_cat_en, ext_map_en))
+        if ext_map_cy.strip() != ext_cat_cy.strip():
+            summary.different_welsh_labels.add((mapping.Target_Value, ext_cat_cy, ext_map_cy))
+
+    def check(self, checker, classification_mnemonic):
+        summary = checker.category_mappings[classification_mnemonic]
+        details = []
+        labels = dict()
+        for attribute, category_column, mapping_column, noun in self.label_pairs:
+            different_labels = getattr(summary, attribute)
+            if not different_labels:
+                continue
+            details.append(f'  - {category_column} and {mapping_column} differ for '
+                           f'{len(different_labels)} {noun}')
+            values = []
+            for label in sorted(different_labels)[0:checker.max_elements]:
+                details.append(f'    - Category_Code: "{label[0]}" '
+                               f'{category_column}: "{label[1]}" '
+                               f'{mapping_column}: "{label[2]}"')
+                values.append({'Category_Code': label[0], category_column: label[1],
+                               mapping_column: label[2]})
+            if len(different_labels) > checker.max_elements:
+                details.append(f'    - PLUS {len(different_labels) - checker.max_elements} '
+                               'others')
+            labels[category_column] = {'count': len(different_labels), 'values': values}
+        if not details:
+            return []
+        details.append('')
+        return [Finding(self.name, classification_mnemonic,
+                        'has different labels specified in Category.csv and '
+                        'Category_Mapping.csv', details=details, labels=labels)]
+
+
+class TransitiveMappingsCheck(Check):
+    """
+    Check that the mappings of classifications derived from derived classifications map each
+    code of their root classification to a single category.
+    """
+    name = 'transitive_mappings'
+    banner = [
+        '',
+        '--------------------------------------------------------------------------------',
+        '- Validate the mappings of classifications derived from derived classifications',
+        '- ',
+        '- Mappings are composed along the Parent_Classification_Mnemonic values of each',
+        '- classification back to its root classification. For every classification that',
+        '- has a grandparent then:',
+        '-   * Each category code of the root must map to a Target_Value',
+        '-   * No category code of the root may map to more than one Target_Value',
+        '--------------------------------------------------------------------------------',
+        '',
+    ]
+
+    def add_mapping(self, checker, summary, mapping, source_value, target_value):
+        if checker.hierarchy.parent(mapping.Classification_Mnemonic):
+            summary.source_value_targets.setdefault(source_value, []).append(target_value)
+
+    def check(self, checker, classification_mnemonic):
+        if checker.hierarchy.depths.get(classification_mnemonic, 0) < 2:
+            return []
+        composed = checker.composed_mapping(classification_mnemonic)
+        if composed is None:
+            return []
+        unreachable_codes = [code for code, targets in composed.items() if not targets]
+        ambiguous_codes = [code for code, targets in composed.items() if len(targets) > 1]
+        if not (unreachable_codes or ambiguous_codes):
+            return []
+
+        root_mnemonic = checker.hierarchy.ancestors(classification_mnemonic)[-1]
+        details = []
+        codes = dict()
+        if unreachable_codes:
+            details.append('  - Root code does not map to a Target_Value:      '
+                           f'{checker.limited_sorted_list(unreachable_codes)}')
+            codes['unreachable_root_codes'] = checker.code_summary(unreachable_codes)
+        if ambiguous_codes:
+            details.append('  - Root code maps to multiple Target_Values:      '
+                           f'{checker.limited_sorted_list(ambiguous_codes)}')
+            codes['ambiguous_root_codes'] = checker.code_summary(ambiguous_codes)
+        details.append('')
+        return [Finding(self.name, classification_mnemonic,
+                        'mappings composed from the root classification do not map each code '
+                        f'to a single Target_Value: {root_mnemonic}',
+                        details=details, codes=codes)]
+
+
+# The checks run by main, in the order that they are reported.
+CHECKS = [CodebookMnemonicCheck, IdentityMappingsCheck, CategoryConsistencyCheck,
+          UniqueLabelsCheck, SourceValuesCheck, ConsistentLabelsCheck, TransitiveMappingsCheck]
+
+
+def selected_checks(names):
+    """Return the CHECKS with the given names, or all CHECKS if names is None."""
+    return [check for check in CHECKS if names is None or check.name in names]
+
+
+class StopReading(Exception):
+    """Raised to stop reading the input files once a Checker finds over max_findings errors."""
+
+
+class Sample:
+    """
+    A deterministic random sample of the classifications to check.
+
+    size is a number of classifications if it is an int, or a proportion of them between 0
+    and 1 if it is a float.
+    Classifications are ranked by a hash of seed and their Classification_Mnemonic, so the
+    same seed samples the same classifications whatever the order of the input files, and a
+    larger sample includes every classification of a smaller one.
+    """
+    def __init__(self, size, seed=0):
+        """Initialise Sample."""
+        if size <= 0:
+            raise ValueError('sample size must be greater than 0')
+        if isinstance(size, float) and size > 1:
+            raise ValueError('sample proportion must be at most 1')
+        self.size = size
+        self.seed = seed
+
+    def rank(self, classification_mnemonic):
+        """Return the key ordering a classification in the random order of the sample."""
+        return hashlib.blake2b(f'{self.seed}\x1f{classification_mnemonic}'.encode(),
+                               digest_size=8).digest()
+
+    def choose(self, classification_mnemonics, prioritised=()):
+        """
+        Return the set of classification_mnemonics in the sample.
+
+        Classifications in prioritised are chosen before all others.
+        """
+        prioritised = set(prioritised)
+        if isinstance(self.size, float):
+            num_sampled = math.ceil(self.size * len(classification_mnemonics))
+        else:
+            num_sampled = int(self.size)
+        ranked = sorted(classification_mnemonics, key=lambda classification_mnemonic: (
+            classification_mnemonic not in prioritised, self.rank(classification_mnemonic)))
+        return set(ranked[:num_sampled])
+
+
 class Checker:
     """Check structural metadata."""
-    def __init__(self, input_dir, ignore_leading_zeros, max_elements):
-        """Initialise Checker."""
+    def __init__(self, input_dir, ignore_leading_zeros, max_elements, checks=None,
+                 hash_content=False, report=None, profiler=None, reader='csv', sources=None,
+                 snapshot=None, max_findings=None, sample=None):
+        """
+        Initialise Checker with checks, which defaults to all CHECKS.
+
+        Each of INPUT_FILES is read from input_dir unless sources maps it to a source accepted
+        by read_source, such as an open file or an iterable of rows.
+
+        If a Snapshot is specified then the files are loaded from it if they have not changed,
+        and otherwise it is saved after the files are read.
+
+        If max_findings is specified then at most that many findings are reported, and reading
+        and checking stop once another finding is found. stopped is then set, the remaining
+        files and classifications are not checked, and the findings are a subset of those of a
+        full run.
+
+        If a Sample is specified then only the sampled classifications are checked, and the
+        findings are a subset of those of a full run. Unless the rows of every classification
+        are needed for hash_content or a snapshot, only the rows of the sampled
+        classifications and their ancestors are kept from Category.csv and
+        Category_Mapping.csv. Every row is still parsed.
+
+        If hash_content is set then a hash of the rows of each classification is calculated
+        so that results can be cached by run_checks.
+
+        Banners and findings are added to report, which defaults to a new Report. If a
+        Profiler is specified then each phase of loading and checking is recorded.
+
+        The CSV files are read using the reader returned by get_reader for reader.
+        """
+        self.report = report if report is not None else Report()
+        self.profiler = profiler
+        self.read_records = get_reader(reader)
+        self.rows_read = 0
+        self.codes_expanded = 0
+        self.codes_in_ranges = 0
+        self.normalize_calls = 0
+        self.normalize_misses = 0
         self.ignore_leading_zeros = ignore_leading_zeros
         self.max_elements = max_elements if max_elements > 0 else 0
         self.classifications_with_errs = set()
+        self.max_findings = max_findings
+        self.num_findings = 0
+        self.stopped = False
+        self.reading = False
+        self.normalized_codes = dict()
+        self.code_dictionary = CodeDictionary()
+        self.parent_code_ranges = dict()
+        self.composed_mappings = dict()
+        self.composed_mapping_uses = dict()
+        self.content_hashes = {filename: dict() for filename in INPUT_FILES} \
+            if hash_content else None
+        self.target_value_digests = dict()
+        self.checks = [check() for check in (CHECKS if checks is None else checks)]
+        self.mapping_hooks = [check.add_mapping for check in self.checks if check.add_mapping]
+        self.input_dir = input_dir
+        self.sources = dict(sources) if sources is not None else dict()
+        self.file_signatures = dict()
+        self.read_items = dict()
+        self.snapshot = snapshot
+        self.sample = sample
+        self.sampled = None
+        self.loaded_classifications = None
+        self.load()
+
+    def load(self, start=0):
+        """
+        Read the input files from INPUT_FILES[start] onwards.
+
+        The banners and findings from reading the files before INPUT_FILES[start] are added to
+        the report again, since files are only read after the files that they depend on.
+        """
+        if start == 0 and self.snapshot is not None:
+            with self.phase('load snapshot'):
+                restored = self.snapshot.restore(self)
+            if restored:
+                for filename in INPUT_FILES:
+                    self.add_read_items(self.read_items[filename])
+                return
+
+        for filename in INPUT_FILES[0:start]:
+            self.add_read_items(self.read_items[filename])
+
+        loaders = [self.load_classifications, self.load_categories, self.load_category_mappings]
+        for filename, load in list(zip(INPUT_FILES, loaders))[start:]:
+            source = self.source(filename)
+            first_item = len(self.report.items)
+            self.file_signatures[filename] = self.source_signature(source)
+            if self.content_hashes is not None:
+                self.content_hashes[filename] = dict()
+            self.reading = True
+            try:
+                load(source)
+            except Exception as error:
+                # The file, and the files that depend on it, must be read again by reload.
+                for unread_filename in INPUT_FILES[INPUT_FILES.index(filename):]:
+                    self.file_signatures.pop(unread_filename, None)
+                if isinstance(error, StopReading):
+                    return
+                raise
+            finally:
+                self.reading = False
+            self.read_items[filename] = self.report.items[first_item:]
+
+        # Merge the codes added while loading into bitsets, releasing the sets of pending ids.
+        for code_set in itertools.chain(self.category_codes.values(),
+                                        [summary.target_values for summary
+                                         in self.category_mappings.values()]):
+            code_set.freeze()
+
+        if start == 0 and self.snapshot is not None:
+            with self.phase('save snapshot'):
+                self.snapshot.save(self)
+
+    def add_read_items(self, items):
+        """Add the banners and findings from reading a file to the report again."""
+        for kind, item in items:
+            if kind == 'banner':
+                self.report.add_banner(item)
+            else:
+                self.add_finding(item)
+
+    def max_findings_reached(self):
+        """Return whether the report holds max_findings findings, so that others are dropped."""
+        return self.max_findings is not None and self.num_findings >= self.max_findings
+
+    def source(self, filename):
+        """Return the source from which one of INPUT_FILES is read."""
+        if filename in self.sources:
+            return self.sources[filename]
+        return input_source(self.input_dir, filename)
+
+    @staticmethod
+    def source_signature(source):
+        """Return the file_signature of a source, or None if it is not read from a file."""
+        if isinstance(source, ZipMember):
+            return file_signature(source.archive)
+        if isinstance(source, (str, os.PathLike)):
+            return file_signature(source)
+        return None
+
+    def changed_files(self):
+        """Return the input files whose size or modification time has changed since read."""
+        signatures = [self.source_signature(self.source(filename)) for filename in INPUT_FILES]
+        return [filename for filename, signature in zip(INPUT_FILES, signatures)
+                if signature != self.file_signatures.get(filename)]
+
+    def reload(self, report=None):
+        """
+        Read the input files that have changed, and the files that depend on them, again.
+
+        Banners and findings are added to report, which defaults to a new Report. Returns
+        the list of changed files, which is empty if nothing was read.
+        """
+        changed_files = self.changed_files()
+        if not changed_files:
+            return changed_files
+        self.report = report if report is not None else Report()
+        self.classifications_with_errs = set()
+        self.num_findings = 0
+        self.stopped = False
+        self.parent_code_ranges = dict()
+        self.composed_mappings = dict()
+        self.composed_mapping_uses = dict()
+        self.target_value_digests = dict()
+        self.load(INPUT_FILES.index(changed_files[0]))
+        return changed_files
 
-        filename = os.path.join(input_dir, 'Classification.csv')
-        print()
-        print('--------------------------------------------------------------------------------')
-        print(f'- Read {filename}')
-        print('- Identify all classifications.')
-        print('- Check for duplicate Classification_Mnemonic values.')
-        print('--------------------------------------------------------------------------------')
-        print()
+    def load_classifications(self, source):
+        """Read Classification.csv and build the hierarchy of classifications."""
+        self.report.add_banner([
+            '',
+            '--------------------------------------------------------------------------------',
+            f'- Read {source_name(source, "Classification.csv")}',
+            '- Identify all classifications.',
+            '- Check for duplicate Classification_Mnemonic values.',
+            '- Check for cycles in Parent_Classification_Mnemonic values.',
+            '--------------------------------------------------------------------------------',
+            '',
+        ])
         self.classifications = dict()
-        with open(filename, newline='') as infile:
-            reader = csv.DictReader(infile, delimiter=',')
-            for row in reader:
-                classification_mnemonic = row['Classification_Mnemonic']
-                if not classification_mnemonic:
-                    continue
-                if classification_mnemonic in self.classifications:
-                    print(f'ERROR: {classification_mnemonic}: Duplicate Classification_Mnemonic '
-                          'in Category.csv')
-                    self.classifications_with_errs.add(classification_mnemonic)
+        with self.phase('read Classification.csv'):
+            self.read_classifications(source)
+            self.hierarchy = Hierarchy(self.classifications)
+            self.add_cycle_findings()
+        if self.sample is not None and self.content_hashes is None and self.snapshot is None:
+            self.sampled = self.sample.choose(self.classifications)
+            self.loaded_classifications = self.sample_dependencies(self.sampled)
+
+    def sample_dependencies(self, classification_mnemonics):
+        """
+        Return classification_mnemonics and their ancestors, whose Category_Mapping.csv rows
+        the checks of classification_mnemonics depend on.
+        """
+        loaded_classifications = set(classification_mnemonics)
+        for classification_mnemonic in classification_mnemonics:
+            loaded_classifications.update(self.hierarchy.ancestors(classification_mnemonic))
+        return loaded_classifications
+
+    def add_cycle_findings(self, classification_mnemonics=None):
+        """Report the classifications in cycles, or those in classification_mnemonics."""
+        for cycle in self.hierarchy.cycles:
+            for idx, classification_mnemonic in enumerate(cycle):
+                if classification_mnemonics is not None and \
+                        classification_mnemonic not in classification_mnemonics:
                     continue
-                self.classifications[classification_mnemonic] = row
-
-        filename = os.path.join(input_dir, 'Category.csv')
-        print()
-        print('--------------------------------------------------------------------------------')
-        print(f'- Read {filename}')
-        print('- Identify categories associated with each classification.')
-        print('- Check that each Classification_Mnemonic has entry in Classification.csv')
-        print('- Check for duplicate category codes on a per classification basis.')
-        print('--------------------------------------------------------------------------------')
-        print()
+                path = cycle[idx:] + cycle[:idx + 1]
+                self.add_finding(Finding(
+                    'read_classification', classification_mnemonic,
+                    f'{CYCLE_MESSAGE}{" -> ".join(path)}'))
+
+    def load_categories(self, source):
+        """Read Category.csv."""
+        self.report.add_banner([
+            '',
+            '--------------------------------------------------------------------------------',
+            f'- Read {source_name(source, "Category.csv")}',
+            '- Identify categories associated with each classification.',
+            '- Check that each Classification_Mnemonic has entry in Classification.csv',
+            '- Check for duplicate category codes on a per classification basis.',
+            '--------------------------------------------------------------------------------',
+            '',
+        ])
         self.categories = dict()
-        with open(filename, newline='') as infile:
-            reader = csv.DictReader(infile, delimiter=',')
-            for row in reader:
-                classification_mnemonic = row['Classification_Mnemonic']
-                if not classification_mnemonic:
-                    continue
-                if classification_mnemonic not in self.categories:
-                    if classification_mnemonic not in self.classifications:
-                        print(f'ERROR: {classification_mnemonic}: Classification_Mnemonic '
-                              'specified in Category.csv not found in Classification.csv')
-                        self.classifications_with_errs.add(classification_mnemonic)
-                    self.categories[classification_mnemonic] = dict()
-                code = row['Category_Code']
-                if code in self.categories[classification_mnemonic]:
-                    print(f'ERROR: {classification_mnemonic}: duplicate code specified in '
-                          f'Category.csv: {code}')
-                    self.classifications_with_errs.add(classification_mnemonic)
-                self.categories[classification_mnemonic][code] = row
-
-        filename = os.path.join(input_dir, 'Category_Mapping.csv')
-        print()
-        print('--------------------------------------------------------------------------------')
-        print(f'- Read {filename}')
-        print('- Identify category mappings associated with each classification.')
-        print('- Check that each Classification_Mnemonic has entry in Category.csv')
-        print('--------------------------------------------------------------------------------')
-        print()
+        self.category_codes = dict()
+        with self.phase('read Category.csv'):
+            self.read_categories(source)
+
+    def load_category_mappings(self, source):
+        """Read Category_Mapping.csv."""
+        self.report.add_banner([
+            '',
+            '--------------------------------------------------------------------------------',
+            f'- Read {source_name(source, "Category_Mapping.csv")}',
+            '- Identify category mappings associated with each classification.',
+            '- Check that each Classification_Mnemonic has entry in Category.csv',
+            '--------------------------------------------------------------------------------',
+            '',
+        ])
         self.category_mappings = dict()
-        with open(filename, newline='') as infile:
-            reader = csv.DictReader(infile, delimiter=',')
-            for row in reader:
-                classification_mnemonic = row['Classification_Mnemonic']
-                if not classification_mnemonic:
-                    continue
-                if classification_mnemonic not in self.classifications:
-                    print(f'ERROR: {classification_mnemonic}: Classification_Mnemonic specified '
-                          'in Category_Mapping.csv not found in Category.csv')
-                    self.classifications_with_errs.add(classification_mnemonic)
-                if classification_mnemonic not in self.category_mappings:
-                    self.category_mappings[classification_mnemonic] = list()
-                self.category_mappings[classification_mnemonic].append(row)
+        with self.phase('read Category_Mapping.csv'):
+            self.read_category_mappings(source)
 
-    def check_codebook_mnemonic(self):
-        print()
-        print('--------------------------------------------------------------------------------')
-        print('- Checking that same Codebook_Mnemonic is used for all rows in')
-        print('- Category_Mapping.csv with the same Classification_Mnemonic')
-        print('--------------------------------------------------------------------------------')
-        print()
-        for classification_mnemonic, mappings in self.category_mappings.items():
-            if classification_mnemonic not in self.classifications:
+    def read_classifications(self, source):
+        """Read Classification.csv and check for duplicate classifications."""
+        for row in read_source(source, Classification, self.read_records):
+            self.rows_read += 1
+            classification_mnemonic = row.Classification_Mnemonic
+            if not classification_mnemonic:
                 continue
-            classification = self.classifications[classification_mnemonic]
-            if not classification['Parent_Classification_Mnemonic'].strip():
-                codebook_mnemonic = mappings[0]['Codebook_Mnemonic']
-                for mapping in mappings:
-                    if mapping['Codebook_Mnemonic'] != codebook_mnemonic:
-                        print(f'ERROR: {classification_mnemonic}: different values of '
-                              'Codebook_Mnemonic specified for same Classification_Mnemonic')
-                        self.classifications_with_errs.add(classification_mnemonic)
-                        continue
+            if self.content_hashes is not None:
+                self.update_content_hash(classification_mnemonic, 'Classification.csv', row)
+            if classification_mnemonic in self.classifications:
+                self.add_finding(Finding('read_classification', classification_mnemonic,
+                                         'Duplicate Classification_Mnemonic in Category.csv'))
+                continue
+            self.classifications[classification_mnemonic] = row
 
-    def check_identity_mappings(self):
-        print()
-        print('--------------------------------------------------------------------------------')
-        print('- When Parent_Classification_Mnemonic is not specified in Classification.csv')
-        print('- check that the Source_Value equals the Target_Value for every category')
-        print('- in Category_Mapping.csv.')
-        print('--------------------------------------------------------------------------------')
-        print()
-        for classification_mnemonic, mappings in self.category_mappings.items():
-            if classification_mnemonic not in self.classifications:
+    def read_categories(self, source):
+        """Read Category.csv and check for unknown classifications and duplicate codes."""
+        for row in read_source(source, Category, self.read_records):
+            self.rows_read += 1
+            classification_mnemonic = row.Classification_Mnemonic
+            if not classification_mnemonic or self.loaded_classifications is not None and \
+                    classification_mnemonic not in self.loaded_classifications:
+                continue
+            if self.content_hashes is not None:
+                self.update_content_hash(classification_mnemonic, 'Category.csv', row)
+            if classification_mnemonic not in self.categories:
+                if classification_mnemonic not in self.classifications:
+                    self.add_finding(Finding(
+                        'read_category', classification_mnemonic,
+                        'Classification_Mnemonic specified in Category.csv not found in '
+                        'Classification.csv'))
+                self.categories[classification_mnemonic] = dict()
+                self.category_codes[classification_mnemonic] = CodeSet(self.code_dictionary)
+            code = row.Category_Code
+            if code in self.categories[classification_mnemonic]:
+                self.add_finding(Finding(
+                    'read_category', classification_mnemonic,
+                    f'duplicate code specified in Category.csv: {code}',
+                    codes={'duplicate_category_codes': {'count': 1, 'values': [code]}}))
+            self.categories[classification_mnemonic][code] = row
+            self.category_codes[classification_mnemonic].add(self.normalize(code))
+
+    def read_category_mappings(self, source):
+        """Read Category_Mapping.csv and check for unknown classifications."""
+        for row in read_source(source, CategoryMapping, self.read_records):
+            self.rows_read += 1
+            classification_mnemonic = row.Classification_Mnemonic
+            if not classification_mnemonic or self.loaded_classifications is not None and \
+                    classification_mnemonic not in self.loaded_classifications:
                 continue
-            classification = self.classifications[classification_mnemonic]
-            if not classification['Parent_Classification_Mnemonic'].strip():
-                num_differences = 0
-                for mapping in mappings:
-                    if self.normalize(mapping['Source_Value']) != \
-                            self.normalize(mapping['Target_Value']):
-                        num_differences += 1
-                if num_differences:
-                    print(f'ERROR: {classification_mnemonic}: different Source_Value and '
-                          f'Target_Value specified on {num_differences}/{len(mappings)} rows')
-                    self.classifications_with_errs.add(classification_mnemonic)
+            if self.content_hashes is not None:
+                self.update_content_hash(classification_mnemonic, 'Category_Mapping.csv', row)
+            if classification_mnemonic not in self.classifications:
+                self.add_finding(Finding(
+                    'read_category_mapping', classification_mnemonic,
+                    'Classification_Mnemonic specified in Category_Mapping.csv not found in '
+                    'Category.csv'))
+            self.add_mapping(row)
+
+    def apply_delta(self, classifications=(), categories=(), category_mappings=(),
+                    report=None):
+        """
+        Return a copy of the Checker with some classifications replaced, and the
+        classifications that must be checked again.
+
+        Each argument is a source of rows for the corresponding file accepted by read_source.
+        Every classification in the delta is replaced as a whole, so the delta must contain
+        all of its rows in each of the files. The classifications to check again are those
+        in the delta and their descendants.
+
+        The findings from reading the files for these classifications are added to report,
+        which defaults to a new Report. The Checker itself is not modified: codes that it has
+        not seen are added to a DeltaCodeDictionary and the copy has its own normalize cache,
+        so that they are released with the copy.
+        """
+        delta = copy.copy(self)
+        delta.profiler = None
+        delta.report = report if report is not None else Report()
+        delta.classifications_with_errs = set()
+        delta.num_findings = 0
+        delta.stopped = False
+        delta.parent_code_ranges = dict()
+        delta.composed_mappings = dict()
+        delta.composed_mapping_uses = dict()
+        delta.target_value_digests = dict()
+        delta.normalized_codes = dict()
+        delta.code_dictionary = DeltaCodeDictionary(self.code_dictionary)
+        delta.content_hashes = None
+        delta.sources = dict()
+        delta.read_items = dict()
+
+        rows = [list(read_source(source, record_type, self.read_records))
+                for source, record_type in [(classifications, Classification),
+                                            (categories, Category),
+                                            (category_mappings, CategoryMapping)]]
+        replaced = {row.Classification_Mnemonic for row in itertools.chain(*rows)} - {''}
+        for name in ['classifications', 'categories', 'category_codes', 'category_mappings']:
+            setattr(delta, name, {classification_mnemonic: value for classification_mnemonic, value
+                                  in getattr(self, name).items()
+                                  if classification_mnemonic not in replaced})
+
+        delta.read_classifications(rows[0])
+        if rows[0]:
+            delta.hierarchy = Hierarchy(delta.classifications)
+        affected = set(replaced)
+        pending = list(replaced)
+        while pending:
+            for child_mnemonic in delta.hierarchy.children.get(pending.pop(), []):
+                if child_mnemonic not in affected:
+                    affected.add(child_mnemonic)
+                    pending.append(child_mnemonic)
+
+        delta.add_cycle_findings(affected)
+        delta.read_categories(rows[1])
+        delta.read_category_mappings(rows[2])
+
+        # The findings from reading the rows of descendants are unchanged, apart from cycles.
+        for filename in INPUT_FILES:
+            for kind, item in self.read_items[filename]:
+                if kind == 'finding' and item.classification_mnemonic in affected and \
+                        item.classification_mnemonic not in replaced and \
+                        not item.message.startswith(CYCLE_MESSAGE):
+                    delta.add_finding(item)
+
+        for classification_mnemonic in replaced:
+            if classification_mnemonic in delta.category_codes:
+                delta.category_codes[classification_mnemonic].freeze()
+            if classification_mnemonic in delta.category_mappings:
+                delta.category_mappings[classification_mnemonic].target_values.freeze()
+        return delta, affected
+
+    def phase(self, name):
+        """Return a context manager recording a phase if profiling is enabled."""
+        if self.profiler is None:
+            return _unprofiled()
+        return self.profiler.phase(name, self)
+
+    def add_finding(self, finding):
+        """
+        Add a Finding to the report and record its classification as having errors.
+
+        If max_findings has already been reached then the Finding is dropped and stopped is
+        set instead, and StopReading is raised if a file is being read.
+        """
+        if self.max_findings_reached():
+            self.stopped = True
+            if self.reading:
+                raise StopReading()
+            return
+        self.report.add_finding(finding)
+        self.classifications_with_errs.add(finding.classification_mnemonic)
+        self.num_findings += 1
+
+    def add_mapping(self, mapping):
+        """Add a row from Category_Mapping.csv to the MappingSummary for its classification."""
+        classification_mnemonic = mapping.Classification_Mnemonic
+        summary = self.category_mappings.get(classification_mnemonic)
+        if summary is None:
+            summary = MappingSummary(mapping.Codebook_Mnemonic, self.code_dictionary)
+            self.category_mappings[classification_mnemonic] = summary
+        summary.num_rows += 1
+
+        # Normalized codes are calculated once here for use by all checks.
+        source_value = self.normalize(mapping.Source_Value)
+        target_value = self.normalize(mapping.Target_Value)
+        summary.target_values.add(target_value)
+        for hook in self.mapping_hooks:
+            hook(self, summary, mapping, source_value, target_value)
+
+    def run_checks(self, names=None, jobs=1, cache=None, classification_mnemonics=None):
+        """
+        Run all checks, or the checks with the given names, and add the results to the report.
+
+        All classifications are checked unless classification_mnemonics is specified. If the
+        Checker has a Sample then only the sampled classifications are checked, and the
+        coverage of the sample is reported after the results.
+
+        The checks are run together in a single traversal of the classifications, split across
+        jobs worker processes if jobs is greater than 1. The results are then reported in the
+        order of the checks, each preceded by its banner.
+
+        If a ResultCache is specified then cached results are used for classifications whose
+        result_key is unchanged, and only the remaining classifications are checked. A Sample
+        then chooses the classifications that have changed before all others.
+        """
+        with self.phase('run checks'):
+            self._run_checks(names, jobs, cache, classification_mnemonics)
+        if self.profiler is not None:
+            self.profiler.record_checks()
+
+    def _run_checks(self, names, jobs, cache, subset):
+        """Run checks for run_checks."""
+        if self.stopped:
+            self.add_stopped_banner()
+            return
+        checks = [check for check in self.checks if names is None or check.name in names]
+        check_classifications = [check.classifications(self) for check in checks]
+        if self.sample is not None:
+            if self.sampled is None:
+                changed = ()
+                if cache is not None:
+                    changed = self.changed_classifications(cache, names)
+                self.sampled = self.sample.choose(self.classifications, changed)
+            subset = self.sampled if subset is None else self.sampled.intersection(subset)
+        if subset is not None:
+            subset = set(subset)
+            check_classifications = [[classification_mnemonic for classification_mnemonic
+                                      in classifications if classification_mnemonic in subset]
+                                     for classifications in check_classifications]
+        classification_mnemonics = list(dict.fromkeys(itertools.chain(*check_classifications)))
+        # Check parents before their children. Classifications that are not in
+        # Classification.csv are checked last.
+        position = {classification_mnemonic: idx for idx, classification_mnemonic
+                    in enumerate(self.hierarchy.order)}
+        classification_mnemonics.sort(key=lambda classification_mnemonic: position.get(
+            classification_mnemonic, len(position)))
+
+        check_results = {check.name: dict() for check in checks}
+        if cache is not None:
+            if self.content_hashes is None:
+                raise ValueError('Checker must be created with hash_content set to use a cache')
+            result_keys = {classification_mnemonic: self.result_key(classification_mnemonic,
+                                                                    names)
+                           for classification_mnemonic in classification_mnemonics}
+            unchanged = dict()
+            for classification_mnemonic, result_key in result_keys.items():
+                results = cache.get(classification_mnemonic, result_key)
+                if results is not None:
+                    unchanged[classification_mnemonic] = results
+                    for name, findings in results.items():
+                        check_results[name][classification_mnemonic] = findings
+            classification_mnemonics = [classification_mnemonic for classification_mnemonic
+                                        in classification_mnemonics
+                                        if classification_mnemonic not in unchanged]
+
+        max_findings = None
+        if self.max_findings is not None:
+            max_findings = self.max_findings - self.num_findings
+        if jobs > 1 and len(classification_mnemonics) > 1:
+            new_results = self.check_in_parallel(classification_mnemonics, names, jobs,
+                                                 max_findings)
+        else:
+            new_results = self.check_classifications(classification_mnemonics, names,
+                                                     max_findings)
+        for name, results in new_results.items():
+            check_results[name].update(results)
+
+        if cache is not None:
+            for classification_mnemonic, result_key in result_keys.items():
+                cache.put(classification_mnemonic, result_key,
+                          {name: results[classification_mnemonic]
+                           for name, results in check_results.items()
+                           if classification_mnemonic in results})
+
+        for check, classifications in zip(checks, check_classifications):
+            results = check_results[check.name]
+            self.report.add_banner(check.banner)
+            for classification_mnemonic in classifications:
+                for finding in results.get(classification_mnemonic, []):
+                    self.add_finding(finding)
+        if self.sample is not None:
+            self.add_coverage_banner(cache, names)
+        if self.stopped:
+            self.add_stopped_banner()
+
+    def changed_classifications(self, cache, names=None):
+        """Return the checked classifications without results in cache for their result_key."""
+        if self.content_hashes is None:
+            raise ValueError('Checker must be created with hash_content set to use a cache')
+        checked = set(itertools.chain.from_iterable(
+            check.classifications(self) for check in self.checks
+            if names is None or check.name in names))
+        return [classification_mnemonic for classification_mnemonic in self.classifications
+                if classification_mnemonic in checked and cache.get(
+                    classification_mnemonic,
+                    self.result_key(classification_mnemonic, names)) is None]
+
+    def coverage(self, cache=None, names=None):
+        """
+        Return a dict of statistics describing how much of the input the Sample covers.
+
+        If a ResultCache is specified then the number of sampled classifications that have
+        changed since the results were cached is included.
+        """
+        sampled_with_errs = self.sampled.intersection(self.classifications_with_errs)
+        coverage = {
+            'sampled_classifications': len(self.sampled),
+            'classifications': len(self.classifications),
+            'sampled_classifications_with_errors': len(sampled_with_errs),
+            'seed': self.sample.seed,
+        }
+        if cache is not None:
+            changed = self.sampled.intersection(self.changed_classifications(cache, names))
+            coverage['changed_classifications'] = len(changed)
+        return coverage
+
+    def add_coverage_banner(self, cache=None, names=None):
+        """Add a banner describing the coverage of the Sample and record it in the report."""
+        coverage = self.coverage(cache, names)
+        self.report.coverage = coverage
+        num_classifications = coverage['classifications']
+        num_sampled = coverage['sampled_classifications']
+        num_with_errs = coverage['sampled_classifications_with_errors']
+        lines = [
+            '',
+            '--------------------------------------------------------------------------------',
+            f'- Checked a sample of {num_sampled} of {num_classifications} classifications '
+            f'({100 * num_sampled / max(num_classifications, 1):.1f}%) with seed '
+            f'{coverage["seed"]}.',
+            f'- Errors detected in {num_with_errs} of the sampled classifications '
+            f'({100 * num_with_errs / max(num_sampled, 1):.1f}%).',
+        ]
+        if 'changed_classifications' in coverage:
+            lines.append(f'- {coverage["changed_classifications"]} of the sampled '
+                         'classifications have changed since the previous run.')
+        lines.extend([
+            '- Classifications outside the sample may also have errors.',
+            '--------------------------------------------------------------------------------',
+            '',
+        ])
+        self.report.add_banner(lines)
+
+    def add_stopped_banner(self):
+        """Add a banner explaining that checking stopped after max_findings findings."""
+        self.report.add_banner([
+            '',
+            '--------------------------------------------------------------------------------',
+            f'- Stopped after {self.num_findings} errors. Other classifications may also have',
+            '- errors. Run without --fail-fast or --max-errors for the full report.',
+            '--------------------------------------------------------------------------------',
+            '',
+        ])
+
+    def check_classifications(self, classification_mnemonics, names=None, max_findings=None):
+        """
+        Run all checks, or the checks with the given names, on classification_mnemonics.
+
+        Returns a dict of the results of each check by name. The results of a check are a
+        dict of the Findings for each classification with errors. If max_findings is specified
+        then no more classifications are checked once more findings than that have been found.
+        """
+        checks = [check for check in self.checks if names is None or check.name in names]
+        check_classifications = [check.classifications(self) for check in checks]
+        check_results = {check.name: dict() for check in checks}
+        num_findings = 0
+        for classification_mnemonic in classification_mnemonics:
+            for check, classifications in zip(checks, check_classifications):
+                if classification_mnemonic not in classifications:
+                    continue
+                if self.profiler is not None:
+                    findings = self.profiler.call_check(check, self, classification_mnemonic)
+                else:
+                    findings = check.check(self, classification_mnemonic)
+                if findings:
+                    check_results[check.name][classification_mnemonic] = findings
+                    num_findings += len(findings)
+            if max_findings is not None and num_findings > max_findings:
+                break
+        return check_results
+
+    def update_content_hash(self, classification_mnemonic, filename, row):
+        """Add a row read from filename to the content hash of its classification."""
+        content_hashes = self.content_hashes[filename]
+        content_hash = content_hashes.get(classification_mnemonic)
+        if content_hash is None:
+            content_hash = hashlib.blake2b(digest_size=16)
+            content_hashes[classification_mnemonic] = content_hash
+        fields = ['\0' if value is None else value for value in row]
+        content_hash.update('\x1f'.join([filename] + fields).encode() + b'\x1e')
+
+    def result_key(self, classification_mnemonic, names=None):
+        """
+        Return a key identifying everything that the results of checking a classification
+        depend on.
+
+        This is the content hash of the rows of the classification, the Target_Value values
+        of its parent, the options of the Checker and the checks that are run.
+        """
+        key = hashlib.blake2b(digest_size=16)
+        key.update(repr((VERSION, self.ignore_leading_zeros, self.max_elements,
+                         sorted(names) if names is not None else None)).encode())
+        key.update(self.content_digest(classification_mnemonic))
+        parent_mnemonic = self.hierarchy.parent(classification_mnemonic)
+        if parent_mnemonic in self.category_mappings:
+            if parent_mnemonic not in self.target_value_digests:
+                target_values = sorted(self.category_mappings[parent_mnemonic].target_values)
+                self.target_value_digests[parent_mnemonic] = hashlib.blake2b(
+                    '\x1f'.join(target_values).encode(), digest_size=16).digest()
+            key.update(b'\x1d' + self.target_value_digests[parent_mnemonic])
+        if names is None or TransitiveMappingsCheck.name in names:
+            # Mappings are composed with the mappings of every ancestor.
+            for ancestor_mnemonic in self.hierarchy.ancestors(classification_mnemonic):
+                key.update(b'\x1c' + self.content_digest(ancestor_mnemonic))
+        return key.digest()
+
+    def content_digest(self, classification_mnemonic):
+        """Return a digest of the rows of a classification in all of the input files."""
+        digests = [content_hashes[classification_mnemonic].digest()
+                   if classification_mnemonic in content_hashes else b''
+                   for content_hashes in self.content_hashes.values()]
+        return hashlib.blake2b(b'\x1d'.join(digests), digest_size=16).digest()
+
+    def check_in_parallel(self, classification_mnemonics, names, jobs, max_findings=None):
+        """
+        Run check_classifications on partitions of classification_mnemonics in jobs processes.
+
+        Each process is sent a partition of the Checker holding only the data for its
+        classifications. Results are merged in the order of classification_mnemonics. If
+        max_findings is specified then partitions that have not started are cancelled once
+        more findings than that have been found.
+        """
+        # Use more partitions than processes so that large classifications are spread out.
+        num_partitions = min(jobs * 4, len(classification_mnemonics))
+        partition_size = -(-len(classification_mnemonics) // num_partitions)
+        partitions = [classification_mnemonics[idx:idx + partition_size]
+                      for idx in range(0, len(classification_mnemonics), partition_size)]
+
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = [executor.submit(_check_partition, self.partition(partition), partition,
+                                       names, max_findings)
+                       for partition in partitions]
+            check_results = dict()
+            num_findings = 0
+            for future in futures:
+                if future.cancelled():
                     continue
+                for name, results in future.result().items():
+                    check_results.setdefault(name, dict()).update(results)
+                    num_findings += sum(map(len, results.values()))
+                if max_findings is not None and num_findings > max_findings:
+                    for other_future in futures:
+                        other_future.cancel()
+        return check_results
+
+    def partition(self, classification_mnemonics, report=None):
+        """
+        Return a copy of the Checker holding only the data needed to check
+        classification_mnemonics.
+
+        Ancestors outside the partition are represented only by their Target_Value values and
+        the Target_Values of each Source_Value, and the CodeDictionary of the partition holds
+        only the codes of its CodeSets. Banners and findings of the partition are
+        added to report, which defaults to a new Report.
+        """
+        partition = copy.copy(self)
+        partition.profiler = None
+        # Only the data used by the checks is sent to each worker process.
+        partition.report = report if report is not None else Report()
+        partition.content_hashes = None
+        partition.read_items = dict()
+        partition.target_value_digests = dict()
+        partition.sources = dict()
+        partition.classifications_with_errs = set()
+        partition.num_findings = 0
+        partition.stopped = False
+        partition.normalized_codes = dict()
+        partition.parent_code_ranges = dict()
+        partition.composed_mappings = dict()
+        partition.composed_mapping_uses = dict()
+        partition.classifications = dict()
+        partition.categories = dict()
+        partition.category_codes = dict()
+        partition.category_mappings = dict()
+        for classification_mnemonic in classification_mnemonics:
+            for name in ['classifications', 'categories', 'category_codes', 'category_mappings']:
+                values = getattr(self, name)
+                if classification_mnemonic in values:
+                    getattr(partition, name)[classification_mnemonic] = \
+                        values[classification_mnemonic]
+
+        for classification_mnemonic in list(partition.classifications):
+            for ancestor_mnemonic in self.hierarchy.ancestors(classification_mnemonic):
+                if ancestor_mnemonic in partition.category_mappings or \
+                        ancestor_mnemonic not in self.category_mappings:
+                    continue
+                summary = self.category_mappings[ancestor_mnemonic]
+                ancestor_summary = MappingSummary(None, self.code_dictionary)
+                ancestor_summary.target_values = summary.target_values
+                ancestor_summary.source_value_targets = summary.source_value_targets
+                partition.category_mappings[ancestor_mnemonic] = ancestor_summary
+
+        # Encode the codes of the partition in a CodeDictionary of only those codes, keeping
+        # their order, so that the codes of other classifications are not sent to workers.
+        summaries = {classification_mnemonic: copy.copy(summary) for classification_mnemonic,
+                     summary in partition.category_mappings.items()}
+        code_sets = itertools.chain(partition.category_codes.values(),
+                                    [summary.target_values for summary in summaries.values()])
+        code_ids = sorted(set(itertools.chain.from_iterable(
+            code_set.ids() for code_set in code_sets)))
+        partition.code_dictionary = CodeDictionary()
+        for code_id in code_ids:
+            partition.code_dictionary.encode(self.code_dictionary.codes[code_id])
+        ids = {code_id: idx for idx, code_id in enumerate(code_ids)}
+        partition.category_codes = {
+            classification_mnemonic: code_set.recoded(partition.code_dictionary, ids)
+            for classification_mnemonic, code_set in partition.category_codes.items()}
+        for summary in summaries.values():
+            summary.target_values = summary.target_values.recoded(partition.code_dictionary, ids)
+        partition.category_mappings = summaries
+        return partition
+
+    def check_codebook_mnemonic(self):
+        self.run_checks([CodebookMnemonicCheck.name])
+
+    def check_identity_mappings(self):
+        self.run_checks([IdentityMappingsCheck.name])
 
     def check_category_consistency(self):
-        print()
-        print('--------------------------------------------------------------------------------')
-        print('- Check that for a given Classification_Mnemonic the set of Target_Value values')
-        print('- in Category_Mapping.csv is the same as the set of Category_Code values')
-        print('- in Classification.csv')
-        print('--------------------------------------------------------------------------------')
-        print()
-        for classification_mnemonic, mappings in self.category_mappings.items():
-            if classification_mnemonic not in self.categories:
-                continue
-            target_values = set()
-            classification_cats = self.categories[classification_mnemonic]
-            normalized_cats = {self.normalize(c) for c in classification_cats}
-            for mapping in mappings:
-                target_value = mapping['Target_Value']
-                target_values.add(self.normalize(target_value))
-
-            if target_values != normalized_cats:
-                print(f'ERROR: {classification_mnemonic}: different set of Category_Code values '
-                      'in Category.csv and Target_Value values in Category_Mapping.csv')
-                print(f'  - In Category.csv but not Category_Mapping.csv: '
-                      f'{self.limited_sorted_list(normalized_cats - target_values)}')
-                print(f'  - In Category_Mapping.csv but not Category.csv: '
-                      f'{self.limited_sorted_list(target_values - normalized_cats)}')
-                print()
-                self.classifications_with_errs.add(classification_mnemonic)
+        self.run_checks([CategoryConsistencyCheck.name])
 
     def check_unique_labels(self):
-        print()
-        print('--------------------------------------------------------------------------------')
-        print('- Checking for unique category labels in Category.csv on a per classification')
-        print('- basis')
-        print('--------------------------------------------------------------------------------')
-        print()
-        for classification_mnemonic, cats in self.categories.items():
-            label_ext = list()
-            label_int = list()
-            label_cy = list()
-            for category in cats.values():
-                label_ext.append(category['External_Category_Label_English'])
-                label_int.append(category['Internal_Category_Label_English'])
-                label_cy.append(category['External_Category_Label_Welsh'])
-            if len(label_ext) != len(set(label_ext)):
-                dupes = [l for l in set(label_ext) if label_ext.count(l) > 1]
-                print(f'ERROR: {classification_mnemonic}: multiple categories with the same '
-                      f'External_Category_Label_English: {dupes}')
-                self.classifications_with_errs.add(classification_mnemonic)
-            if len(label_int) != len(set(label_int)):
-                dupes = [l for l in set(label_int) if label_int.count(l) > 1]
-                print(f'ERROR: {classification_mnemonic}: multiple categories with the same '
-                      f'Internal_Category_Label_English: {dupes}')
-                self.classifications_with_errs.add(classification_mnemonic)
-            if len(label_cy) != len(set(label_cy)):
-                dupes = [l for l in set(label_cy) if label_cy.count(l) > 1]
-                print(f'ERROR: {classification_mnemonic} multiple categories with the same '
-                      f'External_Category_Label_Welsh: {dupes}')
-                self.classifications_with_errs.add(classification_mnemonic)
+        self.run_checks([UniqueLabelsCheck.name])
 
     def check_source_values(self):
-        print()
-        print('--------------------------------------------------------------------------------')
-        print('- Validate internal consistency of Source_Value entries for each')
-        print('- Classification_Mnemonic within Category_Mapping.csv')
-        print('- ')
-        print('- Category codes for a classification are identified as the set of Target_Value')
-        print('- values for a given Classification_Mnemonic. For every classification that has a')
-        print('- parent then:')
-        print('-   * Each Source_Value in the mapping must be a category code in the parent')
-        print('-   * There must be a single mapping record for each Source_Value')
-        print('-   * Every parent category code must be mapped')
-        print('--------------------------------------------------------------------------------')
-        print()
-        target_values = dict()
-        for classification_mnemonic, mappings in self.category_mappings.items():
-            target_values[classification_mnemonic] = set()
-            for mapping in mappings:
-                target_value = mapping['Target_Value']
-                normalized_target_value = self.normalize(target_value)
-                target_values[classification_mnemonic].add(normalized_target_value)
-
-        for classification_mnemonic, mappings in self.category_mappings.items():
-            if classification_mnemonic not in self.classifications:
-                continue
-            classification = self.classifications[classification_mnemonic]
-            parent_mnemonic = classification['Parent_Classification_Mnemonic'].strip()
-            if not parent_mnemonic:
-                continue
+        self.run_checks([SourceValuesCheck.name])
 
-            if parent_mnemonic not in target_values:
-                print(f'ERROR: {classification_mnemonic}:  Parent_Classification_Mnemonic is an '
-                      f'unknown classification: {parent_mnemonic} ')
-                print()
-                self.classifications_with_errs.add(classification_mnemonic)
-                continue
+    def check_consistent_labels(self):
+        self.run_checks([ConsistentLabelsCheck.name])
 
-            parent_target_values = target_values[parent_mnemonic]
-            source_values = list()
-            for mapping in mappings:
-                for source_value in self.parse_range(mapping['Source_Value']):
-                    source_values.append(source_value)
-
-            dupes = set([sv for sv in source_values if source_values.count(sv) > 1])
-            unmapped_codes = parent_target_values - set(source_values)
-            unknown_codes = set(source_values) - parent_target_values
-
-            if dupes or unknown_codes or unmapped_codes:
-                print(f'ERROR: {classification_mnemonic}: set of values for Source_Value do not '
-                      'match the set of values for Target_Values for the '
-                      f'Parent_Classification_Mnemonic: {parent_mnemonic}')
-                if dupes:
-                    print('  - Multiple entry for Source_Value:             '
-                          f'{self.limited_sorted_list(dupes)}')
-                if unknown_codes:
-                    print('  - Source_Value is not Target_Value of parent:  '
-                          f'{self.limited_sorted_list(unknown_codes)}')
-                if unmapped_codes:
-                    print('  - No entry for Target_Value of parent:         '
-                          f'{self.limited_sorted_list(unmapped_codes)}')
-                print()
-                self.classifications_with_errs.add(classification_mnemonic)
+    def parent_codes(self, parent_mnemonic):
+        """Return the Target_Value values of a parent classification as CodeRanges."""
+        if parent_mnemonic not in self.parent_code_ranges:
+            self.parent_code_ranges[parent_mnemonic] = CodeRanges.from_codes(
+                self.category_mappings[parent_mnemonic].target_values)
+        return self.parent_code_ranges[parent_mnemonic]
 
-    def check_consistent_labels(self):
-        print('--------------------------------------------------------------------------------')
-        print('- Checking for consistent labels between Category.csv and Category_Mapping.csv')
-        print('--------------------------------------------------------------------------------')
-        print()
+    def composed_mapping(self, classification_mnemonic):
+        """
+        Return a dict of the Target_Values of a classification that each code of its root
+        classification maps to, composing the mappings of the classification and each of
+        its ancestors.
 
-        for classification_mnemonic, mappings in self.category_mappings.items():
-            if classification_mnemonic not in self.categories:
-                continue
-            cats = self.categories[classification_mnemonic]
-            different_int_labels = set()
-            different_ext_labels = set()
-            different_welsh_labels = set()
-            for mapping in mappings:
-                if not cats.get(mapping['Target_Value'], None):
-                    continue
-                int_map_en = mapping['Internal_Mapping_Label_English']
-                int_cat_en = cats[mapping['Target_Value']]['Internal_Category_Label_English']
-                if int_map_en.strip() != int_cat_en.strip():
-                    different_int_labels.add((mapping['Target_Value'], int_cat_en, int_map_en))
-
-                ext_map_en = mapping['External_Mapping_Label_English']
-                ext_cat_en = cats[mapping['Target_Value']]['External_Category_Label_English']
-                if ext_map_en.strip() != ext_cat_en.strip():
-                    different_ext_labels.add((mapping['Target_Value'], ext_cat_en, ext_map_en))
-
-                ext_map_cy = mapping['External_Mapping_Label_Welsh']
-                ext_cat_cy = cats[mapping['Target_Value']]['External_Category_Label_Welsh']
-                if ext_map_cy.strip() != ext_cat_cy.strip():
-                    different_welsh_labels.add((mapping['Target_Value'], ext_cat_cy, ext_map_cy))
-
-            if different_int_labels or different_ext_labels or different_welsh_labels:
-                print(f'ERROR: {classification_mnemonic}: has different labels specified in '
-                      'Category.csv and Category_Mapping.csv')
-                if different_int_labels:
-                    print('  - Internal_Category_Label_English and Internal_Mapping_Label_English '
-                          f'differ for {len(different_int_labels)} category')
-                    for label in sorted(different_int_labels)[0:self.max_elements]:
-                        print(f'    - Category_Code: "{label[0]}" '
-                              f'Internal_Category_Label_English: "{label[1]}" '
-                              f'Internal_Mapping_Label_English: "{label[2]}"')
-                    if len(different_int_labels) > self.max_elements:
-                        print(f'    - PLUS {len(different_int_labels) - self.max_elements} others')
-
-                if different_ext_labels:
-                    print('  - External_Category_Label_English and External_Mapping_Label_English '
-                          f'differ for {len(different_ext_labels)} category')
-                    for label in sorted(different_ext_labels)[0:self.max_elements]:
-                        print(f'    - Category_Code: "{label[0]}" '
-                              f'External_Category_Label_English: "{label[1]}" '
-                              f'External_Mapping_Label_English: "{label[2]}"')
-                    if len(different_ext_labels) > self.max_elements:
-                        print(f'    - PLUS {len(different_ext_labels) - self.max_elements} others')
-
-                if different_welsh_labels:
-                    print('  - External_Category_Label_Welsh and External_Mapping_Label_Welsh '
-                          f'differ for {len(different_welsh_labels)} categories')
-                    for label in sorted(different_welsh_labels)[0:self.max_elements]:
-                        print(f'    - Category_Code: "{label[0]}" '
-                              f'External_Category_Label_Welsh: "{label[1]}" '
-                              f'External_Mapping_Label_Welsh: "{label[2]}"')
-                    if len(different_welsh_labels) > self.max_elements:
-                        print(f'    - PLUS {len(different_welsh_labels) - self.max_elements} '
-                              'others')
-                print()
-                self.classifications_with_errs.add(classification_mnemonic)
+        The Target_Values of each root code are a sorted tuple. The composed mappings of
+        classifications with children are cached until each child has used them, so each
+        mapping is composed once however many classifications derive from it.
+        Returns None if the ancestors of the classification do not lead to a root
+        classification in Category_Mapping.csv.
+        """
+        if classification_mnemonic in self.composed_mappings:
+            return self.composed_mappings[classification_mnemonic]
+
+        parent_mnemonic = self.hierarchy.parent(classification_mnemonic)
+        if classification_mnemonic not in self.category_mappings or \
+                classification_mnemonic not in self.hierarchy.depths or not parent_mnemonic or \
+                parent_mnemonic not in self.category_mappings:
+            return None
+
+        code_targets = self.source_value_lookup(classification_mnemonic, parent_mnemonic)
+        if not self.hierarchy.parent(parent_mnemonic):
+            # The codes of the root are the Target_Values of the parent.
+            composed = code_targets
+        else:
+            parent_composed = self.composed_mapping(parent_mnemonic)
+            if parent_composed is None:
+                return None
+            composed = dict()
+            for code, parent_codes in parent_composed.items():
+                if len(parent_codes) == 1:
+                    composed[code] = code_targets[parent_codes[0]]
+                else:
+                    composed[code] = tuple(sorted(set(itertools.chain.from_iterable(
+                        code_targets[parent_code] for parent_code in parent_codes))))
+            uses = self.composed_mapping_uses.get(parent_mnemonic, 0) - 1
+            self.composed_mapping_uses[parent_mnemonic] = uses
+            if uses <= 0:
+                self.composed_mappings.pop(parent_mnemonic, None)
+
+        children = self.hierarchy.children.get(classification_mnemonic)
+        if children:
+            self.composed_mappings[classification_mnemonic] = composed
+            self.composed_mapping_uses[classification_mnemonic] = len(children)
+        return composed
+
+    def source_value_lookup(self, classification_mnemonic, parent_mnemonic):
+        """
+        Return a dict of the sorted tuple of Target_Values that each Target_Value of the
+        parent is mapped to by the Source_Values of a classification.
+        """
+        # Single codes are looked up by code_key, or by code if they are not numeric. Ranges
+        # are matched to the parent codes of the same width in a sweep in order of value,
+        # so that they are not expanded.
+        singles = dict()
+        ranges = dict()
+        summary = self.category_mappings[classification_mnemonic]
+        for source_value, targets in summary.source_value_targets.items():
+            limits = list()
+            codes = list()
+            self.parse_range_limits(source_value, limits, codes)
+            for code in codes:
+                singles.setdefault(code, []).extend(targets)
+            for width, first, last in limits:
+                if first == last:
+                    singles.setdefault((width, first), []).extend(targets)
+                else:
+                    ranges.setdefault(width, []).append((first, last, targets))
+
+        code_targets = dict()
+        parent_keys = list()
+        for parent_code in self.category_mappings[parent_mnemonic].target_values:
+            key = code_key(parent_code)
+            if key is None:
+                code_targets[parent_code] = singles.get(parent_code, [])
+            else:
+                code_targets[parent_code] = list(singles.get(key, []))
+                if key[0] in ranges:
+                    parent_keys.append((key, parent_code))
+
+        parent_keys.sort()
+        for width, parent_codes in itertools.groupby(parent_keys, lambda item: item[0][0]):
+            width_ranges = sorted(ranges[width], key=itemgetter(0, 1))
+            idx = 0
+            active = list()
+            for (_, value), parent_code in parent_codes:
+                while idx < len(width_ranges) and width_ranges[idx][0] <= value:
+                    heapq.heappush(active, (width_ranges[idx][1], idx))
+                    idx += 1
+                while active and active[0][0] < value:
+                    heapq.heappop(active)
+                for _, range_idx in active:
+                    code_targets[parent_code].extend(width_ranges[range_idx][2])
+
+        return {parent_code: tuple(sorted(set(targets)))
+                for parent_code, targets in code_targets.items()}
 
     def normalize(self, code):
         """
@@ -345,11 +2531,21 @@ class Checker:
 
         Strip leading/trailing whitespace and ignore leading zeros if the code is a string
         representation of a number and args.zeros is set.
+
+        Normalized codes are interned and cached, so that each distinct code is only
+        normalized once and equal normalized codes are the same object.
         """
-        code = code.strip()
-        if self.ignore_leading_zeros and isnum(code):
-            code = str(int(code))
-        return code
+        self.normalize_calls += 1
+        normalized = self.normalized_codes.get(code)
+        if normalized is None:
+            self.normalize_misses += 1
+            normalized = code.strip()
+            if self.ignore_leading_zeros and isnum(normalized):
+                normalized = str(int(normalized))
+            normalized = sys.intern(normalized)
+            if len(self.normalized_codes) < NORMALIZE_CACHE_SIZE:
+                self.normalized_codes[code] = normalized
+        return normalized
 
     def parse_range(self, code_range):
         """
@@ -370,13 +2566,369 @@ class Checker:
             codes_in_range.extend(
                 [self.normalize(str(v).zfill(len(range_limits[0].strip()))) for v in
                  list(range(int(range_limits[0]), int(range_limits[1]) + 1))])
+        self.codes_expanded += len(codes_in_range)
         return codes_in_range
 
+    def parse_range_limits(self, code_range, ranges, codes):
+        """
+        Parse the normalized code_range without expanding it.
+
+        Numeric codes in the range are appended to ranges as (width, first, last) tuples
+        with the same meaning as the keys returned by code_key, and any other codes are
+        appended to codes. The codes described are those returned by parse_range.
+
+        e.g.
+        '1>4' appends (0, 1, 4) to ranges
+        '08>12' appends (2, 8, 9) and (0, 10, 12) to ranges if args.zeros is False
+        '08>12' appends (0, 8, 12) to ranges if args.zeros is True
+        """
+        range_limits = code_range.split('>', 1)
+        if len(range_limits) == 1:
+            key = code_key(code_range)
+            if key is None:
+                codes.append(code_range)
+            else:
+                ranges.append((key[0], key[1], key[1]))
+            return
+
+        first_code = range_limits[0].strip()
+        last_code = range_limits[1].strip()
+        if not (NUMERIC_CODE.fullmatch(first_code) and NUMERIC_CODE.fullmatch(last_code)):
+            # Signed or otherwise unusual range limits are expanded in full.
+            for code in self.parse_range(code_range):
+                key = code_key(code)
+                if key is None:
+                    codes.append(code)
+                else:
+                    ranges.append((key[0], key[1], key[1]))
+            return
+
+        first = int(first_code)
+        last = int(last_code)
+        width = 0 if self.ignore_leading_zeros else len(first_code)
+        if width > 1:
+            # Values with fewer digits than the first code are zero filled.
+            zero_filled_last = min(last, 10 ** (width - 1) - 1)
+            if first <= zero_filled_last:
+                ranges.append((width, first, zero_filled_last))
+                self.codes_in_ranges += zero_filled_last - first + 1
+            first = max(first, zero_filled_last + 1)
+        if first <= last:
+            ranges.append((0, first, last))
+            self.codes_in_ranges += last - first + 1
+
     def limited_sorted_list(self, values):
         """Return a string representation of values containing at most self.max_elements."""
         if len(values) <= self.max_elements:
             return f'{sorted(values)}'
-        return f'{sorted(values)[0:self.max_elements]} + {len(values)-self.max_elements} more'
+        if isinstance(values, CodeRanges):
+            # CodeRanges are iterated in sorted order so only expand what is printed.
+            first_values = list(itertools.islice(values, self.max_elements))
+        else:
+            first_values = sorted(values)[0:self.max_elements]
+        return f'{first_values} + {len(values)-self.max_elements} more'
+
+    def code_summary(self, values):
+        """Return a dict of the number of values and at most self.max_elements sorted values."""
+        if isinstance(values, CodeRanges):
+            first_values = list(itertools.islice(values, self.max_elements))
+        else:
+            first_values = sorted(values)[0:self.max_elements]
+        return {'count': len(values), 'values': first_values}
+
+
+class ResultCache:
+    """
+    Results of checks for each classification saved between runs.
+
+    Results are stored with the result_key of the classification, so that they are only used
+    if nothing that the checks depend on has changed. The results are saved by dump_state, so
+    they are only loaded if they were saved by the same user. If filename is None then
+    results are only held in memory.
+    """
+    def __init__(self, filename):
+        """Initialise ResultCache with any results previously saved in filename."""
+        self.filename = filename
+        self.entries = dict()
+        self.new_entries = dict()
+        if filename is None:
+            return
+        try:
+            with open(filename, 'rb') as infile:
+                saved, _ = load_state(infile.read())
+            if saved.get('version') == VERSION and saved.get('format') == CACHE_FORMAT:
+                self.entries = saved['entries']
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, KeyError):
+            pass
+
+    def get(self, classification_mnemonic, result_key):
+        """Return the cached results of a classification, or None if there are none."""
+        entry = self.entries.get(classification_mnemonic)
+        if entry is None or entry[0] != result_key:
+            return None
+        return entry[1]
+
+    def put(self, classification_mnemonic, result_key, results):
+        """Store the results of a classification to be saved."""
+        self.new_entries[classification_mnemonic] = (result_key, results)
+
+    def save(self):
+        """Save the results stored during this run, replacing any previous results."""
+        self.entries = self.new_entries
+        self.new_entries = dict()
+        if self.filename is None or not state_key_available('saving cached results'):
+            return
+        temp_filename = f'{self.filename}.tmp'
+        with open(temp_filename, 'wb') as outfile:
+            dump_state({'version': VERSION, 'format': CACHE_FORMAT, 'entries': self.entries},
+                       outfile)
+        os.replace(temp_filename, self.filename)
+
+
+class ValidationResult:
+    """
+    The result of validate.
+
+    findings is the list of Findings in the order that they are reported, and
+    classifications_with_errors is the sorted list of classifications with errors.
+    """
+    __slots__ = ('findings', 'classifications_with_errors')
+
+    def __init__(self, findings, classifications_with_errors):
+        """Initialise ValidationResult."""
+        self.findings = findings
+        self.classifications_with_errors = classifications_with_errors
+
+    @property
+    def passed(self):
+        """Return whether no errors were found."""
+        return not self.classifications_with_errors
+
+    def to_dict(self):
+        """Return the result as a dict suitable for serialization."""
+        return {
+            'result': 'PASS' if self.passed else 'FAIL',
+            'classifications_with_errors': self.classifications_with_errors,
+            'findings': [finding.to_dict() for finding in self.findings],
+        }
+
+
+def validate(input_dir=None, classifications=None, categories=None, category_mappings=None,
+             ignore_leading_zeros=False, max_elements=10, checks=None, reader='auto',
+             max_errors=None):
+    """
+    Check structural metadata and return a ValidationResult, without writing any output.
+
+    classifications, categories and category_mappings are the contents of Classification.csv,
+    Category.csv and Category_Mapping.csv as any source accepted by read_source: a filename,
+    an open file or an iterable of rows. Those that are not specified are read from input_dir.
+
+    checks is a list of the names of the checks to run and defaults to all CHECKS. If
+    max_errors is specified then checking stops once that many errors have been found. Errors
+    reading the sources are raised as OSError, KeyError for missing columns, or csv.Error.
+    """
+    if checks is not None:
+        unknown = set(checks) - {check.name for check in CHECKS}
+        if unknown:
+            raise ValueError(f'unknown checks: {", ".join(sorted(unknown))}')
+    sources = {filename: source for filename, source
+               in zip(INPUT_FILES, [classifications, categories, category_mappings])
+               if source is not None}
+    if input_dir is None and len(sources) < len(INPUT_FILES):
+        raise ValueError('input_dir is required unless all three sources are specified')
+
+    checker = Checker(input_dir, ignore_leading_zeros, max_elements,
+                      checks=selected_checks(checks), reader=reader, sources=sources,
+                      max_findings=max_errors)
+    checker.run_checks()
+    return ValidationResult(checker.report.findings(), sorted(checker.classifications_with_errs))
+
+
+class SavedHash(bytes):
+    """The digest of a content hash restored from a Snapshot."""
+    def digest(self):
+        """Return the digest, as for a hashlib hash."""
+        return bytes(self)
+
+
+class Snapshot:
+    """
+    The parsed contents of the input files saved between runs.
+
+    The file holds a pickled header followed by the pickled state of a Checker after loading
+    the input files, each written by dump_state so that they are only unpickled if they were
+    saved by the same user. The header holds the options of the Checker and the size, modification
+    time and hash of each input file, so that the state is only used if the options and
+    files are unchanged. A file whose size or modification time has changed is hashed to
+    check whether its contents have changed. The file is memory mapped, so the state is not
+    read at all unless the header matches.
+    """
+    # Attributes of the Checker set by loading the input files.
+    ATTRIBUTES = ['classifications', 'hierarchy', 'categories', 'category_codes',
+                  'category_mappings', 'code_dictionary', 'read_items']
+
+    def __init__(self, filename):
+        """Initialise Snapshot."""
+        self.filename = filename
+
+    @staticmethod
+    def options(checker):
+        """Return the options of checker that the loaded state depends on."""
+        return (VERSION, SNAPSHOT_FORMAT, checker.ignore_leading_zeros,
+                [check.name for check in checker.checks])
+
+    @staticmethod
+    def input_files(checker):
+        """Return the name and path of the file from which each input file is read."""
+        files = list()
+        for filename in INPUT_FILES:
+            source = checker.source(filename)
+            if isinstance(source, ZipMember):
+                files.append((source_name(source, filename), source.archive))
+            elif isinstance(source, (str, os.PathLike)):
+                files.append((source_name(source, filename), os.fspath(source)))
+            else:
+                return None
+        return files
+
+    def restore(self, checker):
+        """Restore the loaded state of checker and return True if the snapshot is valid."""
+        files = self.input_files(checker)
+        if files is None:
+            return False
+        try:
+            with open(self.filename, 'rb') as infile, \
+                    mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                header, offset = load_state(data)
+                if header['options'] != self.options(checker) or \
+                        [name for name, _, _ in header['files']] != [name for name, _ in files]:
+                    return False
+                # Content hashes are only saved if the Checker that saved them needed them.
+                if checker.content_hashes is not None and not header['content_hashes']:
+                    return False
+                signatures = list()
+                for (_, signature, digest), (_, path) in zip(header['files'], files):
+                    signatures.append(file_signature(path))
+                    if signatures[-1] != signature and file_digest(path) != digest:
+                        return False
+                state, _ = load_state(data, offset)
+        except (OSError, ValueError, EOFError, pickle.UnpicklingError, AttributeError,
+                KeyError):
+            return False
+
+        for name in self.ATTRIBUTES:
+            setattr(checker, name, state[name])
+        if checker.content_hashes is not None:
+            checker.content_hashes = {filename: {classification_mnemonic: SavedHash(digest)
+                                                 for classification_mnemonic, digest
+                                                 in digests.items()}
+                                      for filename, digests in state['content_hashes'].items()}
+        checker.file_signatures = dict(zip(INPUT_FILES, signatures))
+        return True
+
+    def save(self, checker):
+        """Save the loaded state of checker."""
+        files = self.input_files(checker)
+        if files is None or not state_key_available('saving the snapshot'):
+            return
+        header = {
+            'options': self.options(checker),
+            'content_hashes': checker.content_hashes is not None,
+            'files': [(name, checker.file_signatures[filename], file_digest(path))
+                      for filename, (name, path) in zip(INPUT_FILES, files)],
+        }
+        state = {name: getattr(checker, name) for name in self.ATTRIBUTES}
+        if checker.content_hashes is not None:
+            state['content_hashes'] = {filename: {classification_mnemonic: content_hash.digest()
+                                                  for classification_mnemonic, content_hash
+                                                  in content_hashes.items()}
+                                       for filename, content_hashes
+                                       in checker.content_hashes.items()}
+        temp_filename = f'{self.filename}.tmp'
+        with open(temp_filename, 'wb') as outfile:
+            dump_state(header, outfile)
+            dump_state(state, outfile)
+        os.replace(temp_filename, self.filename)
+
+
+def _check_partition(checker, classification_mnemonics, names, max_findings=None):
+    """Run checks on a partition of the Checker in a worker process."""
+    return checker.check_classifications(classification_mnemonics, names, max_findings)
+
+
+def _check_directory(input_dir, args):
+    """
+    Check the input files in input_dir in a worker process of a batch.
+
+    Return the report, the classifications with errors and a description of why the input
+    files could not be read, or None if they were read.
+    """
+    report = Report(input_dir)
+    try:
+        snapshot = Snapshot(state_filename(input_dir, SNAPSHOT_FILENAME)) \
+            if args.snapshot else None
+        checker = Checker(input_dir, args.zeros, args.max_elements,
+                          checks=selected_checks(args.checks), hash_content=args.cache,
+                          report=report, reader=args.reader, snapshot=snapshot,
+                          max_findings=args.max_errors, sample=args.sample)
+        cache = ResultCache(state_filename(input_dir, CACHE_FILENAME)) if args.cache else None
+        checker.run_checks(args.checks, cache=cache)
+        if cache is not None and args.sample is None:
+            cache.save()
+    except (OSError, ValueError, KeyError, csv.Error) as error:
+        return report, [], f'could not read input files: {error}'
+    return report, sorted(checker.classifications_with_errs), None
+
+
+def directory_digest(input_dir):
+    """Return a digest of the contents of the input files in input_dir, or None if unreadable."""
+    digest = hashlib.blake2b()
+    filenames = list()
+    for filename in INPUT_FILES:
+        source = input_source(input_dir, filename)
+        source = source.archive if isinstance(source, ZipMember) else source
+        if source not in filenames:
+            filenames.append(source)
+    try:
+        for filename in filenames:
+            digest.update(os.path.splitext(filename)[1].encode() + b'\0')
+            digest.update(file_digest(filename))
+    except OSError:
+        return None
+    return digest.digest()
+
+
+def read_manifest(filename):
+    """
+    Return the input directories listed in a manifest file.
+
+    Each line contains one directory. Blank lines and lines starting with # are ignored and
+    relative directories are relative to the directory containing the manifest.
+    """
+    base_dir = os.path.dirname(filename)
+    with open(filename, encoding='utf-8') as infile:
+        lines = [line.strip() for line in infile]
+    return [os.path.join(base_dir, line) for line in lines if line and not line.startswith('#')]
+
+
+def sample_size(value):
+    """
+    Parse the value of --sample as a number of classifications, or as a proportion of them if
+    it has a decimal point or is less than 1.
+    """
+    try:
+        size = int(value)
+    except ValueError:
+        try:
+            size = float(value)
+        except ValueError:
+            raise ArgumentTypeError(f'invalid sample size: {value}')
+    if size <= 0:
+        raise ArgumentTypeError('sample size must be greater than 0')
+    if isinstance(size, float) and size > 1:
+        raise ArgumentTypeError('a sample proportion must be at most 1, and a number of '
+                                f'classifications must be an integer: {value}')
+    return size
 
 
 def main():
@@ -389,44 +2941,269 @@ def main():
 
     parser.add_argument('-i', '--input-dir',
                         type=str,
-                        required=True,
-                        help='Input directory containing CSV files to check')
+                        action='append',
+                        default=[],
+                        help='Input directory containing CSV files to check. May be given more '
+                             'than once to check several input directories in one batch')
+
+    parser.add_argument('--manifest',
+                        type=str,
+                        help='File listing input directories to check in one batch, one per '
+                             'line')
 
     parser.add_argument('-m', '--max-elements',
                         type=int,
                         default=10,
                         help='Maximum number of elements to output in length limited lists')
 
+    parser.add_argument('-j', '--jobs',
+                        type=int,
+                        default=1,
+                        help='Number of worker processes used to run the checks')
+
+    parser.add_argument('--cache',
+                        action='store_true',
+                        help=f'Cache results in {CACHE_FILENAME} in the input directory and only '
+                             'check classifications that have changed since the previous run')
+
+    parser.add_argument('--snapshot',
+                        action='store_true',
+                        help=f'Save the parsed input files in {SNAPSHOT_FILENAME} in the input '
+                             'directory and load them from it on later runs if the files have '
+                             'not changed')
+
+    parser.add_argument('--checks',
+                        nargs='+',
+                        choices=[check.name for check in CHECKS],
+                        metavar='CHECK',
+                        help='Only run the named checks, from: '
+                             f'{", ".join(check.name for check in CHECKS)}')
+
+    parser.add_argument('--max-errors',
+                        type=int,
+                        metavar='N',
+                        help='Stop reading and checking once N errors have been found. The '
+                             'errors reported are a subset of those of a full run')
+
+    parser.add_argument('--fail-fast',
+                        action='store_true',
+                        help='Stop at the first error found. Equivalent to --max-errors 1')
+
+    parser.add_argument('--sample',
+                        type=sample_size,
+                        metavar='SIZE',
+                        help='Only check a random sample of SIZE classifications if SIZE is '
+                             'an integer, or of that proportion of them if SIZE has a decimal '
+                             'point, such as 0.05 or 1.0. Every row is parsed, but only the '
+                             'rows of the sampled classifications and their ancestors are '
+                             'kept. With '
+                             '--cache, classifications that have changed since the previous '
+                             'run are sampled first and the cache is not updated')
+
+    parser.add_argument('--seed',
+                        type=int,
+                        default=0,
+                        help='Seed choosing the classifications checked with --sample')
+
+    parser.add_argument('-f', '--format',
+                        choices=sorted(RENDERERS),
+                        default='text',
+                        help='Format of the report written to stdout')
+
+    parser.add_argument('--profile',
+                        type=str,
+                        metavar='PROFILE_JSON',
+                        help='Record the time, counters and peak memory of each phase, print a '
+                             'summary to stderr and save them as JSON to PROFILE_JSON')
+
+    parser.add_argument('--cprofile',
+                        type=str,
+                        metavar='PSTATS_FILE',
+                        help='Run under cProfile and save the statistics to PSTATS_FILE for '
+                             'reading with pstats')
+
+    parser.add_argument('--watch',
+                        action='store_true',
+                        help='Keep running and check the input files again whenever they change. '
+                             'Only files that have changed are read again and only '
+                             'classifications that have changed are checked again')
+
+    parser.add_argument('--interval',
+                        type=float,
+                        default=1.0,
+                        help='Number of seconds between checks for changed files with --watch')
+
+    parser.add_argument('--reader',
+                        choices=['auto'] + sorted(READERS),
+                        default='auto',
+                        help='Library used to read the CSV files. auto uses pyarrow if it is '
+                             'installed and otherwise the csv module')
+
     args = parser.parse_args()
+    if args.reader == 'pyarrow' and pyarrow is None:
+        parser.error('--reader pyarrow requires pyarrow to be installed')
+    if args.fail_fast:
+        args.max_errors = 1
+    if args.max_errors is not None:
+        if args.max_errors < 1:
+            parser.error('--max-errors must be at least 1')
+        if args.cache or args.watch:
+            parser.error('--fail-fast and --max-errors cannot be used with --cache or --watch')
+    if args.sample is not None:
+        if args.watch:
+            parser.error('--sample cannot be used with --watch')
+        args.sample = Sample(args.sample, args.seed)
+
+    input_dirs = args.input_dir
+    if args.manifest:
+        try:
+            input_dirs = input_dirs + read_manifest(args.manifest)
+        except OSError as error:
+            parser.error(f'could not read manifest: {error}')
+    if not input_dirs:
+        parser.error('an input directory is required, using -i/--input-dir or --manifest')
+    if len(input_dirs) > 1:
+        if args.watch or args.profile or args.cprofile:
+            parser.error('--watch, --profile and --cprofile can only be used with a single '
+                         'input directory')
+        return run_batch(args, input_dirs)
+    args.input_dir = input_dirs[0]
+
+    if args.cprofile:
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(run, args)
+        finally:
+            profile.dump_stats(args.cprofile)
+    return run(args)
+
+
+def header_banner():
+    """Return the banner printed at the start of the report."""
+    return [
+        '--------------------------------------------------------------------------------',
+        f'- {Path(__file__).name} {VERSION} {datetime.now().strftime("%d/%m/%Y %H:%M:%S")}',
+        '-',
+        '- This script performs basic checks on the internal consistency of structural',
+        '- metadata for the 2021 census as stored in CSV format.',
+        '--------------------------------------------------------------------------------',
+        '',
+    ]
+
+
+def run(args):
+    """Check the structural metadata as specified by the parsed command line args."""
+    profiler = Profiler() if args.profile else None
+
+    report = Report()
+    report.add_banner(header_banner())
+
+    snapshot = None
+    if args.snapshot:
+        snapshot = Snapshot(state_filename(args.input_dir, SNAPSHOT_FILENAME))
+    checker = Checker(args.input_dir, args.zeros, args.max_elements,
+                      checks=selected_checks(args.checks), hash_content=args.cache or args.watch,
+                      report=report, profiler=profiler, reader=args.reader, snapshot=snapshot,
+                      max_findings=args.max_errors, sample=args.sample)
+    cache = None
+    if args.cache:
+        cache = ResultCache(state_filename(args.input_dir, CACHE_FILENAME))
+    elif args.watch:
+        cache = ResultCache(None)
+    checker.run_checks(args.checks, jobs=args.jobs, cache=cache)
+    if cache is not None and args.sample is None:
+        # The results of a sample would replace the results of every other classification.
+        cache.save()
+
+    renderer = RENDERERS[args.format](BufferedWriter(sys.stdout))
+    with checker.phase('render report'):
+        renderer.render(report, checker.classifications_with_errs)
+
+    if profiler is not None:
+        for line in profiler.summary():
+            print(line, file=sys.stderr)
+        profiler.save(args.profile)
+
+    if args.watch:
+        return watch(args, checker, cache, renderer)
+    return -1 if checker.classifications_with_errs else 0
+
+
+def watch(args, checker, cache, renderer):
+    """
+    Check the input files again whenever they change, until interrupted.
+
+    Changed files are read again by Checker.reload and the results of classifications that
+    have not changed are taken from cache. The full report is written after each check.
+    """
+    failed_signatures = None
+    try:
+        while True:
+            time.sleep(args.interval)
+            if not checker.changed_files():
+                continue
+            signatures = [checker.source_signature(checker.source(filename))
+                          for filename in INPUT_FILES]
+            if signatures == failed_signatures:
+                continue
+
+            report = Report()
+            report.add_banner(header_banner())
+            try:
+                checker.reload(report)
+            except (OSError, ValueError, KeyError, csv.Error) as error:
+                # Files may be read part way through being saved, so wait for them to change.
+                print(f'ERROR: could not read files in {args.input_dir}: {error}',
+                      file=sys.stderr)
+                failed_signatures = signatures
+                continue
+            failed_signatures = None
+            checker.run_checks(args.checks, jobs=args.jobs, cache=cache)
+            cache.save()
+            renderer.render(report, checker.classifications_with_errs)
+    except KeyboardInterrupt:
+        return -1 if checker.classifications_with_errs else 0
+
+
+def run_batch(args, input_dirs):
+    """
+    Check several input directories and write a report for each followed by a summary.
+
+    Directories whose input files have identical contents are only checked once. Directories
+    are checked in args.jobs worker processes.
+    """
+    unique_dirs = dict()
+    digests = dict()
+    for input_dir in input_dirs:
+        digest = directory_digest(input_dir)
+        digests[input_dir] = digest
+        unique_dirs.setdefault(input_dir if digest is None else digest, input_dir)
+
+    checked_dirs = list(unique_dirs.values())
+    if args.jobs > 1 and len(checked_dirs) > 1:
+        with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+            outcomes = list(executor.map(_check_directory, checked_dirs,
+                                         itertools.repeat(args)))
+    else:
+        outcomes = [_check_directory(input_dir, args) for input_dir in checked_dirs]
+    outcomes = dict(zip(checked_dirs, outcomes))
+
+    renderer = RENDERERS[args.format](BufferedWriter(sys.stdout))
+    renderer.render_banner(header_banner())
+    results = list()
+    for input_dir in input_dirs:
+        digest = digests[input_dir]
+        checked_dir = unique_dirs[input_dir if digest is None else digest]
+        report, classifications_with_errs, error = outcomes[checked_dir]
+        if error is None:
+            if checked_dir != input_dir:
+                report = report.relocated(input_dir)
+            renderer.render(report, classifications_with_errs)
+        results.append((input_dir, classifications_with_errs, error))
+    renderer.render_summary(results)
 
-    print('--------------------------------------------------------------------------------')
-    print(f'- {Path(__file__).name} {VERSION} {datetime.now().strftime("%d/%m/%Y %H:%M:%S")}')
-    print('-')
-    print('- This script performs basic checks on the internal consistency of structural')
-    print('- metadata for the 2021 census as stored in CSV format.')
-    print('--------------------------------------------------------------------------------')
-    print()
-
-    checker = Checker(args.input_dir, args.zeros, args.max_elements)
-    checker.check_codebook_mnemonic()
-    checker.check_identity_mappings()
-    checker.check_category_consistency()
-    checker.check_unique_labels()
-    checker.check_source_values()
-    checker.check_consistent_labels()
-
-    if checker.classifications_with_errs:
-        print('--------------------------------------------------------------------------------')
-        print(f'FAIL: Errors detected in {len(checker.classifications_with_errs)} '
-              'classifications:')
-        print(f'{sorted(checker.classifications_with_errs)}')
-        print('--------------------------------------------------------------------------------')
-        return -1
-
-    print('--------------------------------------------------------------------------------')
-    print(f'PASS: No errors detected')
-    print('--------------------------------------------------------------------------------')
-    return 0
+    failed = any(errs or error is not None for _, errs, error in results)
+    return -1 if failed else 0
 
 
 if __name__ == '__main__':
@@ -0,0 +1,210 @@
+"""
+Generate synthetic structural metadata for testing and benchmarking.
+
+Writes Classification.csv, Category.csv and Category_Mapping.csv to an output directory. Each
+root classification is the start of a chain of derived classifications, each of which groups
+the categories of its parent. Errors can be injected into a proportion of the classifications
+so that the output of the checks can be verified at scale.
+"""
+import os
+import sys
+import csv
+import random
+from argparse import ArgumentParser
+
+
+CLASSIFICATION_HEADER = ['Classification_Mnemonic', 'Parent_Classification_Mnemonic']
+CATEGORY_HEADER = ['Classification_Mnemonic', 'Category_Code', 'Internal_Category_Label_English',
+                   'External_Category_Label_English', 'External_Category_Label_Welsh']
+MAPPING_HEADER = ['Classification_Mnemonic', 'Codebook_Mnemonic', 'Source_Value', 'Target_Value',
+                  'Internal_Mapping_Label_English', 'External_Mapping_Label_English',
+                  'External_Mapping_Label_Welsh']
+
+# Kinds of error that can be injected into any classification, and into derived classifications.
+ERROR_KINDS = ['duplicate_code', 'duplicate_label', 'inconsistent_label', 'unmapped_category']
+DERIVED_ERROR_KINDS = ERROR_KINDS + ['unknown_source']
+
+
+def write_csv(filename, header, rows):
+    """Write rows to filename as CSV."""
+    with open(filename, 'w', newline='') as outfile:
+        writer = csv.writer(outfile)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+
+def category_labels(classification_mnemonic, code):
+    """Return the internal, external and Welsh labels of a category."""
+    return [f'Category {code} of {classification_mnemonic}', f'Category {code}',
+            f'Categori {code}']
+
+
+def inject_error(kind, classification_mnemonic, categories, mappings):
+    """Modify the category and mapping rows of a classification to contain an error of kind."""
+    if kind == 'duplicate_code':
+        categories.append(list(categories[0]))
+    elif kind == 'duplicate_label':
+        categories[1][3] = categories[0][3]
+    elif kind == 'inconsistent_label':
+        mappings[-1][5] = f'{mappings[-1][5]} (changed)'
+    elif kind == 'unmapped_category':
+        categories.append([classification_mnemonic, 'UNMAPPED',
+                           *category_labels(classification_mnemonic, 'UNMAPPED')])
+    elif kind == 'unknown_source':
+        mappings.append(mappings[-1][0:2] + ['UNKNOWN'] + mappings[-1][3:])
+    else:
+        raise ValueError(f'unknown error kind: {kind}')
+
+
+def generate(output_dir, num_classifications=100, depth=2, num_categories=100, group_size=4,
+             range_fraction=0.5, zero_padded_fraction=0.0, error_fraction=0.0, seed=0,
+             unique_codes=False):
+    """
+    Generate structural metadata in output_dir and return a dict describing it.
+
+    - num_classifications root classifications are generated, each with num_categories
+      categories.
+    - Each root has a chain of depth - 1 derived classifications. Each derived classification
+      groups the categories of its parent into groups of group_size.
+    - range_fraction is the proportion of groups whose Source_Value is written as a range
+      instead of a row for each code.
+    - zero_padded_fraction is the proportion of root classifications whose codes have leading
+      zeros.
+    - error_fraction is the proportion of classifications into which an error is injected.
+    - If unique_codes is set then the codes of each classification are numbered from a
+      different start, so that no two classifications share a code.
+
+    The returned dict contains the number of rows in each file and the kind of error injected
+    into each classification.
+    """
+    rng = random.Random(seed)
+    classifications = list()
+    categories = list()
+    mappings = list()
+    errors = dict()
+    for idx in range(num_classifications):
+        parent_mnemonic = ''
+        parent_codes = None
+        num_codes = num_categories
+        width = len(str(num_categories)) + 1 if rng.random() < zero_padded_fraction else 0
+        for level in range(depth):
+            classification_mnemonic = f'ROOT_{idx}' if level == 0 else f'ROOT_{idx}_LEVEL_{level}'
+            start = (idx * depth + level) * num_categories if unique_codes else 0
+            codes = [str(code).zfill(width) for code in range(start + 1, start + num_codes + 1)]
+            classification_categories = [[classification_mnemonic, code,
+                                          *category_labels(classification_mnemonic, code)]
+                                         for code in codes]
+            classification_mappings = list()
+            if parent_codes is None:
+                for row in classification_categories:
+                    classification_mappings.append([classification_mnemonic,
+                                                    classification_mnemonic, row[1]] + row[1:])
+            else:
+                for row, first in zip(classification_categories,
+                                      range(0, len(parent_codes), group_size)):
+                    group = parent_codes[first:first + group_size]
+                    if len(group) > 1 and rng.random() < range_fraction:
+                        source_values = [f'{group[0]}>{group[-1]}']
+                    else:
+                        source_values = group
+                    classification_mappings.extend([[classification_mnemonic,
+                                                     classification_mnemonic, source_value,
+                                                     *row[1:]] for source_value in source_values])
+
+            if rng.random() < error_fraction:
+                kinds = ERROR_KINDS if parent_codes is None else DERIVED_ERROR_KINDS
+                if len(codes) < 2:
+                    kinds = [kind for kind in kinds if kind != 'duplicate_label']
+                kind = rng.choice(kinds)
+                inject_error(kind, classification_mnemonic, classification_categories,
+                             classification_mappings)
+                errors[classification_mnemonic] = kind
+
+            classifications.append([classification_mnemonic, parent_mnemonic])
+            categories.extend(classification_categories)
+            mappings.extend(classification_mappings)
+            parent_mnemonic = classification_mnemonic
+            parent_codes = codes
+            num_codes = -(-num_codes // group_size)
+            width = 0
+
+    write_csv(os.path.join(output_dir, 'Classification.csv'), CLASSIFICATION_HEADER,
+              classifications)
+    write_csv(os.path.join(output_dir, 'Category.csv'), CATEGORY_HEADER, categories)
+    write_csv(os.path.join(output_dir, 'Category_Mapping.csv'), MAPPING_HEADER, mappings)
+    return {
+        'classifications': len(classifications),
+        'categories': len(categories),
+        'category_mappings': len(mappings),
+        'errors': errors,
+    }
+
+
+def main():
+    """Generate synthetic structural metadata."""
+    parser = ArgumentParser(description='Generate synthetic structural metadata')
+
+    parser.add_argument('-o', '--output-dir',
+                        type=str,
+                        required=True,
+                        help='Output directory for the generated CSV files')
+
+    parser.add_argument('-c', '--num-classifications',
+                        type=int,
+                        default=100,
+                        help='Number of root classifications')
+
+    parser.add_argument('-d', '--depth',
+                        type=int,
+                        default=2,
+                        help='Number of levels in the hierarchy of each root classification')
+
+    parser.add_argument('-k', '--num-categories',
+                        type=int,
+                        default=100,
+                        help='Number of categories in each root classification')
+
+    parser.add_argument('-g', '--group-size',
+                        type=int,
+                        default=4,
+                        help='Number of parent categories grouped into each derived category')
+
+    parser.add_argument('--range-fraction',
+                        type=float,
+                        default=0.5,
+                        help='Proportion of groups with a range Source_Value')
+
+    parser.add_argument('--zero-padded-fraction',
+                        type=float,
+                        default=0.0,
+                        help='Proportion of root classifications with leading zeros in codes')
+
+    parser.add_argument('--error-fraction',
+                        type=float,
+                        default=0.0,
+                        help='Proportion of classifications into which an error is injected')
+
+    parser.add_argument('--unique-codes',
+                        action='store_true',
+                        help='Give each classification codes that no other classification uses')
+
+    parser.add_argument('-s', '--seed',
+                        type=int,
+                        default=0,
+                        help='Seed for the random number generator')
+
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    stats = generate(args.output_dir, args.num_classifications, args.depth,
+                     args.num_categories, args.group_size, args.range_fraction,
+                     args.zero_padded_fraction, args.error_fraction, args.seed,
+                     args.unique_codes)
+    print(f'Generated {stats["classifications"]} classifications, {stats["categories"]} '
+          f'categories and {stats["category_mappings"]} category mappings in {args.output_dir}')
+    print(f'Injected errors into {len(stats["errors"])} classifications')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,16 +1,81 @@
+import os
+import argparse
+import bz2
+import csv
+import gzip
+import json
+import lzma
+import shutil
+import tempfile
+import threading
+import urllib.error
+import urllib.request
+import zipfile
 import unittest.mock
 import unittest
 from io import StringIO
 from datetime import datetime
 import check_structural_metadata
+import generate_metadata
+import validation_server
+
+
+state_key_dir = None
+state_key_patcher = None
+
+
+def setUpModule():
+    """Create the key that authenticates saved state in a temporary directory."""
+    global state_key_dir, state_key_patcher
+    state_key_dir = tempfile.TemporaryDirectory()
+    state_key_patcher = unittest.mock.patch(
+        'check_structural_metadata.STATE_KEY_FILENAME',
+        os.path.join(state_key_dir.name, '.check_structural_metadata.key'))
+    state_key_patcher.start()
+
+
+def tearDownModule():
+    state_key_patcher.stop()
+    state_key_dir.cleanup()
+
+
+@unittest.mock.patch('check_structural_metadata.datetime')
+def run_main(argv, mock_datetime):
+    """
+    Run main with the command line arguments argv on 1 January 1970 and return the exit code
+    and the text written to stdout.
+    """
+    mock_datetime.now.return_value = datetime(1970, 1, 1)
+    with unittest.mock.patch('sys.stdout', new_callable=StringIO) as mock_stdout:
+        with unittest.mock.patch('sys.argv', ['test'] + argv):
+            ret_code = check_structural_metadata.main()
+    return ret_code, mock_stdout.getvalue()
+
+
+def copy_input_files(input_dir, source_dir='test/data/bad'):
+    """Copy the input files in source_dir to input_dir."""
+    for filename in check_structural_metadata.INPUT_FILES:
+        shutil.copy(os.path.join(source_dir, filename), input_dir)
+
+
+def fix_invalid_source(input_dir):
+    """
+    Fix the mappings of Invalid_Source in a copy of test/data/bad in input_dir, so that no
+    other classification is affected, and return the name of the changed file.
+    """
+    filename = os.path.join(input_dir, 'Category_Mapping.csv')
+    with open(filename) as infile:
+        mappings = infile.read()
+    with open(filename, 'w') as outfile:
+        outfile.write(mappings.replace('Invalid_Source,,A,1', 'Invalid_Source,,A,A')
+                      .replace('Invalid_Source,,A,2', 'Invalid_Source,,B,B')
+                      .replace('Invalid_Source,,3,3', 'Invalid_Source,,C,C'))
+    return filename
 
 
 class TestStructuralMetadataChecker(unittest.TestCase):
-    @unittest.mock.patch('sys.stdout', new_callable=StringIO)
-    @unittest.mock.patch('check_structural_metadata.datetime')
-    def test_no_issues(self, mock_datetime, mock_stdout):
+    def test_no_issues(self):
         self.maxDiff = 1000
-        mock_datetime.now.return_value = datetime(1970, 1, 1)
 
         expected_lines = """--------------------------------------------------------------------------------
 - check_structural_metadata.py v1.0.0 01/01/1970 00:00:00
@@ -24,6 +89,7 @@ class TestStructuralMetadataChecker(unittest.TestCase):
 - Read test/data/good/Classification.csv
 - Identify all classifications.
 - Check for duplicate Classification_Mnemonic values.
+- Check for cycles in Parent_Classification_Mnemonic values.
 --------------------------------------------------------------------------------
 
 
@@ -84,24 +150,31 @@ class TestStructuralMetadataChecker(unittest.TestCase):
 - Checking for consistent labels between Category.csv and Category_Mapping.csv
 --------------------------------------------------------------------------------
 
+
+--------------------------------------------------------------------------------
+- Validate the mappings of classifications derived from derived classifications
+- 
+- Mappings are composed along the Parent_Classification_Mnemonic values of each
+- classification back to its root classification. For every classification that
+- has a grandparent then:
+-   * Each category code of the root must map to a Target_Value
+-   * No category code of the root may map to more than one Target_Value
+--------------------------------------------------------------------------------
+
 --------------------------------------------------------------------------------
 PASS: No errors detected
 --------------------------------------------------------------------------------
 """.splitlines()
 
-        with unittest.mock.patch('sys.argv', ['test', '-i', 'test/data/good']):
-            ret_code = check_structural_metadata.main()
-            self.assertEqual(ret_code, 0)
-            output_lines = mock_stdout.getvalue().splitlines()
-            self.assertEqual(len(output_lines), len(expected_lines))
-            for idx, line in enumerate(output_lines):
-                self.assertEqual(line.strip(), expected_lines[idx].strip(), msg=f'on line {idx}')
-
-    @unittest.mock.patch('sys.stdout', new_callable=StringIO)
-    @unittest.mock.patch('check_structural_metadata.datetime')
-    def test_with_errors(self, mock_datetime, mock_stdout):
+        ret_code, output = run_main(['-i', 'test/data/good'])
+        self.assertEqual(ret_code, 0)
+        output_lines = output.splitlines()
+        self.assertEqual(len(output_lines), len(expected_lines))
+        for idx, line in enumerate(output_lines):
+            self.assertEqual(line.strip(), expected_lines[idx].strip(), msg=f'on line {idx}')
+
+    def test_with_errors(self):
         self.maxDiff = 1000
-        mock_datetime.now.return_value = datetime(1970, 1, 1)
 
         expected_lines = """--------------------------------------------------------------------------------
 - check_structural_metadata.py v1.0.0 01/01/1970 00:00:00
@@ -115,9 +188,12 @@ PASS: No errors detected
 - Read test/data/bad/Classification.csv
 - Identify all classifications.
 - Check for duplicate Classification_Mnemonic values.
+- Check for cycles in Parent_Classification_Mnemonic values.
 --------------------------------------------------------------------------------
 
 ERROR: Duplicate_Entry: Duplicate Classification_Mnemonic in Category.csv
+ERROR: Cycle_A: Parent_Classification_Mnemonic values form a cycle: Cycle_A -> Cycle_B -> Cycle_A
+ERROR: Cycle_B: Parent_Classification_Mnemonic values form a cycle: Cycle_B -> Cycle_A -> Cycle_B
 
 --------------------------------------------------------------------------------
 - Read test/data/bad/Category.csv
@@ -179,8 +255,11 @@ ERROR: Invalid_Source_Parent: different set of Category_Code values in Category.
 --------------------------------------------------------------------------------
 
 ERROR: Duplicate_Labels: multiple categories with the same External_Category_Label_English: ['En1']
+  - External_Category_Label_English: "En1" Category_Code values: ['1', '2']
 ERROR: Duplicate_Labels: multiple categories with the same Internal_Category_Label_English: ['En1']
-ERROR: Duplicate_Labels multiple categories with the same External_Category_Label_Welsh: ['Cy1']
+  - Internal_Category_Label_English: "En1" Category_Code values: ['1', '2']
+ERROR: Duplicate_Labels: multiple categories with the same External_Category_Label_Welsh: ['Cy1']
+  - External_Category_Label_Welsh: "Cy1" Category_Code values: ['1', '2']
 
 --------------------------------------------------------------------------------
 - Validate internal consistency of Source_Value entries for each
@@ -205,6 +284,10 @@ ERROR: Invalid_Source_Zeros: set of values for Source_Value do not match the set
 
 ERROR: Unknown_Parent:  Parent_Classification_Mnemonic is an unknown classification: Parent_Does_Not_Exist
 
+ERROR: Transitive_Child: set of values for Source_Value do not match the set of values for Target_Values for the Parent_Classification_Mnemonic: Transitive_Root
+  - Multiple entry for Source_Value:             ['3']
+  - No entry for Target_Value of parent:         ['4']
+
 --------------------------------------------------------------------------------
 - Checking for consistent labels between Category.csv and Category_Mapping.csv
 --------------------------------------------------------------------------------
@@ -220,25 +303,36 @@ ERROR: Different_Labels: has different labels specified in Category.csv and Cate
     - Category_Code: "2" External_Category_Label_Welsh: "Cy2" External_Mapping_Label_Welsh: "CyA"
     - Category_Code: "3" External_Category_Label_Welsh: "Cy3" External_Mapping_Label_Welsh: "CyB"
 
+
 --------------------------------------------------------------------------------
-FAIL: Errors detected in 15 classifications:
-['Different_Code_Target', 'Different_Code_Target_Zeros', 'Different_Codebook_Mnemonic', 'Different_Labels', 'Different_Source_Target', 'Different_Source_Target_Zeros', 'Duplicate_Codes', 'Duplicate_Entry', 'Duplicate_Labels', 'Invalid_Source', 'Invalid_Source_Parent', 'Invalid_Source_Zeros', 'Not_In_Category', 'Not_In_Classification', 'Unknown_Parent']
+- Validate the mappings of classifications derived from derived classifications
+- 
+- Mappings are composed along the Parent_Classification_Mnemonic values of each
+- classification back to its root classification. For every classification that
+- has a grandparent then:
+-   * Each category code of the root must map to a Target_Value
+-   * No category code of the root may map to more than one Target_Value
+--------------------------------------------------------------------------------
+
+ERROR: Transitive_Grandchild: mappings composed from the root classification do not map each code to a single Target_Value: Transitive_Root
+  - Root code does not map to a Target_Value:      ['4']
+  - Root code maps to multiple Target_Values:      ['3']
+
+--------------------------------------------------------------------------------
+FAIL: Errors detected in 19 classifications:
+['Cycle_A', 'Cycle_B', 'Different_Code_Target', 'Different_Code_Target_Zeros', 'Different_Codebook_Mnemonic', 'Different_Labels', 'Different_Source_Target', 'Different_Source_Target_Zeros', 'Duplicate_Codes', 'Duplicate_Entry', 'Duplicate_Labels', 'Invalid_Source', 'Invalid_Source_Parent', 'Invalid_Source_Zeros', 'Not_In_Category', 'Not_In_Classification', 'Transitive_Child', 'Transitive_Grandchild', 'Unknown_Parent']
 --------------------------------------------------------------------------------
 """.splitlines()
 
-        with unittest.mock.patch('sys.argv', ['test', '-i', 'test/data/bad']):
-            ret_code = check_structural_metadata.main()
-            self.assertEqual(ret_code, -1)
-            output_lines = mock_stdout.getvalue().splitlines()
-            self.assertEqual(len(output_lines), len(expected_lines))
-            for idx, line in enumerate(output_lines):
-                self.assertEqual(line.strip(), expected_lines[idx].strip())
-
-    @unittest.mock.patch('sys.stdout', new_callable=StringIO)
-    @unittest.mock.patch('check_structural_metadata.datetime')
-    def test_with_leading_zeros_ignored(self, mock_datetime, mock_stdout):
+        ret_code, output = run_main(['-i', 'test/data/bad'])
+        self.assertEqual(ret_code, -1)
+        output_lines = output.splitlines()
+        self.assertEqual(len(output_lines), len(expected_lines))
+        for idx, line in enumerate(output_lines):
+            self.assertEqual(line.strip(), expected_lines[idx].strip())
+
+    def test_with_leading_zeros_ignored(self):
         self.maxDiff = 1000
-        mock_datetime.now.return_value = datetime(1970, 1, 1)
 
         expected_lines = """--------------------------------------------------------------------------------
 - check_structural_metadata.py v1.0.0 01/01/1970 00:00:00
@@ -252,9 +346,12 @@ FAIL: Errors detected in 15 classifications:
 - Read test/data/bad/Classification.csv
 - Identify all classifications.
 - Check for duplicate Classification_Mnemonic values.
+- Check for cycles in Parent_Classification_Mnemonic values.
 --------------------------------------------------------------------------------
 
 ERROR: Duplicate_Entry: Duplicate Classification_Mnemonic in Category.csv
+ERROR: Cycle_A: Parent_Classification_Mnemonic values form a cycle: Cycle_A -> Cycle_B -> Cycle_A
+ERROR: Cycle_B: Parent_Classification_Mnemonic values form a cycle: Cycle_B -> Cycle_A -> Cycle_B
 
 --------------------------------------------------------------------------------
 - Read test/data/bad/Category.csv
@@ -314,8 +411,11 @@ ERROR: Invalid_Source_Parent: different set of Category_Code values in Category.
 --------------------------------------------------------------------------------
 
 ERROR: Duplicate_Labels: multiple categories with the same External_Category_Label_English: ['En1']
+  - External_Category_Label_English: "En1" Category_Code values: ['1', '2']
 ERROR: Duplicate_Labels: multiple categories with the same Internal_Category_Label_English: ['En1']
-ERROR: Duplicate_Labels multiple categories with the same External_Category_Label_Welsh: ['Cy1']
+  - Internal_Category_Label_English: "En1" Category_Code values: ['1', '2']
+ERROR: Duplicate_Labels: multiple categories with the same External_Category_Label_Welsh: ['Cy1']
+  - External_Category_Label_Welsh: "Cy1" Category_Code values: ['1', '2']
 
 --------------------------------------------------------------------------------
 - Validate internal consistency of Source_Value entries for each
@@ -339,6 +439,10 @@ ERROR: Invalid_Source_Zeros: set of values for Source_Value do not match the set
 
 ERROR: Unknown_Parent:  Parent_Classification_Mnemonic is an unknown classification: Parent_Does_Not_Exist
 
+ERROR: Transitive_Child: set of values for Source_Value do not match the set of values for Target_Values for the Parent_Classification_Mnemonic: Transitive_Root
+  - Multiple entry for Source_Value:             ['3']
+  - No entry for Target_Value of parent:         ['4']
+
 --------------------------------------------------------------------------------
 - Checking for consistent labels between Category.csv and Category_Mapping.csv
 --------------------------------------------------------------------------------
@@ -354,16 +458,778 @@ ERROR: Different_Labels: has different labels specified in Category.csv and Cate
     - Category_Code: "2" External_Category_Label_Welsh: "Cy2" External_Mapping_Label_Welsh: "CyA"
     - Category_Code: "3" External_Category_Label_Welsh: "Cy3" External_Mapping_Label_Welsh: "CyB"
 
+
 --------------------------------------------------------------------------------
-FAIL: Errors detected in 13 classifications:
-['Different_Code_Target', 'Different_Codebook_Mnemonic', 'Different_Labels', 'Different_Source_Target', 'Duplicate_Codes', 'Duplicate_Entry', 'Duplicate_Labels', 'Invalid_Source', 'Invalid_Source_Parent', 'Invalid_Source_Zeros', 'Not_In_Category', 'Not_In_Classification', 'Unknown_Parent']
+- Validate the mappings of classifications derived from derived classifications
+- 
+- Mappings are composed along the Parent_Classification_Mnemonic values of each
+- classification back to its root classification. For every classification that
+- has a grandparent then:
+-   * Each category code of the root must map to a Target_Value
+-   * No category code of the root may map to more than one Target_Value
+--------------------------------------------------------------------------------
+
+ERROR: Transitive_Grandchild: mappings composed from the root classification do not map each code to a single Target_Value: Transitive_Root
+  - Root code does not map to a Target_Value:      ['4']
+  - Root code maps to multiple Target_Values:      ['3']
+
+--------------------------------------------------------------------------------
+FAIL: Errors detected in 17 classifications:
+['Cycle_A', 'Cycle_B', 'Different_Code_Target', 'Different_Codebook_Mnemonic', 'Different_Labels', 'Different_Source_Target', 'Duplicate_Codes', 'Duplicate_Entry', 'Duplicate_Labels', 'Invalid_Source', 'Invalid_Source_Parent', 'Invalid_Source_Zeros', 'Not_In_Category', 'Not_In_Classification', 'Transitive_Child', 'Transitive_Grandchild', 'Unknown_Parent']
 --------------------------------------------------------------------------------
 """.splitlines()
 
-        with unittest.mock.patch('sys.argv', ['test', '-i', 'test/data/bad', '--zeros']):
-            ret_code = check_structural_metadata.main()
+        ret_code, output = run_main(['-i', 'test/data/bad', '--zeros'])
+        self.assertEqual(ret_code, -1)
+        output_lines = output.splitlines()
+        self.assertEqual(len(output_lines), len(expected_lines))
+        for idx, line in enumerate(output_lines):
+            self.assertEqual(line.strip(), expected_lines[idx].strip())
+
+
+class TestCodeRanges(unittest.TestCase):
+    def test_iterates_in_sorted_order(self):
+        codes = check_structural_metadata.CodeRanges.from_codes(
+            ['A', '007', '1', '10', '2', '11', '0', '12', '3', '02'])
+        self.assertEqual(list(codes), sorted(['A', '007', '1', '10', '2', '11', '0', '12', '3',
+                                              '02']))
+        self.assertEqual(len(codes), 10)
+
+    def test_matches_expanded_ranges(self):
+        for ignore_leading_zeros in [False, True]:
+            with unittest.mock.patch('sys.stdout', new_callable=StringIO):
+                checker = check_structural_metadata.Checker('test/data/good',
+                                                            ignore_leading_zeros, 10)
+            source_values = ['08>12', '0>3', '11', 'A', 'A', '-2>-1', '095>101', '99>100']
+            expanded = list()
+            ranges = list()
+            codes = list()
+            for source_value in source_values:
+                expanded.extend(checker.parse_range(source_value))
+                checker.parse_range_limits(checker.normalize(source_value), ranges, codes)
+            union, dupes = check_structural_metadata.CodeRanges.from_ranges(ranges, codes)
+            self.assertEqual(list(union), sorted(set(expanded)))
+            self.assertEqual(list(dupes), sorted({v for v in expanded if expanded.count(v) > 1}))
+
+            parent = {checker.normalize(str(v)) for v in range(0, 20)}
+            parent_codes = check_structural_metadata.CodeRanges.from_codes(parent)
+            self.assertEqual(checker.limited_sorted_list(union - parent_codes),
+                             checker.limited_sorted_list(set(expanded) - parent))
+            self.assertEqual(checker.limited_sorted_list(parent_codes - union),
+                             checker.limited_sorted_list(parent - set(expanded)))
+
+
+class TestCodeSet(unittest.TestCase):
+    def test_set_operations(self):
+        dictionary = check_structural_metadata.CodeDictionary()
+        codes = check_structural_metadata.CodeSet(dictionary)
+        other_codes = check_structural_metadata.CodeSet(dictionary)
+        for code in ['3', '1', 'A', '1', '20']:
+            codes.add(code)
+        for code in ['A', '20', '1', '3']:
+            other_codes.add(code)
+        self.assertEqual(len(codes), 4)
+        self.assertEqual(sorted(codes), ['1', '20', '3', 'A'])
+        self.assertEqual(codes, other_codes)
+
+        other_codes.add('999')
+        self.assertNotEqual(codes, other_codes)
+        self.assertFalse(codes - other_codes)
+        self.assertEqual(list(other_codes - codes), ['999'])
+        self.assertEqual(len(dictionary.codes), 5)
+
+    def test_bitsets_start_at_lowest_id(self):
+        dictionary = check_structural_metadata.CodeDictionary()
+        for code in range(1000):
+            dictionary.encode(str(code))
+        codes = check_structural_metadata.CodeSet(dictionary)
+        other_codes = check_structural_metadata.CodeSet(dictionary)
+        for code in ['990', '995', '999']:
+            codes.add(code)
+        for code in ['995', '996']:
+            other_codes.add(code)
+        self.assertEqual(codes.freeze().bit_length(), 10)
+        self.assertEqual(list(codes - other_codes), ['990', '999'])
+        self.assertEqual(list(other_codes - codes), ['996'])
+        self.assertEqual(codes - codes, check_structural_metadata.CodeSet(dictionary))
+
+        other_codes.add('990')
+        other_codes.add('999')
+        self.assertNotEqual(codes, other_codes)
+        codes.add('996')
+        self.assertEqual(codes, other_codes)
+
+    def test_partition_holds_only_its_codes(self):
+        checker = check_structural_metadata.Checker('test/data/bad', False, 10)
+        partition = checker.partition(['Different_Labels'])
+        self.assertLess(len(partition.code_dictionary.codes), len(checker.code_dictionary.codes))
+        self.assertEqual(list(partition.category_codes['Different_Labels']),
+                         list(checker.category_codes['Different_Labels']))
+
+
+class TestHierarchy(unittest.TestCase):
+    def test_hierarchy(self):
+        Classification = check_structural_metadata.Classification
+        classifications = {mnemonic: Classification(mnemonic, parent) for mnemonic, parent in [
+            ('Child', 'Root'), ('Grandchild', 'Child'), ('Root', ''), ('Orphan', 'Unknown'),
+            ('Cycle_A', 'Cycle_B'), ('Cycle_B', 'Cycle_A'), ('Cycle_Child', 'Cycle_A'),
+            ('Self', 'Self')]}
+        hierarchy = check_structural_metadata.Hierarchy(classifications)
+        self.assertEqual(hierarchy.depths, {'Root': 0, 'Orphan': 0, 'Child': 1,
+                                            'Grandchild': 2})
+        self.assertEqual(hierarchy.order[0:4], ['Root', 'Orphan', 'Child', 'Grandchild'])
+        self.assertEqual(sorted(hierarchy.order), sorted(classifications))
+        self.assertEqual(hierarchy.cycles, [['Cycle_A', 'Cycle_B'], ['Self']])
+        self.assertEqual(hierarchy.children['Root'], ['Child'])
+        self.assertEqual(hierarchy.parent('Root'), '')
+        self.assertEqual(hierarchy.ancestors('Grandchild'), ['Child', 'Root'])
+        self.assertEqual(hierarchy.ancestors('Cycle_Child'), ['Cycle_A', 'Cycle_B'])
+        self.assertEqual(hierarchy.ancestors('Self'), [])
+
+
+class TestParallelChecks(unittest.TestCase):
+    def test_jobs_match_serial_run(self):
+        for argv in [['-i', 'test/data/bad'], ['-i', 'test/data/bad', '--zeros'],
+                     ['-i', 'test/data/good']]:
+            self.assertEqual(run_main(argv + ['--jobs', '3']), run_main(argv))
+
+
+class TestResultCache(unittest.TestCase):
+    def test_cached_results_match_uncached_run(self):
+        with tempfile.TemporaryDirectory() as input_dir:
+            copy_input_files(input_dir)
+            expected = run_main(['-i', input_dir])
+            self.assertEqual(run_main(['-i', input_dir, '--cache']), expected)
+            self.assertTrue(os.path.exists(
+                os.path.join(input_dir, check_structural_metadata.CACHE_FILENAME)))
+
+            with unittest.mock.patch.object(check_structural_metadata.Checker,
+                                            'check_classifications',
+                                            autospec=True,
+                                            return_value=dict()) as mock_check:
+                self.assertEqual(run_main(['-i', input_dir, '--cache']), expected)
+                mock_check.assert_called_once()
+                self.assertEqual(mock_check.call_args[0][1], [])
+
+            # Fix the mappings of Invalid_Source so that only it is checked again.
+            filename = fix_invalid_source(input_dir)
+            expected = run_main(['-i', input_dir])
+            self.assertEqual(run_main(['-i', input_dir, '--cache']), expected)
+
+    def test_unauthenticated_cache_is_not_unpickled(self):
+        with tempfile.TemporaryDirectory() as input_dir:
+            marker = os.path.join(input_dir, 'unpickled')
+            # A pickle that creates marker when it is loaded, with a MAC under another key.
+            data = b'cos\nmkdir\n(V' + marker.encode() + b'\ntR.'
+            filename = os.path.join(input_dir, check_structural_metadata.CACHE_FILENAME)
+            with open(filename, 'wb') as outfile:
+                outfile.write(b''.join([bytes(check_structural_metadata.STATE_KEY_SIZE),
+                                        len(data).to_bytes(8, 'little'), data]))
+            self.assertEqual(check_structural_metadata.ResultCache(filename).entries, dict())
+            self.assertFalse(os.path.exists(marker))
+
+    def test_cached_results_with_jobs(self):
+        with tempfile.TemporaryDirectory() as input_dir:
+            copy_input_files(input_dir)
+            expected = run_main(['-i', input_dir])
+            for _ in range(2):
+                self.assertEqual(run_main(['-i', input_dir, '--cache', '--jobs', '2']),
+                                 expected)
+
+
+class TestBatch(unittest.TestCase):
+    def test_batch_matches_single_runs(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            copy_dir = os.path.join(temp_dir, 'copy')
+            shutil.copytree('test/data/bad', copy_dir)
+            manifest = os.path.join(temp_dir, 'manifest.txt')
+            with open(manifest, 'w') as outfile:
+                outfile.write('# Copy of test/data/bad\n\ncopy\nmissing\n')
+
+            input_dirs = ['test/data/good', 'test/data/bad', copy_dir]
+            for jobs in ['1', '2']:
+                ret_code, output = run_main(['-i', 'test/data/good', '-i', 'test/data/bad',
+                                             '--manifest', manifest, '-j', jobs])
+                self.assertEqual(ret_code, -1)
+                expected = ''
+                for input_dir in input_dirs:
+                    single = run_main(['-i', input_dir])[1]
+                    expected += single if not expected else single.split('\n', 7)[7]
+                summary = output[len(expected):].splitlines()
+                self.assertEqual(output[:len(expected)], expected)
+                self.assertEqual(summary[2:8], [
+                    '- Summary of 4 input directories',
+                    '--------------------------------------------------------------------------------',
+                    'PASS: test/data/good',
+                    'FAIL: test/data/bad: Errors detected in 19 classifications',
+                    f'FAIL: {copy_dir}: Errors detected in 19 classifications',
+                    f'ERROR: {os.path.join(temp_dir, "missing")}: could not read input files: '
+                    '[Errno 2] No such file or directory: '
+                    f'\'{os.path.join(temp_dir, "missing", "Classification.csv")}\'',
+                ])
+
+            # Identical input files are only checked once.
+            with unittest.mock.patch.object(check_structural_metadata, '_check_directory',
+                                            wraps=check_structural_metadata._check_directory
+                                            ) as mock_check:
+                run_main(['-i', 'test/data/bad', '-i', copy_dir])
+                self.assertEqual(mock_check.call_count, 1)
+
+            ret_code, jsonl = run_main(['-i', 'test/data/good', '-i', copy_dir,
+                                        '--format', 'jsonl'])
+            records = [json.loads(line) for line in jsonl.splitlines()]
+            self.assertEqual(records[0], {'input_dir': 'test/data/good', 'result': 'PASS',
+                                          'classifications_with_errors': []})
+            self.assertTrue(all(r['input_dir'] == copy_dir for r in records[1:-1]))
+            self.assertEqual([r['result'] for r in records[-1]['summary']], ['PASS', 'FAIL'])
+
+    def test_csv_reports_unreadable_input_dirs(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            missing = os.path.join(temp_dir, 'missing')
+            ret_code, output = run_main(['-i', 'test/data/good', '-i', missing,
+                                         '--format', 'csv'])
+            self.assertEqual(ret_code, -1)
+            rows = list(csv.reader(StringIO(output)))
+            self.assertEqual(rows[0][:2], ['input_dir', 'check'])
+            self.assertEqual(rows[1:], [[
+                missing, 'read_input_dir', '',
+                'could not read input files: [Errno 2] No such file or directory: '
+                f'\'{os.path.join(missing, "Classification.csv")}\'', '{}', '{}']])
+
+
+class TestStateKey(unittest.TestCase):
+    def test_key_is_created_once(self):
+        key = check_structural_metadata.state_key()
+        self.assertEqual(len(key), check_structural_metadata.STATE_KEY_SIZE)
+        self.assertEqual(check_structural_metadata.state_key(), key)
+        self.assertEqual(os.stat(check_structural_metadata.STATE_KEY_FILENAME).st_mode & 0o777,
+                         0o600)
+
+    def test_key_created_by_another_process_is_used(self):
+        with tempfile.TemporaryDirectory() as key_dir:
+            filename = os.path.join(key_dir, 'key')
+            other_key = bytes(range(check_structural_metadata.STATE_KEY_SIZE))
+            os_open = os.open
+
+            def create_other_key(*args):
+                # Another process creates its key after this one found that there was none.
+                with open(filename, 'wb') as outfile:
+                    outfile.write(other_key)
+                return os_open(*args)
+
+            with unittest.mock.patch('check_structural_metadata.STATE_KEY_FILENAME', filename), \
+                    unittest.mock.patch('os.open', side_effect=create_other_key):
+                self.assertEqual(check_structural_metadata.state_key(), other_key)
+
+    def test_unavailable_key_is_not_fatal(self):
+        with tempfile.TemporaryDirectory() as input_dir:
+            copy_input_files(input_dir)
+            expected = run_main(['-i', input_dir])
+            filename = os.path.join(input_dir, 'missing', 'key')
+            with unittest.mock.patch('check_structural_metadata.STATE_KEY_FILENAME', filename), \
+                    unittest.mock.patch('sys.stderr', new_callable=StringIO) as mock_stderr:
+                self.assertEqual(run_main(['-i', input_dir, '--snapshot', '--cache']),
+                                 expected)
+            self.assertEqual(mock_stderr.getvalue().splitlines(), [
+                f'WARNING: saving the snapshot skipped: [Errno 2] No such file or directory: '
+                f'\'{filename}\'',
+                f'WARNING: saving cached results skipped: [Errno 2] No such file or directory: '
+                f'\'{filename}\'',
+            ])
+            for state_filename in [check_structural_metadata.SNAPSHOT_FILENAME,
+                                   check_structural_metadata.CACHE_FILENAME]:
+                self.assertFalse(os.path.exists(os.path.join(input_dir, state_filename)))
+
+
+class TestSnapshot(unittest.TestCase):
+    def test_snapshot_matches_csv_files(self):
+        with tempfile.TemporaryDirectory() as input_dir:
+            copy_input_files(input_dir)
+            expected = run_main(['-i', input_dir])
+            self.assertEqual(run_main(['-i', input_dir, '--snapshot', '--cache']),
+                             expected)
+            self.assertTrue(os.path.exists(
+                os.path.join(input_dir, check_structural_metadata.SNAPSHOT_FILENAME)))
+
+            # The snapshot is used if the files are unchanged, even if modified.
+            filename = os.path.join(input_dir, 'Category_Mapping.csv')
+            os.utime(filename, (0, 0))
+            with unittest.mock.patch.object(check_structural_metadata.Checker,
+                                            'read_category_mappings') as mock_read:
+                self.assertEqual(run_main(['-i', input_dir, '--snapshot', '--cache']),
+                                 expected)
+                self.assertEqual(run_main(['-i', input_dir, '--snapshot']), expected)
+                mock_read.assert_not_called()
+
+            # Fix the mappings of Invalid_Source so that the snapshot is no longer used.
+            filename = fix_invalid_source(input_dir)
+            expected = run_main(['-i', input_dir])
+            self.assertEqual(run_main(['-i', input_dir, '--snapshot']), expected)
+
+    def test_unauthenticated_snapshot_is_not_unpickled(self):
+        with tempfile.TemporaryDirectory() as input_dir:
+            copy_input_files(input_dir)
+            expected = run_main(['-i', input_dir])
+            marker = os.path.join(input_dir, 'unpickled')
+            # A pickle that creates marker when it is loaded, with a MAC under another key.
+            data = b'cos\nmkdir\n(V' + marker.encode() + b'\ntR.'
+            with open(os.path.join(input_dir, check_structural_metadata.SNAPSHOT_FILENAME),
+                      'wb') as outfile:
+                outfile.write(b''.join([bytes(check_structural_metadata.STATE_KEY_SIZE),
+                                        len(data).to_bytes(8, 'little'), data]))
+            self.assertEqual(run_main(['-i', input_dir, '--snapshot']), expected)
+            self.assertFalse(os.path.exists(marker))
+
+
+class TestReportFormats(unittest.TestCase):
+    def test_jsonl_and_csv_match_text(self):
+        ret_code, text = run_main(['-i', 'test/data/bad'])
+        error_lines = [line for line in text.splitlines() if line.startswith('ERROR: ')]
+
+        jsonl_ret_code, jsonl = run_main(['-i', 'test/data/bad', '--format', 'jsonl'])
+        records = [json.loads(line) for line in jsonl.splitlines()]
+        self.assertEqual(jsonl_ret_code, ret_code)
+        self.assertEqual([f'ERROR: {r["classification_mnemonic"]}: {r["message"]}'
+                          for r in records[:-1]], error_lines)
+        self.assertEqual(records[-1]['result'], 'FAIL')
+        self.assertIn('Invalid_Source', records[-1]['classifications_with_errors'])
+        source_values = [r for r in records if r.get('check') == 'source_values' and
+                         r['classification_mnemonic'] == 'Invalid_Source']
+        self.assertEqual(len(source_values), 1)
+        self.assertIn('unknown_source_values', source_values[0]['codes'])
+
+        csv_ret_code, csv_output = run_main(['-i', 'test/data/bad', '--format', 'csv'])
+        rows = list(csv.DictReader(StringIO(csv_output)))
+        self.assertEqual(csv_ret_code, ret_code)
+        self.assertEqual([{key: row[key] for key in ['check', 'classification_mnemonic',
+                                                     'message']} for row in rows],
+                         [{key: r[key] for key in ['check', 'classification_mnemonic',
+                                                   'message']} for r in records[:-1]])
+
+        ret_code, jsonl = run_main(['-i', 'test/data/good', '--format', 'jsonl'])
+        self.assertEqual(ret_code, 0)
+        self.assertEqual([json.loads(line) for line in jsonl.splitlines()],
+                         [{'result': 'PASS', 'classifications_with_errors': []}])
+
+
+class TestValidate(unittest.TestCase):
+    def test_validate_matches_report(self):
+        _, output = run_main(['-i', 'test/data/bad', '-f', 'jsonl'])
+        records = [json.loads(line) for line in output.splitlines()]
+
+        with unittest.mock.patch('sys.stdout', new_callable=StringIO) as mock_stdout:
+            result = check_structural_metadata.validate('test/data/bad')
+        self.assertEqual(mock_stdout.getvalue(), '')
+        self.assertFalse(result.passed)
+        self.assertEqual([finding.to_dict() for finding in result.findings], records[:-1])
+        self.assertEqual(result.classifications_with_errors,
+                         records[-1]['classifications_with_errors'])
+
+        # Sources may be open text or binary files, or rows held in memory.
+        paths = [os.path.join('test/data/bad', filename)
+                 for filename in check_structural_metadata.INPUT_FILES]
+        with open(paths[0]) as classifications, open(paths[1], 'rb') as categories, \
+                open(paths[2], newline='') as mappings:
+            sourced = check_structural_metadata.validate(
+                classifications=classifications, categories=categories,
+                category_mappings=list(csv.DictReader(mappings)))
+            self.assertFalse(categories.closed)
+        self.assertEqual(sourced.to_dict(), result.to_dict())
+
+        result = check_structural_metadata.validate('test/data/good',
+                                                    checks=['unique_labels'])
+        self.assertTrue(result.passed)
+        self.assertEqual(result.findings, [])
+        with self.assertRaises(ValueError):
+            check_structural_metadata.validate('test/data/good', checks=['unknown'])
+
+
+class TestEarlyExit(unittest.TestCase):
+    def test_findings_are_subset_of_full_run(self):
+        full = [finding.to_dict() for finding
+                in check_structural_metadata.validate('test/data/bad').findings]
+        for max_errors in range(1, len(full) + 2):
+            findings = [finding.to_dict() for finding in check_structural_metadata.validate(
+                'test/data/bad', max_errors=max_errors).findings]
+            self.assertEqual(len(findings), min(max_errors, len(full)))
+            self.assertTrue(all(finding in full for finding in findings))
+
+        checks = ['source_values', 'unique_labels']
+        findings = [finding.to_dict() for finding in check_structural_metadata.validate(
+            'test/data/bad', checks=checks).findings]
+        self.assertEqual(findings, [finding for finding in full
+                                    if finding['check'] in checks or
+                                    finding['check'].startswith('read_')])
+
+    def test_fail_fast(self):
+        for argv in [['--fail-fast'], ['--max-errors', '10', '--jobs', '2']]:
+            ret_code, output = run_main(['-i', 'test/data/bad'] + argv)
             self.assertEqual(ret_code, -1)
-            output_lines = mock_stdout.getvalue().splitlines()
-            self.assertEqual(len(output_lines), len(expected_lines))
-            for idx, line in enumerate(output_lines):
-                self.assertEqual(line.strip(), expected_lines[idx].strip())
+            lines = output.splitlines()
+            self.assertEqual(len([line for line in lines if line.startswith('ERROR: ')]),
+                             int(argv[1]) if len(argv) > 1 else 1)
+            self.assertIn('- errors. Run without --fail-fast or --max-errors for the full report.',
+                          lines)
+
+        ret_code, output = run_main(['-i', 'test/data/good', '--fail-fast', '--checks',
+                                     'unique_labels'])
+        self.assertEqual(ret_code, 0)
+        self.assertNotIn('Stopped', output)
+
+    def test_stopped_only_when_cut_short(self):
+        num_findings = len(check_structural_metadata.validate('test/data/bad').findings)
+        for jobs in [1, 2]:
+            for max_errors in range(1, num_findings + 2):
+                checker = check_structural_metadata.Checker('test/data/bad', False, 10,
+                                                            max_findings=max_errors)
+                checker.run_checks(jobs=jobs)
+                self.assertEqual(checker.stopped, max_errors < num_findings)
+
+        _, output = run_main(['-i', 'test/data/bad', '--max-errors', str(num_findings)])
+        self.assertNotIn('Stopped', output)
+        _, output = run_main(['-i', 'test/data/bad', '--max-errors', str(num_findings - 1)])
+        self.assertIn(f'- Stopped after {num_findings - 1} errors. Other classifications may '
+                      'also have', output.splitlines())
+
+
+class TestSample(unittest.TestCase):
+    def test_findings_are_subset_of_full_run(self):
+        with tempfile.TemporaryDirectory() as input_dir:
+            generate_metadata.generate(input_dir, num_classifications=20, depth=3,
+                                       num_categories=30, error_fraction=0.5, seed=2)
+            full = check_structural_metadata.Checker(input_dir, False, 10)
+            full.run_checks()
+            full_findings = [finding.to_dict() for finding in full.report.findings()]
+            previous = set()
+            for size in [1, 0.1, 0.5, 60]:
+                sample = check_structural_metadata.Sample(size, seed=3)
+                checker = check_structural_metadata.Checker(input_dir, False, 10,
+                                                            sample=sample)
+                checker.run_checks()
+                findings = [finding.to_dict() for finding in checker.report.findings()]
+                self.assertTrue(all(finding in full_findings for finding in findings))
+                # Findings from reading the files may also be reported for ancestors.
+                self.assertEqual([finding for finding in findings
+                                  if finding['classification_mnemonic'] in checker.sampled],
+                                 [finding for finding in full_findings
+                                  if finding['classification_mnemonic'] in checker.sampled])
+                self.assertTrue(previous <= checker.sampled)
+                previous = checker.sampled
+                self.assertEqual(checker.report.coverage['sampled_classifications'],
+                                 {1: 1, 0.1: 6, 0.5: 30, 60: 60}[size])
+                self.assertEqual(checker.report.coverage['classifications'], 60)
+                if size != 60:
+                    # Only the sampled classifications and their ancestors are kept.
+                    self.assertLess(len(checker.category_mappings), 60)
+
+    def test_changed_classifications_are_sampled_first(self):
+        with tempfile.TemporaryDirectory() as input_dir:
+            generate_metadata.generate(input_dir, num_classifications=20, depth=3,
+                                       num_categories=30, seed=2)
+            cache = check_structural_metadata.ResultCache(None)
+            check_structural_metadata.Checker(input_dir, False, 10,
+                                              hash_content=True).run_checks(cache=cache)
+            cache.save()
+
+            filename = os.path.join(input_dir, 'Category.csv')
+            with open(filename, newline='') as infile:
+                rows = list(csv.reader(infile))
+            with open(filename, 'w', newline='') as outfile:
+                csv.writer(outfile).writerows(rows + [['ROOT_7', 'NEW', 'a', 'b', 'c']])
+
+            sample = check_structural_metadata.Sample(1, seed=3)
+            checker = check_structural_metadata.Checker(input_dir, False, 10,
+                                                        hash_content=True, sample=sample)
+            checker.run_checks(cache=cache)
+            self.assertEqual(checker.sampled, {'ROOT_7'})
+            self.assertEqual(checker.classifications_with_errs, {'ROOT_7'})
+            self.assertEqual(checker.report.coverage['changed_classifications'], 1)
+
+    def test_sample_option(self):
+        _, output = run_main(['-i', 'test/data/bad', '--sample', '0.5', '--seed', '1',
+                              '--format', 'jsonl'])
+        summary = json.loads(output.splitlines()[-1])
+        coverage = summary['coverage']
+        self.assertEqual(coverage['seed'], 1)
+        self.assertEqual(coverage['sampled_classifications'],
+                         -(-coverage['classifications'] // 2))
+
+    def test_sample_size(self):
+        sample_size = check_structural_metadata.sample_size
+        self.assertEqual(sample_size('1'), 1)
+        self.assertIsInstance(sample_size('1'), int)
+        self.assertEqual(sample_size('1.0'), 1.0)
+        self.assertIsInstance(sample_size('1.0'), float)
+        for value in ['0', '-1', '2.5', 'abc']:
+            with self.assertRaises(argparse.ArgumentTypeError):
+                sample_size(value)
+
+        _, output = run_main(['-i', 'test/data/bad', '--sample', '1.0', '--format', 'jsonl'])
+        coverage = json.loads(output.splitlines()[-1])['coverage']
+        self.assertEqual(coverage['sampled_classifications'], coverage['classifications'])
+
+
+class TestCompressedInput(unittest.TestCase):
+    def test_compressed_files_match_csv_files(self):
+        expected = check_structural_metadata.validate('test/data/bad').to_dict()
+        with tempfile.TemporaryDirectory() as temp_dir:
+            compressed_dir = os.path.join(temp_dir, 'compressed')
+            os.mkdir(compressed_dir)
+            archive = os.path.join(temp_dir, 'metadata.zip')
+            with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as outfile:
+                for filename, opener in zip(check_structural_metadata.INPUT_FILES,
+                                            [gzip.open, bz2.open, lzma.open]):
+                    path = os.path.join('test/data/bad', filename)
+                    outfile.write(path, f'metadata/{filename}')
+                    suffix = {gzip.open: '.gz', bz2.open: '.bz2', lzma.open: '.xz'}[opener]
+                    with open(path, 'rb') as infile, \
+                            opener(os.path.join(compressed_dir, filename + suffix), 'wb') as out:
+                        shutil.copyfileobj(infile, out)
+
+            self.assertEqual(check_structural_metadata.validate(compressed_dir).to_dict(),
+                             expected)
+            self.assertEqual(check_structural_metadata.validate(archive).to_dict(), expected)
+
+            # Truncated files are reported as errors reading the input files.
+            filename = os.path.join(compressed_dir, 'Category.csv.bz2')
+            with open(filename, 'rb') as infile:
+                content = infile.read()
+            with open(filename, 'wb') as outfile:
+                outfile.write(content[:len(content) // 2])
+            with self.assertRaises(OSError):
+                check_structural_metadata.validate(compressed_dir)
+
+
+class TestValidationServer(unittest.TestCase):
+    def setUp(self):
+        self.service = validation_server.ValidationService('test/data/bad')
+        self.server = validation_server.make_server(self.service, port=0)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def post(self, delta):
+        request = urllib.request.Request(f'{self.url}/check', json.dumps(delta).encode(),
+                                         {'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request) as response:
+            return json.loads(response.read().decode())
+
+    def full_run(self, delta, checked):
+        """Return the findings of a full run for checked with the delta applied to files."""
+        with tempfile.TemporaryDirectory() as input_dir:
+            for filename, key in zip(check_structural_metadata.INPUT_FILES,
+                                     validation_server.DELTA_KEYS):
+                with open(os.path.join('test/data/bad', filename), newline='') as infile:
+                    reader = csv.DictReader(infile)
+                    replaced = {row['Classification_Mnemonic'] for row in delta.get(key, [])}
+                    rows = [row for row in reader
+                            if row['Classification_Mnemonic'] not in replaced]
+                with open(os.path.join(input_dir, filename), 'w', newline='') as outfile:
+                    writer = csv.DictWriter(outfile, reader.fieldnames)
+                    writer.writeheader()
+                    writer.writerows(rows + delta.get(key, []))
+            result = check_structural_metadata.validate(input_dir)
+        return sorted([finding.to_dict() for finding in result.findings
+                       if finding.classification_mnemonic in checked], key=json.dumps)
+
+    def test_delta_matches_full_run(self):
+        with urllib.request.urlopen(f'{self.url}/health') as response:
+            self.assertEqual(json.loads(response.read().decode())['status'], 'ok')
+
+        mappings = [{'Classification_Mnemonic': 'Invalid_Source_Parent',
+                     'Codebook_Mnemonic': '', 'Source_Value': code, 'Target_Value': code,
+                     'Internal_Mapping_Label_English': f'En{code}',
+                     'External_Mapping_Label_English': f'En{code}',
+                     'External_Mapping_Label_Welsh': f'Cy{code}'} for code in '123']
+        reparented = [{'Classification_Mnemonic': 'Transitive_Child',
+                       'Parent_Classification_Mnemonic': ''}]
+        for delta, checked in [
+                ({'category_mappings': mappings}, ['Invalid_Source', 'Invalid_Source_Parent']),
+                ({'classifications': reparented}, ['Transitive_Child', 'Transitive_Grandchild'])]:
+            response = self.post(delta)
+            self.assertEqual(response['checked_classifications'], checked)
+            self.assertEqual(sorted(response['findings'], key=json.dumps),
+                             self.full_run(delta, checked))
+
+        for delta in [{'categories': [{'Classification_Mnemonic': 1}]},
+                      {'categories': [{'Classification_Mnemonic': 'X'}]},
+                      {'category_mappings': [{column: value for column, value
+                                              in mappings[0].items()
+                                              if column != 'Target_Value'}]}]:
+            with self.assertRaises(urllib.error.HTTPError) as context:
+                self.post(delta)
+            self.assertEqual(context.exception.code, 400)
+            context.exception.close()
+
+    def test_reference_checker_is_not_modified(self):
+        checker = self.service.checker
+        num_codes = len(checker.code_dictionary.codes)
+        num_normalized_codes = len(checker.normalized_codes)
+        mappings = [{'Classification_Mnemonic': 'Invalid_Source_Parent',
+                     'Codebook_Mnemonic': '', 'Source_Value': f'New{code}',
+                     'Target_Value': f'New{code}',
+                     'Internal_Mapping_Label_English': f'En{code}',
+                     'External_Mapping_Label_English': f'En{code}',
+                     'External_Mapping_Label_Welsh': f'Cy{code}'} for code in range(5)]
+        delta = {'category_mappings': mappings}
+        checked = ['Invalid_Source', 'Invalid_Source_Parent']
+        for _ in range(2):
+            response = self.post(delta)
+            self.assertEqual(sorted(response['findings'], key=json.dumps),
+                             self.full_run(delta, checked))
+            self.assertEqual(len(checker.code_dictionary.codes), num_codes)
+            self.assertEqual(len(checker.normalized_codes), num_normalized_codes)
+
+
+class TestGenerateMetadata(unittest.TestCase):
+    def test_injected_errors_are_detected(self):
+        for ignore_leading_zeros in [False, True]:
+            for error_fraction in [0.0, 0.3]:
+                with tempfile.TemporaryDirectory() as input_dir:
+                    dataset = generate_metadata.generate(
+                        input_dir, num_classifications=20, depth=3, num_categories=30,
+                        zero_padded_fraction=0.5, error_fraction=error_fraction, seed=1)
+                    with unittest.mock.patch('sys.stdout', new_callable=StringIO):
+                        checker = check_structural_metadata.Checker(
+                            input_dir, ignore_leading_zeros, 10)
+                        checker.run_checks()
+                    self.assertEqual(dataset['classifications'], 60)
+                    self.assertEqual(checker.classifications_with_errs,
+                                     set(dataset['errors']))
+
+
+class TestProfile(unittest.TestCase):
+    def test_profile_records_phases(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            profile_filename = os.path.join(output_dir, 'profile.json')
+            with unittest.mock.patch('sys.stdout', new_callable=StringIO) as mock_stdout, \
+                    unittest.mock.patch('sys.stderr', new_callable=StringIO) as mock_stderr:
+                with unittest.mock.patch('sys.argv', ['test', '-i', 'test/data/bad',
+                                                      '--profile', profile_filename]):
+                    check_structural_metadata.main()
+            with open(profile_filename) as infile:
+                phases = {phase['phase']: phase for phase in json.load(infile)['phases']}
+
+        self.assertIn('FAIL: Errors detected', mock_stdout.getvalue())
+        self.assertIn('read Category_Mapping.csv', mock_stderr.getvalue())
+        self.assertEqual(phases['read Classification.csv']['rows_read'], 21)
+        self.assertEqual(phases['read Category.csv']['rows_read'], 45)
+        self.assertEqual(phases['read Category_Mapping.csv']['rows_read'], 43)
+        for name in ['run checks', 'render report'] + [
+                f'  check_{check.name}' for check in check_structural_metadata.CHECKS]:
+            self.assertIn(name, phases)
+
+
+@unittest.skipIf(check_structural_metadata.pyarrow is None, 'pyarrow is not installed')
+class TestPyarrowReader(unittest.TestCase):
+    def test_records_match_csv_reader(self):
+        for input_dir in ['test/data/bad', 'test/data/good']:
+            for filename, record_type in [
+                    ('Classification.csv', check_structural_metadata.Classification),
+                    ('Category.csv', check_structural_metadata.Category),
+                    ('Category_Mapping.csv', check_structural_metadata.CategoryMapping)]:
+                filename = os.path.join(input_dir, filename)
+                self.assertEqual(
+                    list(check_structural_metadata.read_records_pyarrow(filename,
+                                                                        record_type)),
+                    list(check_structural_metadata.read_records(filename, record_type)))
+
+    def test_falls_back_to_csv_reader_for_short_rows(self):
+        with tempfile.TemporaryDirectory() as input_dir:
+            filename = os.path.join(input_dir, 'Classification.csv')
+            with open(filename, 'w') as outfile:
+                outfile.write('Classification_Mnemonic,Parent_Classification_Mnemonic\n'
+                              'A,\nB\n\nC,A\n')
+            self.assertEqual(
+                list(check_structural_metadata.read_records_pyarrow(
+                    filename, check_structural_metadata.Classification)),
+                [check_structural_metadata.Classification('A', ''),
+                 check_structural_metadata.Classification('B', None),
+                 check_structural_metadata.Classification('C', 'A')])
+
+    def test_default_reader_matches_csv_reader(self):
+        with unittest.mock.patch('locale.getpreferredencoding', return_value='UTF-8'):
+            self.assertIs(check_structural_metadata.get_reader('auto'),
+                          check_structural_metadata.read_records_pyarrow)
+        for input_dir in ['test/data/bad', 'test/data/good']:
+            self.assertEqual(run_main(['-i', input_dir]),
+                             run_main(['-i', input_dir, '--reader', 'csv']))
+
+
+class TestReload(unittest.TestCase):
+    def render(self, checker):
+        output = StringIO()
+        check_structural_metadata.TextRenderer(
+            check_structural_metadata.BufferedWriter(output)).render(
+                checker.report, checker.classifications_with_errs)
+        return output.getvalue().replace(checker.input_dir, 'input_dir')
+
+    def test_reload_changed_files(self):
+        with tempfile.TemporaryDirectory() as input_dir:
+            copy_input_files(input_dir)
+            checker = check_structural_metadata.Checker(input_dir, False, 10, hash_content=True)
+            cache = check_structural_metadata.ResultCache(None)
+            checker.run_checks(cache=cache)
+            cache.save()
+            self.assertEqual(checker.reload(), [])
+
+            # Fix the mappings of Invalid_Source so that only it is checked again.
+            filename = fix_invalid_source(input_dir)
+            stat = os.stat(filename)
+            os.utime(filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+            with unittest.mock.patch.object(
+                    check_structural_metadata.Checker, 'check_classifications', autospec=True,
+                    side_effect=check_structural_metadata.Checker.check_classifications) \
+                    as mock_check:
+                self.assertEqual(checker.reload(), ['Category_Mapping.csv'])
+                checker.run_checks(cache=cache)
+                self.assertEqual(mock_check.call_args[0][1], ['Invalid_Source'])
+
+            expected = check_structural_metadata.Checker(input_dir, False, 10)
+            expected.run_checks()
+            self.assertEqual(self.render(checker), self.render(expected))
+            self.assertNotIn('Invalid_Source', checker.classifications_with_errs)
+
+    def test_watch_recovers_from_unreadable_compressed_file(self):
+        with tempfile.TemporaryDirectory() as input_dir:
+            for filename in check_structural_metadata.INPUT_FILES:
+                with open(os.path.join('test/data/bad', filename), 'rb') as infile, \
+                        gzip.open(os.path.join(input_dir, filename + '.gz'), 'wb') as outfile:
+                    shutil.copyfileobj(infile, outfile)
+            filename = os.path.join(input_dir, 'Category.csv.gz')
+            with open(filename, 'rb') as infile:
+                content = infile.read()
+
+            def write(data, seconds):
+                with open(filename, 'wb') as outfile:
+                    outfile.write(data)
+                stat = os.stat(filename)
+                os.utime(filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + seconds * 10**9))
+
+            # Each sleep of watch truncates, then restores the file, and then stops watching.
+            actions = iter([lambda: write(content[:len(content) // 2], 1),
+                            lambda: write(content, 2)])
+
+            def sleep(seconds):
+                action = next(actions, None)
+                if action is None:
+                    raise KeyboardInterrupt()
+                action()
+
+            checker = check_structural_metadata.Checker(input_dir, False, 10, hash_content=True)
+            cache = check_structural_metadata.ResultCache(None)
+            checker.run_checks(cache=cache)
+            cache.save()
+            renderer = unittest.mock.Mock()
+            args = argparse.Namespace(input_dir=input_dir, interval=0, checks=None, jobs=1)
+            with unittest.mock.patch('time.sleep', side_effect=sleep), \
+                    unittest.mock.patch('sys.stderr', new_callable=StringIO):
+                check_structural_metadata.watch(args, checker, cache, renderer)
+            renderer.render.assert_called_once()
+            self.assertEqual(checker.changed_files(), [])
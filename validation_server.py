@@ -0,0 +1,219 @@
+"""
+Local HTTP service that checks changes to structural metadata against reference data.
+
+The reference Classification.csv, Category.csv and Category_Mapping.csv files are read once
+from an input directory and held in memory. Each request posts a delta of new or changed
+rows as JSON, and only the classifications in the delta and their descendants are checked
+against the reference data, so that a response does not wait for the files to be read.
+
+Requests:
+
+- GET /health returns the number of reference classifications.
+- POST /check with a JSON object with any of the keys classifications, categories and
+  category_mappings, each a list of rows as objects keyed by column name. The rows of each
+  classification in a file replace its rows in the reference data for that file, and its
+  reference rows are kept in the files where the delta has none. Returns the result of
+  validate as JSON, with the list of classifications that were checked.
+
+The reference data is not modified by requests. The rows of the reference files are held
+in memory as well as the data used by the checks, so the service uses more memory than a
+single run of check_structural_metadata.py on the same files.
+"""
+import sys
+import csv
+import json
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from argparse import ArgumentParser
+
+from check_structural_metadata import (Checker, Classification, Category, CategoryMapping,
+                                       Report, ValidationResult, INPUT_FILES, READERS,
+                                       get_reader, input_source, read_source)
+
+
+# Keys of a delta, holding the rows of Classification.csv, Category.csv and
+# Category_Mapping.csv respectively.
+DELTA_KEYS = ['classifications', 'categories', 'category_mappings']
+RECORD_TYPES = [Classification, Category, CategoryMapping]
+
+
+def is_row(row):
+    """Return whether a row of a delta is an object with string values."""
+    return isinstance(row, dict) and all(isinstance(value, str) for value in row.values())
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    """HTTPServer handling each request in a new thread."""
+    daemon_threads = True
+
+
+class ValidationService:
+    """Reference structural metadata held in memory and checked against deltas."""
+    def __init__(self, input_dir, ignore_leading_zeros=False, max_elements=10, reader='auto'):
+        """
+        Initialise ValidationService with the reference data in input_dir.
+
+        Each file is read once, and its rows are kept in memory in addition to the data held
+        by the Checker.
+        """
+        read_file = get_reader(reader)
+        rows = [list(read_source(input_source(input_dir, filename), record_type, read_file))
+                for filename, record_type in zip(INPUT_FILES, RECORD_TYPES)]
+        self.checker = Checker(input_dir, ignore_leading_zeros, max_elements, reader=reader,
+                               sources=dict(zip(INPUT_FILES, rows)))
+        # A delta replaces classifications as a whole, so the reference rows of each
+        # classification are kept for the files in which a delta does not change it.
+        self.reference_rows = list()
+        for file_rows in rows:
+            classification_rows = defaultdict(list)
+            for row in file_rows:
+                classification_rows[row.Classification_Mnemonic].append(row)
+            self.reference_rows.append(classification_rows)
+
+    def check(self, delta):
+        """
+        Check a delta against the reference data.
+
+        delta is a dict with any of the keys in DELTA_KEYS, each a list of rows as dicts.
+        Returns a ValidationResult and the sorted list of the classifications checked.
+        """
+        unknown = set(delta) - set(DELTA_KEYS)
+        if unknown:
+            raise ValueError(f'unknown keys in delta: {", ".join(sorted(unknown))}')
+        rows = [delta.get(key, []) for key in DELTA_KEYS]
+        if not all(isinstance(file_rows, list) and all(map(is_row, file_rows))
+                   for file_rows in rows):
+            raise ValueError('delta rows must be lists of objects with string values')
+        for key, file_rows, record_type in zip(DELTA_KEYS, rows, RECORD_TYPES):
+            for row in file_rows:
+                missing = [column for column in record_type._fields if column not in row]
+                if row and missing:
+                    raise ValueError(f'rows of {key} are missing columns: {", ".join(missing)}')
+
+        changed = [{row.get('Classification_Mnemonic', '') for row in file_rows}
+                   for file_rows in rows]
+        replaced = set().union(*changed) - {''}
+        for idx, file_rows in enumerate(self.reference_rows):
+            rows[idx] = rows[idx] + [row for classification_mnemonic
+                                     in sorted(replaced - changed[idx])
+                                     for row in file_rows.get(classification_mnemonic, [])]
+
+        report = Report()
+        # The reference Checker is not modified, so deltas can be checked concurrently.
+        delta_checker, affected = self.checker.apply_delta(*rows, report=report)
+        partition = delta_checker.partition(sorted(affected), report)
+        partition.run_checks(classification_mnemonics=affected)
+
+        findings = report.findings()
+        classifications_with_errors = sorted({finding.classification_mnemonic
+                                              for finding in findings})
+        return ValidationResult(findings, classifications_with_errors), sorted(affected)
+
+
+class ValidationRequestHandler(BaseHTTPRequestHandler):
+    """Handle requests to the ValidationService of the server."""
+    def do_GET(self):
+        """Report the health of the service."""
+        if self.path != '/health':
+            self.send_json(404, {'error': f'unknown path: {self.path}'})
+            return
+        self.send_json(200, {'status': 'ok',
+                             'classifications': len(self.server.service.checker.classifications)})
+
+    def do_POST(self):
+        """Check a delta."""
+        if self.path != '/check':
+            self.send_json(404, {'error': f'unknown path: {self.path}'})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            delta = json.loads(self.rfile.read(length).decode('utf-8'))
+            if not isinstance(delta, dict):
+                raise ValueError('delta must be a JSON object')
+            result, checked = self.server.service.check(delta)
+        except (ValueError, KeyError, csv.Error) as error:
+            self.send_json(400, {'error': str(error)})
+            return
+        response = result.to_dict()
+        response['checked_classifications'] = checked
+        self.send_json(200, response)
+
+    def send_json(self, status, body):
+        """Send a JSON response."""
+        content = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        """Log requests only if the server is verbose."""
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def make_server(service, host='127.0.0.1', port=8000, verbose=False):
+    """Return a ThreadingHTTPServer serving requests to service."""
+    server = ThreadingHTTPServer((host, port), ValidationRequestHandler)
+    server.service = service
+    server.verbose = verbose
+    return server
+
+
+def main():
+    """Run the validation service."""
+    parser = ArgumentParser(description='Check changes to structural metadata against '
+                                        'reference data held in memory')
+
+    parser.add_argument('-i', '--input-dir',
+                        type=str,
+                        required=True,
+                        help='Input directory containing the reference CSV files')
+
+    parser.add_argument('--zeros',
+                        action='store_true',
+                        help='Ignore leading zeros')
+
+    parser.add_argument('-m', '--max-elements',
+                        type=int,
+                        default=10,
+                        help='Maximum number of elements to output in length limited lists')
+
+    parser.add_argument('--reader',
+                        choices=['auto'] + sorted(READERS),
+                        default='auto',
+                        help='Library used to read the CSV files')
+
+    parser.add_argument('--host',
+                        type=str,
+                        default='127.0.0.1',
+                        help='Address to listen on')
+
+    parser.add_argument('-p', '--port',
+                        type=int,
+                        default=8000,
+                        help='Port to listen on')
+
+    parser.add_argument('-v', '--verbose',
+                        action='store_true',
+                        help='Log each request to stderr')
+
+    args = parser.parse_args()
+
+    service = ValidationService(args.input_dir, args.zeros, args.max_elements, args.reader)
+    server = make_server(service, args.host, args.port, args.verbose)
+    print(f'Serving {len(service.checker.classifications)} reference classifications from '
+          f'{args.input_dir} on http://{args.host}:{server.server_address[1]}', file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())